@@ -0,0 +1,396 @@
+"""
+artifact_cache.py
+
+Shareable second-tier cache for the expensive build steps (nbconvert, the pandoc reader, LaTeX), so
+CI jobs and fresh clones reuse artifacts that another machine already built.
+- Artifacts are addressed by a key hashed from the step, the tool versions and the input bytes
+  (artifact_key()), so a lookup costs no more than hashing the inputs.
+- Local tier: _build/artifacts/objects/ab/<key>, consulted after each step's own cache (_build/ast,
+  _build/print, _build/pdf/latex) misses.
+- Optional remote tier: a shared directory (a network mount or a CI cache path) or an HTTP server that
+  answers GET/PUT/HEAD on <url>/<key> (uses requests). Remote hits are copied into the local tier and
+  new artifacts are uploaded once their step succeeded. Remote errors only warn; after
+  MAX_REMOTE_ERRORS the remote is ignored for the rest of the run.
+- The remote comes from build.py --artifact-cache, the BUILD_ARTIFACT_CACHE environment variable or
+  build.artifact_cache in _content.yml (a directory path or an http(s) URL), in that order.
+- Outputs made of several files (nbconvert's Markdown plus its <name>_files/ images) are stored as one
+  tar bundle.
+- The local tier can be exported to and imported from a tarball, and pushed to or pulled from the remote.
+
+Usage:
+    from artifact_cache import get_artifact_cache, artifact_key
+    artifacts = get_artifact_cache()
+    key = artifact_key('pandoc-ast', pandoc_version(), source_bytes)
+    if not artifacts.fetch_file(key, out_path):
+        ...  # run the tool
+        artifacts.store_file(key, out_path)
+    # or: python artifact_cache.py {stats,export FILE,import FILE,push,pull} [--remote DIR|URL]
+"""
+import argparse
+import hashlib
+import io
+import os
+import re
+import shutil
+import sys
+import threading
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).parent.resolve()
+ARTIFACT_DIR = REPO_ROOT / '_build' / 'artifacts'
+# Bump to invalidate every artifact (e.g. when a step changes how it uses its tool)
+ARTIFACT_VERSION = 1
+MAX_REMOTE_ERRORS = 3
+DEFAULT_TIMEOUT = 30
+_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def artifact_key(kind, *parts):
+    """Key of an artifact: the step name and every input that determines its output (str or bytes)."""
+    h = hashlib.sha256(f"artifact-v{ARTIFACT_VERSION}\0{kind}".encode('utf-8'))
+    for part in parts:
+        data = part.encode('utf-8') if isinstance(part, str) else bytes(part)
+        h.update(b'\0' + str(len(data)).encode('ascii') + b'\0')
+        h.update(data)
+    return h.hexdigest()
+
+
+def tool_version(distribution):
+    """Installed version of a Python distribution (e.g. 'nbconvert'), or 'unknown'."""
+    from importlib.metadata import PackageNotFoundError, version
+    try:
+        return version(distribution)
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+def _check_key(key):
+    if not _KEY_RE.match(key):
+        raise ValueError(f"Not an artifact key: {key!r}")
+    return key
+
+
+class DirectoryBackend:
+    """Artifacts as files under <root>/objects/ab/<key>; safe for concurrent writers (write + rename)."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def __str__(self):
+        return str(self.root)
+
+    def path(self, key):
+        return self.root / 'objects' / key[:2] / _check_key(key)
+
+    def has(self, key):
+        return self.path(key).is_file()
+
+    def get(self, key):
+        try:
+            return self.path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def _install(self, key, write):
+        dest = self.path(key)
+        if dest.exists():
+            return False
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            write(tmp)
+            os.replace(tmp, dest)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return True
+
+    def put(self, key, data):
+        """Store data under key unless it is already there. Returns True if it was stored."""
+        return self._install(key, lambda tmp: tmp.write_bytes(data))
+
+    def put_file(self, key, src):
+        # Copied, not linked: tools such as pdflatex rewrite their outputs in place
+        return self._install(key, lambda tmp: shutil.copyfile(src, tmp))
+
+    def keys(self):
+        objects = self.root / 'objects'
+        if not objects.exists():
+            return []
+        return sorted(p.name for p in objects.glob('??/*') if _KEY_RE.match(p.name))
+
+
+class HttpBackend:
+    """Artifacts on an HTTP server: GET/HEAD/PUT <url>/<key> (404 = missing)."""
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, session=None):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self._session = session
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return self.url
+
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+            return self._session
+
+    def has(self, key):
+        r = self.session().head(f"{self.url}/{_check_key(key)}", timeout=self.timeout)
+        if r.status_code == 404:
+            return False
+        r.raise_for_status()
+        return True
+
+    def get(self, key):
+        r = self.session().get(f"{self.url}/{_check_key(key)}", timeout=self.timeout)
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return r.content
+
+    def put(self, key, data):
+        r = self.session().put(f"{self.url}/{_check_key(key)}", data=data, timeout=self.timeout,
+                               headers={'Content-Type': 'application/octet-stream'})
+        r.raise_for_status()
+        return True
+
+    def put_file(self, key, src):
+        return self.put(key, Path(src).read_bytes())
+
+
+def make_backend(location):
+    """DirectoryBackend or HttpBackend for a directory path or http(s) URL (None for none)."""
+    if not location:
+        return None
+    if re.match(r'^https?://', str(location)):
+        return HttpBackend(str(location))
+    return DirectoryBackend(Path(location).expanduser())
+
+
+class ArtifactCache:
+    def __init__(self, root=ARTIFACT_DIR, remote=None):
+        self.local = DirectoryBackend(root)
+        self.remote = make_backend(remote) if isinstance(remote, (str, Path)) else remote
+        self.stats = {'local': 0, 'remote': 0, 'missed': 0, 'stored': 0, 'uploaded': 0, 'errors': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _remote(self, action, *args):
+        """Run a remote backend call; errors warn, and too many of them switch the remote off."""
+        remote = self.remote
+        if remote is None:
+            return None
+        try:
+            return getattr(remote, action)(*args)
+        except Exception as e:
+            self._count('errors')
+            print(f"[WARN] Artifact cache {remote}: {action} failed: {e}")
+            if self.stats['errors'] >= MAX_REMOTE_ERRORS and self.remote is not None:
+                print(f"[WARN] Artifact cache {remote}: too many errors, using the local tier only")
+                self.remote = None
+            return None
+
+    # --- single artifacts ----------------------------------------------------------------------
+
+    def get(self, key):
+        """The artifact's bytes from the local tier, else from the remote (kept locally), else None."""
+        data = self.local.get(key)
+        if data is not None:
+            self._count('local')
+            return data
+        data = self._remote('get', key)
+        if data is not None:
+            self._count('remote')
+            self.local.put(key, data)
+            return data
+        self._count('missed')
+        return None
+
+    def put(self, key, data):
+        """Store a freshly built artifact locally and upload it to the remote."""
+        if self.local.put(key, data):
+            self._count('stored')
+        if self.remote is not None and self._remote('put', key, data):
+            self._count('uploaded')
+
+    def fetch_file(self, key, dest):
+        """Write the artifact to dest (atomically). Returns False if no tier has it."""
+        dest = Path(dest)
+        local = self.local.path(key)
+        data = None
+        if not local.is_file():
+            data = self.get(key)
+            if data is None:
+                return False
+        else:
+            self._count('local')
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        if data is None:
+            shutil.copyfile(local, tmp)
+        else:
+            tmp.write_bytes(data)
+        os.replace(tmp, dest)
+        return True
+
+    def store_file(self, key, src):
+        if self.local.put_file(key, src):
+            self._count('stored')
+        if self.remote is not None and self._remote('put_file', key, src):
+            self._count('uploaded')
+
+    # --- multi-file artifacts ------------------------------------------------------------------
+
+    def fetch_bundle(self, key, dest_dir):
+        """Unpack a bundle stored by store_bundle() into dest_dir; returns the paths, or None if missing."""
+        import tarfile
+        data = self.get(key)
+        if data is None:
+            return None
+        dest_dir = Path(dest_dir)
+        paths = []
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r') as tar:
+            for member in tar.getmembers():
+                name = Path(member.name)
+                if not member.isfile() or name.is_absolute() or '..' in name.parts:
+                    continue
+                out = dest_dir / name
+                out.parent.mkdir(parents=True, exist_ok=True)
+                out.write_bytes(tar.extractfile(member).read())
+                paths.append(out)
+        return paths
+
+    def store_bundle(self, key, base_dir, paths):
+        """Store files (under base_dir, kept relative to it) as one artifact."""
+        import tarfile
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            for path in paths:
+                path = Path(path)
+                info = tarfile.TarInfo(path.relative_to(base_dir).as_posix())
+                data = path.read_bytes()
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        self.put(key, buf.getvalue())
+
+    # --- moving the local tier around ----------------------------------------------------------
+
+    def export(self, tar_path):
+        """Write every local artifact into a (gzipped if *.gz) tarball. Returns the count."""
+        import tarfile
+        keys = self.local.keys()
+        mode = 'w:gz' if str(tar_path).endswith('gz') else 'w'
+        with tarfile.open(tar_path, mode) as tar:
+            for key in keys:
+                tar.add(self.local.path(key), arcname=f"objects/{key[:2]}/{key}")
+        return len(keys)
+
+    def import_archive(self, tar_path):
+        """Add the artifacts of a tarball made by export(). Returns the number of new artifacts."""
+        import tarfile
+        added = 0
+        with tarfile.open(tar_path, 'r:*') as tar:
+            for member in tar.getmembers():
+                parts = member.name.split('/')
+                if (not member.isfile() or len(parts) != 3 or parts[0] != 'objects'
+                        or not _KEY_RE.match(parts[2]) or parts[1] != parts[2][:2]):
+                    continue
+                if self.local.put(parts[2], tar.extractfile(member).read()):
+                    added += 1
+        return added
+
+    def push(self):
+        """Upload local artifacts the remote does not have. Returns the count."""
+        pushed = 0
+        for key in self.local.keys():
+            if self.remote is None:
+                break
+            if self._remote('has', key) is False and self._remote('put', key, self.local.get(key)):
+                pushed += 1
+        return pushed
+
+    def pull(self):
+        """Copy every artifact of a directory remote into the local tier. Returns the count."""
+        if not isinstance(self.remote, DirectoryBackend):
+            raise ValueError("pull needs a directory remote (an HTTP remote cannot list its artifacts)")
+        pulled = 0
+        for key in self.remote.keys():
+            if not self.local.has(key) and self.local.put_file(key, self.remote.path(key)):
+                pulled += 1
+        return pulled
+
+    def summary(self):
+        s = self.stats
+        where = f" (remote {self.remote})" if self.remote is not None else ''
+        return (f"{s['local']} local hit(s), {s['remote']} remote hit(s), {s['missed']} missed, "
+                f"{s['stored']} stored, {s['uploaded']} uploaded{where}")
+
+
+_cache = None
+
+
+def configured_remote(content_yml='_content.yml'):
+    """The remote from BUILD_ARTIFACT_CACHE, else build.artifact_cache in _content.yml, else None."""
+    remote = os.environ.get('BUILD_ARTIFACT_CACHE')
+    if remote:
+        return remote
+    if Path(content_yml).exists():
+        from content_parser import load_and_validate_content_yml
+        return load_and_validate_content_yml(content_yml)['build'].get('artifact_cache')
+    return None
+
+
+def get_artifact_cache(remote=None):
+    """
+    Return the process-wide ArtifactCache. remote (a directory or URL) defaults to configured_remote();
+    passing it explicitly also switches an existing cache.
+    """
+    global _cache
+    if _cache is None:
+        _cache = ArtifactCache(remote=remote or configured_remote())
+    elif remote:
+        _cache.remote = make_backend(remote)
+    return _cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, move and share the build artifact cache.")
+    parser.add_argument('command', choices=('stats', 'export', 'import', 'push', 'pull'))
+    parser.add_argument('archive', nargs='?', help='Tarball for export/import (e.g. artifacts.tar.gz)')
+    parser.add_argument('--remote', help='Shared directory or http(s) URL (default: the configured remote)')
+    args = parser.parse_args()
+    cache = ArtifactCache(remote=args.remote or configured_remote())
+    if args.command in ('export', 'import') and not args.archive:
+        parser.error(f"{args.command} needs an archive path")
+    if args.command in ('push', 'pull') and cache.remote is None:
+        parser.error(f"{args.command} needs a remote (--remote, BUILD_ARTIFACT_CACHE or build.artifact_cache)")
+    if args.command == 'stats':
+        keys = cache.local.keys()
+        size = sum(cache.local.path(k).stat().st_size for k in keys)
+        print(f"[INFO] {len(keys)} artifact(s), {size / 1e6:.1f} MB in {cache.local}")
+        if cache.remote is not None:
+            print(f"[INFO] Remote: {cache.remote}")
+    elif args.command == 'export':
+        print(f"[OK] Exported {cache.export(args.archive)} artifact(s) to {args.archive}")
+    elif args.command == 'import':
+        print(f"[OK] Imported {cache.import_archive(args.archive)} new artifact(s) from {args.archive}")
+    elif args.command == 'push':
+        print(f"[OK] Pushed {cache.push()} artifact(s) to {cache.remote}")
+    else:
+        try:
+            print(f"[OK] Pulled {cache.pull()} artifact(s) from {cache.remote}")
+        except ValueError as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
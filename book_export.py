@@ -0,0 +1,237 @@
+"""
+book_export.py
+
+Incremental whole-course book export (single PDF and EPUB) in _content.yml TOC order.
+- Each page becomes a chapter; top-level groups become parts ("Chapters"/"Sections" groups are flattened,
+  as in convert_content_to_jupyterbook.py).
+- Per-chapter LaTeX fragments are generated from the cached pandoc AST (see pandoc_ast.py) into
+  _build/book/chapters/ and only rewritten when the chapter's AST changed.
+- The master book.tex \\include{}s every fragment and is compiled with latexmk (and the precompiled
+  preamble format from latex_build.py) in a persistent output directory. latexmk skips LaTeX when no
+  fragment changed, and the kept .aux files usually settle cross-references in a single pass.
+- Limitation: when any chapter changed, that pass still typesets every chapter. \\includeonly would
+  typeset only the changed ones, but LaTeX then leaves the other chapters out of the PDF, and
+  splicing their pages back in from the previous book is not attempted. Incremental work per edit
+  is therefore the pandoc step (one fragment), not the LaTeX step.
+- The EPUB is written in one pandoc pass over the combined chapter ASTs and skipped when nothing changed.
+
+Usage:
+    python build.py --book
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from build_metrics import record_cache
+from latex_build import ensure_format, latex_available, latex_preamble, run_latexmk, document_source
+from output_writer import write_if_changed
+from pandoc_ast import pandoc_version, walk, write_ast, text_inlines
+
+REPO_ROOT = Path(__file__).parent.resolve()
+BOOK_BUILD_DIR = REPO_ROOT / '_build' / 'book'
+BOOK_DOCS_DIR = REPO_ROOT / 'docs' / 'book'
+FLATTENED_GROUPS = ('chapters', 'sections')
+
+def slugify(title):
+    slug = title.lower().strip()
+    slug = re.sub(r'\s+', '-', slug)
+    slug = re.sub(r'[^a-z0-9\-]', '', slug)
+    return slug
+
+
+def book_outline(toc):
+    """
+    Flatten the _content.yml toc into an ordered list of ('part', title) and
+    ('chapter', title, file) entries.
+    """
+    outline = []
+    def walk_nodes(nodes):
+        for node in nodes:
+            if not isinstance(node, dict):
+                continue
+            title = node.get('title', '')
+            if node.get('file'):
+                outline.append(('chapter', title, node['file']))
+            if node.get('children'):
+                if not node.get('file') and title.lower() not in FLATTENED_GROUPS:
+                    outline.append(('part', title))
+                walk_nodes(node['children'])
+    walk_nodes(toc)
+    return outline
+
+
+def shift_headers(ast, by):
+    """Demote every Header in the AST by `by` levels (capped at 6)."""
+    def action(el):
+        if el['t'] == 'Header':
+            level, attr, inlines = el['c']
+            return {'t': 'Header', 'c': [min(level + by, 6), attr, inlines]}
+        return None
+    return walk(ast, action)
+
+
+def _digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8') if isinstance(part, str) else part)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def chapter_fragment(stem, title, ast, chapters_dir, debug=False):
+    """
+    Write the LaTeX fragment for one chapter from its AST. The fragment is regenerated only when
+    the chapter's AST (or pandoc) changed. Returns True if the fragment was rewritten.
+    """
+    key = _digest(pandoc_version(), title, json.dumps(ast, sort_keys=True))
+    key_file = chapters_dir / f"{stem}.key"
+    tex_file = chapters_dir / f"{stem}.tex"
+    if tex_file.exists() and key_file.exists() and key_file.read_text() == key:
+        debug_print(f"[CACHE] Chapter up to date: {stem}", debug)
+        return False
+    body_file = chapters_dir / f"{stem}.body.tex"
+    write_ast(shift_headers(ast, 1), body_file, to='latex', extra_args=['--top-level-division=chapter'])
+    body = body_file.read_text(encoding='utf-8')
+    body_file.unlink()
+    changed = write_if_changed(tex_file, f"\\chapter{{{_latex_escape(title)}}}\n\\label{{{stem}}}\n\n{body}")
+    key_file.write_text(key)
+    if changed:
+        print(f"[OK] Rebuilt chapter fragment {tex_file}")
+    return changed
+
+
+def _latex_escape(text):
+    replacements = {'\\': r'\textbackslash{}', '&': r'\&', '%': r'\%', '$': r'\$', '#': r'\#',
+                    '_': r'\_', '{': r'\{', '}': r'\}', '~': r'\textasciitilde{}', '^': r'\textasciicircum{}'}
+    return ''.join(replacements.get(c, c) for c in text)
+
+
+def build_book_pdf(outline, preamble, out_pdf, debug=False):
+    """
+    Write book.tex and compile it with latexmk in _build/book/out. Every chapter is typeset on each
+    LaTeX run (see the module docstring); the kept aux files only save reruns.
+    """
+    if not latex_available():
+        print("[ERROR] latexmk/pdflatex not found; skipping book PDF.")
+        return None
+    fmt = ensure_format(preamble, debug=debug)
+    body = ['\\maketitle', '\\tableofcontents']
+    for entry in outline:
+        if entry[0] == 'part':
+            body.append(f"\\part{{{_latex_escape(entry[1])}}}")
+        else:
+            body.append(f"\\include{{chapters/{Path(entry[2]).stem}}}")
+    write_if_changed(BOOK_BUILD_DIR / 'book.tex', document_source('\n'.join(body), preamble, fmt))
+    out_dir = BOOK_BUILD_DIR / 'out'
+    # \include{chapters/x} writes chapters/x.aux under -outdir, which LaTeX will not create itself
+    (out_dir / 'chapters').mkdir(parents=True, exist_ok=True)
+    pdf = run_latexmk(BOOK_BUILD_DIR / 'book.tex', out_dir, fmt=fmt, debug=debug)
+    if pdf is None:
+        return None
+    out_pdf.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(pdf, out_pdf)
+    print(f"[OK] Built book PDF: {out_pdf}")
+    return out_pdf
+
+
+def build_book_epub(outline, asts, site, out_epub, resource_path, debug=False):
+    """Write the EPUB from the combined chapter ASTs; skipped when no chapter changed."""
+    blocks = []
+    api_version = None
+    in_part = False
+    for entry in outline:
+        if entry[0] == 'part':
+            in_part = True
+            blocks.append({'t': 'Header', 'c': [1, [slugify(entry[1]), [], []], text_inlines(entry[1])]})
+            continue
+        title, file = entry[1], entry[2]
+        ast = asts.get(file)
+        if ast is None:
+            continue
+        api_version = api_version or ast['pandoc-api-version']
+        level = 2 if in_part else 1
+        blocks.append({'t': 'Header', 'c': [level, [Path(file).stem, [], []], text_inlines(title)]})
+        blocks.extend(shift_headers(ast, level)['blocks'])
+    if api_version is None:
+        return None
+    meta = {
+        'title': {'t': 'MetaInlines', 'c': text_inlines(site.get('title', ''))},
+        'author': {'t': 'MetaInlines', 'c': text_inlines(site.get('author', ''))},
+        'lang': {'t': 'MetaInlines', 'c': text_inlines(site.get('language', 'en'))},
+    }
+    book = {'pandoc-api-version': api_version, 'meta': meta, 'blocks': blocks}
+    key = _digest(pandoc_version(), json.dumps(book, sort_keys=True))
+    key_file = BOOK_BUILD_DIR / 'book.epub.key'
+    if out_epub.exists() and key_file.exists() and key_file.read_text() == key:
+        print(f"[CACHE] Book EPUB up to date: {out_epub}")
+        return out_epub
+    out_epub.parent.mkdir(parents=True, exist_ok=True)
+    write_ast(book, out_epub, resource_path=resource_path, extra_args=['--toc', '--split-level=2'])
+    key_file.write_text(key)
+    print(f"[OK] Built book EPUB: {out_epub}")
+    return out_epub
+
+
+def build_book(toc, site, load_ast, formats=('pdf', 'epub'), resource_path=None, jobs=None,
+               load_pdf_ast=None, debug=False):
+    """
+    Assemble the whole course from per-chapter artifacts.
+    load_ast(file_path) must return the (image-rewritten) pandoc AST for a source file;
+    it is expected to be cached, so unchanged chapters cost almost nothing.
+    load_pdf_ast(file_path), if given, returns the AST used for the LaTeX chapters (e.g. read
+    from Unicode-sanitized Markdown); it defaults to load_ast.
+    """
+    outline = book_outline(toc)
+    chapters = [e for e in outline if e[0] == 'chapter' and Path(e[2]).exists()]
+    for e in outline:
+        if e[0] == 'chapter' and not Path(e[2]).exists():
+            print(f"[WARN] Skipping missing chapter: {e[2]}")
+    outline = [e for e in outline if e[0] == 'part' or e in chapters]
+    chapters_dir = BOOK_BUILD_DIR / 'chapters'
+    chapters_dir.mkdir(parents=True, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+
+    def load(entry):
+        try:
+            return entry[2], load_ast(Path(entry[2]))
+        except (RuntimeError, OSError) as e:
+            print(f"[ERROR] {e}")
+            return entry[2], None
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        asts = {file: ast for file, ast in pool.map(load, chapters) if ast is not None}
+    outline = [e for e in outline if e[0] == 'part' or e[2] in asts]
+    name = slugify(site.get('title', 'book')) or 'book'
+    outputs = []
+    if 'pdf' in formats:
+        def fragment(entry):
+            title, file = entry[1], entry[2]
+            try:
+                ast = load_pdf_ast(Path(file)) if load_pdf_ast else asts[file]
+                return file, chapter_fragment(Path(file).stem, title, ast, chapters_dir, debug=debug)
+            except (RuntimeError, OSError) as e:
+                print(f"[ERROR] {e}")
+                return file, None
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = dict(pool.map(fragment, [e for e in outline if e[0] == 'chapter']))
+        # A chapter whose fragment failed is left out of the PDF, like one that failed to load
+        pdf_outline = [e for e in outline if e[0] == 'part' or results[e[2]] is not None]
+        changed = sum(1 for c in results.values() if c)
+        reused = sum(1 for c in results.values() if c is False)
+        print(f"[INFO] {changed} chapter fragment(s) rebuilt, {reused} reused.")
+        record_cache('book_chapters', reused, changed)
+        pandoc_args = ['--top-level-division=chapter', '-V', 'documentclass=book',
+                       '-M', f"title={site.get('title', '')}", '-M', f"author={site.get('author', '')}"]
+        preamble = latex_preamble(Path(resource_path or REPO_ROOT / 'docs' / 'tex'), pandoc_args, debug=debug)
+        outputs.append(build_book_pdf(pdf_outline, preamble, BOOK_DOCS_DIR / f"{name}.pdf", debug=debug))
+    if 'epub' in formats:
+        outputs.append(build_book_epub(outline, asts, site, BOOK_DOCS_DIR / f"{name}.epub", resource_path, debug=debug))
+    return [o for o in outputs if o]
+
+
+def debug_print(msg, debug):
+    if debug:
+        print(msg)
@@ -1,3 +1,19 @@
+def metrics_stage(name):
+    """
+    Time the decorated builder as build stage name in _build/metrics.jsonl (see build_metrics.py).
+    build_metrics is only imported when the builder runs, so `build.py --help` does not load it.
+    """
+    def decorate(func):
+        from functools import wraps
+
+        @wraps(func)
+        def run_stage(*args, **kwargs):
+            import build_metrics
+            with build_metrics.stage(name):
+                return func(*args, **kwargs)
+        return run_stage
+    return decorate
+
 def build_tex_all(debug=False):
     """Build LaTeX for all files referenced in the menu/content tree (_content.yml)."""
     from content_parser import load_and_validate_content_yml, get_all_content_files
@@ -11,98 +27,310 @@ def build_tex_all(debug=False):
         print(f"[INFO] Building LaTeX for {len(files)} files from menu/content tree.")
     build_tex_for_files(files, debug=debug)
 
-def build_tex_for_files(files, debug=False):
+def build_tex_for_files(files, debug=False, jobs=None):
     """Build LaTeX for specified markdown and notebook files."""
+    build_print_for_files(files, ['tex'], debug=debug, jobs=jobs)
+
+PRINT_FORMATS = ('docx', 'tex', 'pdf')
+REMOTE_IMAGE_PLACEHOLDER = '[Image not embedded: the remote image is unavailable or not a PNG, JPEG or PDF. View it online.]'
+
+def build_print_all(formats, debug=False, jobs=None):
+    """Build the given print formats for all files referenced in the menu/content tree (_content.yml)."""
+    from content_parser import load_and_validate_content_yml, get_all_content_files
+    content = load_and_validate_content_yml('_content.yml')
+    files = get_all_content_files(content)
+    if not files:
+        if debug:
+            print("[WARN] No files found in _content.yml toc.")
+        return
+    if debug:
+        print(f"[INFO] Building {', '.join(formats)} for {len(files)} files from menu/content tree.")
+    build_print_for_files(files, formats, debug=debug, jobs=jobs)
+
+def prepare_print_markdown(file_path, build_dir, debug=False):
+    """
+    Return (md_path, base_dir) for a source file. Markdown sources are used as-is; notebooks are
+    converted with nbconvert into build_dir once and reused until the notebook bytes change.
+    base_dir is the directory that relative image links resolve against.
+    """
+    import hashlib
+    if file_path.suffix.lower() == '.md':
+        return file_path, file_path.parent
+    stem = file_path.stem
+    out_md = build_dir / f"{stem}.md"
+    stamp = build_dir / f"{stem}.nbhash"
+    nb_hash = hashlib.sha256(file_path.read_bytes()).hexdigest()
+    if out_md.exists() and stamp.exists() and stamp.read_text() == nb_hash:
+        debug_print(f"[CACHE] Markdown for {file_path} is up to date", debug)
+        return out_md, build_dir
+    print(f"[INFO] Converting notebook to markdown: {file_path} -> {out_md}")
+    nbconvert_markdown(file_path, build_dir, stem, debug=debug)
+    stamp.write_text(nb_hash)
+    return out_md, build_dir
+
+def nbconvert_markdown(file_path, out_dir, name, debug=False):
+    """
+    Convert a notebook with nbconvert to out_dir/<name>.md plus its images in out_dir/<name>_files/.
+    The result is restored from the shared artifact cache when the same notebook was converted before
+    (by any machine sharing the cache), and uploaded to it after a successful conversion.
+    """
     import subprocess
-    import sys
-    import os
-    from pathlib import Path
-    import shutil
-    import re
+    from artifact_cache import get_artifact_cache, artifact_key, tool_version
+    artifacts = get_artifact_cache()
+    key = artifact_key('nbconvert-markdown', tool_version('nbconvert'), name, file_path.read_bytes())
+    out_md = out_dir / f"{name}.md"
+    files_dir = out_dir / f"{name}_files"
+    # Images of an older version of the notebook must not leak into the result
+    shutil.rmtree(files_dir, ignore_errors=True)
+    if artifacts.fetch_bundle(key, out_dir) is not None:
+        debug_print(f"[CACHE] Markdown for {file_path} restored from the artifact cache", debug)
+        return out_md
+    cmd = [sys.executable, '-m', 'nbconvert', '--to', 'markdown', str(file_path), '--output', name, '--output-dir', str(out_dir)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"nbconvert failed for {file_path}: {result.stderr}")
+    images = sorted(p for p in files_dir.rglob('*') if p.is_file()) if files_dir.exists() else []
+    artifacts.store_bundle(key, out_dir, [out_md] + images)
+    return out_md
+
+def print_image_rewriter(stem, base_dir, img_dir, published, remote=None, debug=False):
+    """
+    Return the AST image filter for one source: local images are published to img_dir as
+    {stem}_{filename} through the image store (appending each destination to published) and
+    linked as ../images/{flat_name}. Remote images are embedded from their mirrored copy
+    (remote maps URL -> local path, see remote_assets.py); unavailable ones (None) become a placeholder link.
+    """
+    from pandoc_ast import text_inlines
+    from image_store import get_store
+    from remote_assets import is_remote
+    remote = remote or {}
+    def rewrite(img_path):
+        if is_remote(img_path):
+            local = remote.get(img_path)
+            if local is None:
+                debug_print(f"[WARN] Replacing unavailable remote image with placeholder: {img_path}", debug)
+                link = {'t': 'Link', 'c': [['', [], []], text_inlines(REMOTE_IMAGE_PLACEHOLDER), [img_path, '']]}
+                return {'t': 'Emph', 'c': [link]}
+            flat_name = f"{stem}_remote_{local.stem[:16]}{local.suffix}"
+            dest_img = img_dir / flat_name
+            if get_store().publish(local, dest_img, owner=f"print:{stem}"):
+                debug_print(f"[INFO] Published remote image {img_path} -> {dest_img}", debug)
+            published.append(dest_img)
+            return f"../images/{flat_name}"
+        flat_name = f"{stem}_{os.path.basename(img_path)}"
+        src_img = base_dir / img_path
+        dest_img = img_dir / flat_name
+        if src_img.exists():
+            if get_store().publish(src_img, dest_img, owner=f"print:{stem}"):
+                debug_print(f"[INFO] Published image {src_img} -> {dest_img}", debug)
+            published.append(dest_img)
+        return f"../images/{flat_name}"
+    return rewrite
+
+def load_print_ast(file_path, sanitize=False, debug=False):
+    """
+    Return the pandoc AST for a markdown or notebook source, with images rewritten for print.
+    With sanitize, the Markdown intermediate is first run through the Unicode sanitizer (for LaTeX).
+    Both the nbconvert step and the pandoc reader are cached, so unchanged sources are cheap.
+    """
+    from pandoc_ast import read_markdown_ast, rewrite_images, image_urls
+    from image_store import get_store
+    from remote_assets import get_remote_cache, is_remote
     repo_root = Path(__file__).parent.resolve()
-    tex_dir = repo_root / 'docs' / 'tex'
     img_dir = repo_root / 'docs' / 'images'
-    tex_dir.mkdir(parents=True, exist_ok=True)
+    print_dir = repo_root / '_build' / 'print'
     img_dir.mkdir(parents=True, exist_ok=True)
+    print_dir.mkdir(parents=True, exist_ok=True)
+    md_path, base_dir = prepare_print_markdown(file_path, print_dir, debug=debug)
+    if sanitize:
+        from sanitize_unicode import sanitize_file
+        sanitized = print_dir / f"{file_path.stem}.pdf.md"
+        if sanitize_file(md_path, sanitized):
+            debug_print(f"[INFO] Sanitized {md_path} -> {sanitized}", debug)
+        md_path = sanitized
+    ast = read_markdown_ast(md_path, debug=debug)
+    # Mirror every remote image of this source concurrently before rewriting
+    remote_cache = get_remote_cache()
+    remote = remote_cache.fetch_all([u for u in image_urls(ast) if is_remote(u)], debug=debug)
+    for url, local in remote.items():
+        # pdflatex includes only PNG, JPEG and PDF; anything else (GIF, SVG, an HTML error page) gets the placeholder
+        if local is not None and not remote_cache.embeddable(url):
+            print(f"[WARN] Not embedding remote image {url}: not a PNG, JPEG or PDF "
+                  f"(Content-Type: {remote_cache.entries[url].get('content_type')})")
+            remote[url] = None
+    published = []
+    ast = rewrite_images(ast, print_image_rewriter(file_path.stem, base_dir, img_dir, published, remote=remote, debug=debug))
+    # Images this source no longer references are removed from docs/images
+    get_store().retire(f"print:{file_path.stem}", published)
+    return ast
+
+@metrics_stage('book')
+def build_book_all(debug=False, jobs=None):
+    """Assemble the whole course as one PDF and EPUB, in _content.yml order, from cached per-chapter artifacts."""
+    from content_parser import load_and_validate_content_yml
+    from book_export import build_book
+    content = load_and_validate_content_yml('_content.yml')
+    resource_dir = Path(__file__).parent.resolve() / 'docs' / 'tex'
+    resource_dir.mkdir(parents=True, exist_ok=True)
+    build_book(content['toc'], content['site'], lambda file_path: load_print_ast(file_path, debug=debug),
+               load_pdf_ast=lambda file_path: load_print_ast(file_path, sanitize=True, debug=debug),
+               resource_path=resource_dir, jobs=jobs, debug=debug)
+    from image_store import get_store
+    from remote_assets import get_remote_cache
+    from artifact_cache import get_artifact_cache
+    get_store().save()
+    get_remote_cache().save()
+    print(f"[INFO] Shared artifacts: {get_artifact_cache().summary()}")
+    record_cache_metrics(get_store(), get_remote_cache(), get_artifact_cache())
+
+def prepare_latex(graphics_dir, debug=False):
+    """
+    Set up incremental PDF compilation: the shared preamble, its precompiled format and a
+    semaphore sized by build.latex_jobs in _content.yml. Returns None if latexmk is unavailable,
+    in which case pandoc produces PDFs directly.
+    """
+    import threading
+    from content_parser import load_and_validate_content_yml
+    from latex_build import latex_available, latex_preamble, ensure_format, DEFAULT_LATEX_JOBS
+    if not latex_available():
+        print("[WARN] latexmk/pdflatex not found; falling back to pandoc for PDF output.")
+        return None
+    content = load_and_validate_content_yml('_content.yml')
+    latex_jobs = content['build'].get('latex_jobs', DEFAULT_LATEX_JOBS)
+    preamble = latex_preamble(graphics_dir, debug=debug)
+    return {
+        'preamble': preamble,
+        'fmt': ensure_format(preamble, debug=debug),
+        'slots': threading.BoundedSemaphore(latex_jobs),
+    }
+
+def compile_pdf_with_latexmk(ast, out_pdf, latex, debug=False):
+    """Write the LaTeX body for one AST and compile it with latexmk into out_pdf. Returns True on success."""
+    from pandoc_ast import write_ast
+    from latex_build import compile_document, LATEX_DIR
+    stem = out_pdf.stem
+    body_path = LATEX_DIR / stem / f"{stem}.body.tex"
+    body_path.parent.mkdir(parents=True, exist_ok=True)
+    write_ast(ast, body_path, to='latex')
+    body = body_path.read_text(encoding='utf-8')
+    pdf = compile_document(stem, body, latex['preamble'], fmt=latex['fmt'], slots=latex['slots'], debug=debug)
+    if pdf is None:
+        return False
+    shutil.copy2(pdf, out_pdf)
+    return True
+
+@metrics_stage('print')
+def build_print_for_files(files, formats, debug=False, jobs=None):
+    """
+    Build print outputs (any of 'docx', 'tex', 'pdf') for markdown and notebook files.
+    Each source is read by pandoc once into a cached JSON AST, images are rewritten once as an
+    AST filter, and every requested writer then runs from that AST, up to jobs at a time.
+    PDFs are written from a second AST read from the Unicode-sanitized Markdown intermediate.
+    """
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import build_metrics
+    from pandoc_ast import write_ast, ast_stats
+    from image_store import get_store
+    from remote_assets import get_remote_cache
+    from artifact_cache import get_artifact_cache
+    repo_root = Path(__file__).parent.resolve()
+    pdf_dir = repo_root / 'docs' / 'pdf'
+    out_dirs = {
+        'docx': repo_root / 'docs' / 'docx',
+        'tex': repo_root / 'docs' / 'tex',
+        'pdf': repo_root / '_build' / 'pdf',
+    }
+    # Images are linked as ../images/<name>, which resolves from any sibling of docs/images
+    resource_dir = out_dirs['tex']
+    for d in [pdf_dir, resource_dir] + [out_dirs[fmt] for fmt in formats]:
+        d.mkdir(parents=True, exist_ok=True)
     missing_files = []
+    sources = []
     for file in files:
         file_path = Path(file)
         if not file_path.exists():
             print(f"[ERROR] File not found: {file}")
             missing_files.append(file)
-            continue
-        ext = file_path.suffix.lower()
-        stem = file_path.stem
-        out_md = tex_dir / f"{stem}.md"
-        out_tex = tex_dir / f"{stem}.tex"
-        # Step 1: Ensure we have a markdown file with correct image links
-        if ext == '.md':
-            print(f"[INFO] Copying markdown file: {file_path} -> {out_md}")
-            shutil.copy2(file_path, out_md)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                md_content = f.read()
-            def replace_img_link(match):
-                img_path = match.group(1)
-                if img_path.startswith('http'):
-                    return match.group(0)
-                img_filename = os.path.basename(img_path)
-                flat_name = f"{stem}_{img_filename}"
-                src_img = file_path.parent / img_path
-                dest_img = img_dir / flat_name
-                if src_img.exists():
-                    shutil.copy2(src_img, dest_img)
-                    print(f"[INFO] Copied image {src_img} -> {dest_img}")
-                # For tex, use relative path from tex_dir to img_dir
-                rel_path = os.path.relpath(dest_img, tex_dir)
-                return match.group(0).replace(img_path, rel_path)
-            new_md_content = re.sub(r'!\[[^\]]*\]\(([^)]+)\)', replace_img_link, md_content)
-            with open(out_md, 'w', encoding='utf-8') as f:
-                f.write(new_md_content)
-        elif ext == '.ipynb':
-            print(f"[INFO] Converting notebook to markdown: {file_path} -> {out_md}")
-            import nbformat
-            import subprocess
-            nb = nbformat.read(str(file_path), as_version=4)
-            tmp_md = tex_dir / f"{stem}_tmp.md"
-            cmd = [sys.executable, '-m', 'nbconvert', '--to', 'markdown', str(file_path), '--output', tmp_md.name, '--output-dir', str(tex_dir)]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                print(f"[ERROR] nbconvert failed for {file_path}: {result.stderr}")
-                continue
-            with open(tmp_md, 'r', encoding='utf-8') as f:
-                md_content = f.read()
-            def replace_img_link(match):
-                img_path = match.group(1)
-                if img_path.startswith('http'):
-                    return match.group(0)
-                img_filename = os.path.basename(img_path)
-                flat_name = f"{stem}_{img_filename}"
-                src_img = tex_dir / img_path
-                dest_img = img_dir / flat_name
-                if src_img.exists():
-                    shutil.copy2(src_img, dest_img)
-                    print(f"[INFO] Copied image {src_img} -> {dest_img}")
-                rel_path = os.path.relpath(dest_img, tex_dir)
-                return match.group(0).replace(img_path, rel_path)
-            new_md_content = re.sub(r'!\[[^\]]*\]\(([^)]+)\)', replace_img_link, md_content)
-            with open(out_md, 'w', encoding='utf-8') as f:
-                f.write(new_md_content)
-            tmp_md.unlink()
-        else:
+        elif file_path.suffix.lower() not in ('.md', '.ipynb'):
             print(f"[SKIP] Unsupported file type: {file}")
-            continue
-        # Step 2: Convert markdown to tex with pandoc
-        print(f"[INFO] Converting markdown to tex: {out_md} -> {out_tex}")
-        cmd = ['pandoc', str(out_md), '-o', str(out_tex), '--resource-path', str(img_dir)]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"[ERROR] pandoc failed for {out_md}: {result.stderr}")
-            continue
-        print(f"[OK] Built {out_tex} from {file}")
+        else:
+            sources.append(file_path)
+
+    # PDFs compile through latexmk against a precompiled preamble when LaTeX is available
+    latex = None
+    if 'pdf' in formats and sources:
+        try:
+            latex = prepare_latex(resource_dir, debug=debug)
+        except (RuntimeError, OSError) as e:
+            print(f"[ERROR] {e}")
+
+    def prepare(file_path):
+        start = time.perf_counter()
+        try:
+            asts = {}
+            if any(fmt != 'pdf' for fmt in formats):
+                asts['plain'] = load_print_ast(file_path, debug=debug)
+            if 'pdf' in formats:
+                asts['pdf'] = load_print_ast(file_path, sanitize=True, debug=debug)
+            build_metrics.record_file(file_path, time.perf_counter() - start, group='ast')
+            return file_path, asts
+        except (RuntimeError, OSError) as e:
+            print(f"[ERROR] {e}")
+            return None
+
+    def write(task):
+        file_path, asts, fmt = task
+        out_path = out_dirs[fmt] / f"{file_path.stem}.{fmt}"
+        ast = asts['pdf' if fmt == 'pdf' else 'plain']
+        debug_print(f"[INFO] Writing {fmt}: {out_path}", debug)
+        start = time.perf_counter()
+        try:
+            if fmt == 'pdf' and latex:
+                if not compile_pdf_with_latexmk(ast, out_path, latex, debug=debug):
+                    return
+            else:
+                write_ast(ast, out_path, resource_path=resource_dir)
+        except (RuntimeError, OSError) as e:
+            print(f"[ERROR] {e}")
+            return
+        if fmt == 'pdf':
+            shutil.copy2(out_path, pdf_dir / out_path.name)
+        build_metrics.record_file(file_path, time.perf_counter() - start, out_path.stat().st_size, group=fmt)
+        print(f"[OK] Built {out_path} from {file_path}")
+
+    jobs = jobs or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        prepared = [p for p in pool.map(prepare, sources) if p]
+        tasks = [(file_path, asts, fmt) for file_path, asts in prepared for fmt in formats]
+        list(pool.map(write, tasks))
+    store = get_store()
+    store.save()
+    print(f"[INFO] Images: {store.summary()}")
+    remote_cache = get_remote_cache()
+    remote_cache.save()
+    print(f"[INFO] Remote images: {remote_cache.summary()}")
+    artifacts = get_artifact_cache()
+    print(f"[INFO] Shared artifacts: {artifacts.summary()}")
+    record_cache_metrics(store, remote_cache, artifacts)
+    build_metrics.record_cache('pandoc_ast', ast_stats['hits'], ast_stats['parsed'])
     if missing_files:
         print(f"[SUMMARY] {len(missing_files)} file(s) were missing and not processed:")
         for mf in missing_files:
             print(f"  - {mf}")
+
+def record_cache_metrics(store=None, remote_cache=None, artifacts=None):
+    """Report the image store's, remote image mirror's and artifact cache's counters to build_metrics."""
+    import build_metrics
+    if artifacts is not None:
+        s = artifacts.stats
+        build_metrics.record_cache('artifact_cache', s['local'] + s['remote'], s['missed'])
+    if store is not None:
+        build_metrics.record_cache('image_store', store.stats['skipped'], store.stats['published'])
+    if remote_cache is not None:
+        s = remote_cache.stats
+        build_metrics.record_cache('remote_assets', s['revalidated'] + s['offline'], s['downloaded'] + s['failed'])
+
 def render_download_buttons(file_path):
     """
     Generate HTML for download buttons for a given file (md or ipynb).
@@ -123,6 +351,9 @@ def render_download_buttons(file_path):
     # Add ipynb and jupyter for notebooks
     if ext == '.ipynb':
         buttons.append((f'ipynb/{stem}.ipynb', 'IPYNB', '📓', True))
+        # Slim variants published by copy_ipynb_flat.py: no outputs / images linked instead of embedded
+        buttons.append((f'ipynb/clean/{stem}.ipynb', 'IPYNB (clean)', '🧹', True))
+        buttons.append((f'ipynb/light/{stem}.ipynb', 'IPYNB (light)', '🪶', True))
         # Dynamically find the Jupyter Book HTML file
         jupyter_html = None
         jupyter_root = Path('docs/jupyter-book/content/notebooks')
@@ -154,6 +385,9 @@ def render_download_buttons(file_path):
 
 import shutil
 
+# Per-theme stylesheets from before scripts/theme_to_css.py compiled every theme into theme.css
+RETIRED_STYLESHEETS = ('theme-light.css', 'theme-dark.css')
+
 def copy_static_assets(debug=False):
     """Copy CSS and image assets from static/ to docs/."""
     # Copy CSS
@@ -165,18 +399,26 @@ def copy_static_assets(debug=False):
             dest = css_dest / css_file.name
             shutil.copy2(css_file, dest)
             debug_print(f"[INFO] Copied {css_file} to {dest}", debug)
+        # Stylesheets replaced by the combined theme.css; pages built now no longer link them
+        for name in RETIRED_STYLESHEETS:
+            if (css_dest / name).exists() and not (css_src / name).exists():
+                (css_dest / name).unlink()
+                print(f"[INFO] Removed retired stylesheet {css_dest / name}")
     else:
         debug_print(f"[WARN] Source CSS directory {css_src} does not exist.", debug)
-    # Copy images
+    # Publish images through the image store (static images have no owning page and are never retired)
+    from image_store import get_store
     img_src = Path('static/images')
     img_dest = Path('docs/images')
     if img_src.exists():
         img_dest.mkdir(parents=True, exist_ok=True)
+        store = get_store()
         for img_file in img_src.glob('*'):
             if img_file.is_file():
                 dest = img_dest / img_file.name
-                shutil.copy2(img_file, dest)
-                debug_print(f"[INFO] Copied {img_file} to {dest}", debug)
+                if store.publish(img_file, dest):
+                    debug_print(f"[INFO] Published {img_file} to {dest}", debug)
+        store.save()
     else:
         debug_print(f"[WARN] Source images directory {img_src} does not exist.", debug)
 def debug_print(msg, debug):
@@ -195,13 +437,12 @@ No build logic yet—just argument parsing and structure.
 
 import argparse
 import sys
-import subprocess
 
 
 # --- Move build_html_all and build_html_for_files above main() ---
 
 
-def build_html_all(debug=False):
+def build_html_all(debug=False, critical_css=False):
     copy_static_assets(debug=debug)
     """Build HTML for all files referenced in the menu/content tree (_content.yml)."""
     from content_parser import load_and_validate_content_yml, get_all_content_files
@@ -213,129 +454,333 @@ def build_html_all(debug=False):
         return
     if debug:
         print(f"[INFO] Building HTML for {len(files)} files from menu/content tree.")
-    build_html_for_files(files, debug=debug)
+    build_html_for_files(files, debug=debug, critical_css=critical_css)
 
 from pathlib import Path
 import os
 import sys
-try:
-    import markdown
-except ImportError:
-    print("[ERROR] The 'markdown' package is required. Install with: pip install markdown", file=sys.stderr)
-    sys.exit(1)
-from content_parser import load_and_validate_content_yml
-from build_menu_html import build_menu_ul
-from build_footer_html import render_footer
-from menu_parser import get_menu_tree
-
-from notebook_kernel_utils import fix_all_notebook_kernels
-
-def build_html_for_files(files, debug=False):
-    # Always fix kernels before building
-    fix_all_notebook_kernels("content/", debug=debug)
-    debug_print("[DEBUG] build_html_for_files() is running!", debug)
+
+# Builders import their dependencies (markdown, YAML, nbformat, pandoc helpers) when they run, so
+# `build.py --help` and single-format builds only pay for what they use (see scripts/bench_startup.py).
+
+def import_markdown():
+    """The markdown package, imported on first use by the HTML builder."""
+    try:
+        import markdown
+    except ImportError:
+        print("[ERROR] The 'markdown' package is required. Install with: pip install markdown", file=sys.stderr)
+        sys.exit(1)
+    return markdown
+
+# Default byte budget for prefetching the next page and its images (build.prefetch_budget_kb; 0 turns it off)
+PREFETCH_BUDGET_KB = 512
+
+class HtmlRenderer:
     """
-    Build HTML for specified markdown and notebook files using YAML-driven templates and navigation.
-    debug: if True, print debug output for menu and notebook processing.
+    The site model (_content.yml tree, menu) and page templates loaded once, rendering pages to strings.
+    Used by build_html_for_files (which writes them to docs/) and by preview_server.py (which serves them).
     """
-    # Load site config and menu
-    content = load_and_validate_content_yml('_content.yml')
-    site = content['site']
-    try:
-        menu = get_menu_tree('_content.yml')
-        if isinstance(menu, dict) and 'toc' in menu:
-            menu = menu['toc']
-    except Exception as e:
-        print(f"[ERROR] Could not load menu: {e}")
-        menu = []
 
+    def __init__(self, critical_css=False, debug=False):
+        from content_parser import load_and_validate_content_yml
+        from site_tree import site_tree_for
+        self.debug = debug
+        # Load site config and menu
+        content = load_and_validate_content_yml('_content.yml')
+        site = self.site = content['site']
+        self.tree = site_tree_for(content)
+        self.language = site.get('language', 'en')
+
+        # Top-level menu entries; a group without a file links to its auto-generated index (<slug>.html)
+        self.top_menu = [node for node in self.tree.menu_items() if node.title and (node.file or node.children)]
+        for node in self.top_menu:
+            debug_print(f"[MENU] {node.title} -> {node.html}", debug)
+        self.index_pages = {node.html: node for node in self.top_menu if not node.file}
+
+        menu_html = ['<ul class="site-nav-menu" id="site-nav-menu">']
+        for node in self.top_menu:
+            menu_html.append('<li>')
+            menu_html.append(f'<a href="{node.html}">{node.title}</a>')
+            menu_html.append('</li>')
+        menu_html.append('</ul>')
+        self.menu_html = ''.join(menu_html)
+
+        footer_text = content.get('footer', {}).get('text', '')
+        # Load footer from template and fill variable
+        with open('static/templates/footer.html', 'r', encoding='utf-8') as f:
+            self.footer_html = f.read().replace('{{ footer_text }}', footer_text)
+
+        # Load header HTML from template and fill variables
+        logo = site['logo']
+        description = site.get('description', '')
+        logo_web = './' + logo[len('static/'):] if logo.startswith('static/') else logo
+        with open('static/templates/header.html', 'r', encoding='utf-8') as f:
+            header_html = f.read()
+        self.header_html = (header_html
+            .replace('{{ logo_web }}', logo_web)
+            .replace('{{ title }}', site['title'])
+            .replace('{{ description }}', description)
+        )
+        # Content pages are titled after the last auto-generated index page, or the site title
+        self.page_title = list(self.index_pages.values())[-1].title if self.index_pages else site['title']
+
+        # Load theme toggle HTML from template
+        with open('static/templates/theme-toggle.html', 'r', encoding='utf-8') as f:
+            self.theme_toggle_html = f.read()
+
+        head_path = os.path.join('static', 'templates', 'head.html')
+        with open(head_path, 'r') as f:
+            self.head_template = f.read()
+        # Use page skeleton template
+        with open('static/templates/page.html', 'r', encoding='utf-8') as f:
+            self.page_template = f.read()
+        self.css_theme = 'css/theme.css'
+        self.prefetch_budget = content['build'].get('prefetch_budget_kb', PREFETCH_BUDGET_KB) * 1024
+        self._assets = {}
+        self.critical = None
+        if critical_css:
+            from critical_css import CriticalCss
+            self.critical = CriticalCss(Path('static') / self.css_theme)
+
+    def head_html(self, page_title, page_links=''):
+        return (self.head_template
+            .replace('{{ title }}', page_title)
+            .replace('{{ css_theme }}', self.css_theme)
+            .replace('{{ page_links }}', page_links)
+        )
+
+    def page_assets(self, file):
+        """[(url, bytes)] of the local images a page's Markdown references, resolved against docs/ like the browser does."""
+        import json
+        import re
+        path = Path(file)
+        try:
+            key = (path.as_posix(), path.stat().st_mtime_ns)
+        except OSError:
+            return []
+        if key in self._assets:
+            return self._assets[key]
+        try:
+            if path.suffix.lower() == '.ipynb':
+                with open(path, 'r', encoding='utf-8') as f:
+                    cells = json.load(f).get('cells', [])
+                text = '\n'.join(''.join(c.get('source', [])) for c in cells if c.get('cell_type') == 'markdown')
+            else:
+                text = path.read_text(encoding='utf-8')
+        except (OSError, ValueError):
+            text = ''
+        docs = Path('docs').resolve()
+        assets = {}
+        for m in re.finditer(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)|<img\s[^>]*?src=["\']([^"\']+)', text):
+            url = m.group(1) or m.group(2)
+            # Notebook outputs are inlined as data: URIs; remote images are left to the browser
+            if url.startswith(('data:', '#', '/')) or '://' in url:
+                continue
+            target = (docs / url.split('#')[0].split('?')[0]).resolve()
+            if docs in target.parents and target.is_file():
+                assets[url] = target.stat().st_size
+        self._assets[key] = list(assets.items())
+        return self._assets[key]
+
+    def prefetch_urls(self, node):
+        """
+        The next page and then its largest local images, as long as they fit the per-page byte budget.
+        The page's size is estimated from its source (notebook outputs are inlined into the HTML).
+        """
+        try:
+            size = os.path.getsize(node.file)
+        except OSError:
+            return []
+        if not self.prefetch_budget or size > self.prefetch_budget:
+            debug_print(f"[INFO] Not prefetching {node.html}: {size // 1024} KB is over the prefetch budget", self.debug)
+            return []
+        urls, remaining = [node.html], self.prefetch_budget - size
+        for url, nbytes in sorted(self.page_assets(node.file), key=lambda asset: -asset[1]):
+            if nbytes <= remaining:
+                urls.append(url)
+                remaining -= nbytes
+        return urls
 
-    import re
-    def slugify(title):
-        # Lowercase, replace spaces with hyphens, remove non-alphanum except hyphens
-        slug = title.lower().strip()
-        slug = re.sub(r'\s+', '-', slug)
-        slug = re.sub(r'[^a-z0-9\-]', '', slug)
-        return slug
+    def page_links(self, file):
+        """(<head> links, prev/next navigation HTML) of a content page, following the toc's depth-first page order."""
+        import json
+        node = self.tree.by_file.get(Path(os.path.normpath(file)).as_posix())
+        if node is None:
+            return '', ''
+        head, nav = [], []
+        if node.prev:
+            head.append(f'<link rel="prev" href="{node.prev.html}">')
+            nav.append(f'<a class="page-nav-prev" rel="prev" href="{node.prev.html}"><span aria-hidden="true">&larr;</span> {node.prev.title}</a>')
+        if node.next:
+            head.append(f'<link rel="next" href="{node.next.html}">')
+            nav.append(f'<a class="page-nav-next" rel="next" href="{node.next.html}">{node.next.title} <span aria-hidden="true">&rarr;</span></a>')
+            urls = self.prefetch_urls(node.next)
+            if urls:
+                # Added from script so readers who asked to save data (metered connections) fetch nothing ahead
+                head.append(
+                    '<script>if (!(navigator.connection && navigator.connection.saveData)) '
+                    f'{json.dumps(urls)}.forEach(function (href) {{ var link = document.createElement(\'link\'); '
+                    'link.rel = \'prefetch\'; link.href = href; document.head.appendChild(link); });</script>'
+                )
+        nav_html = '<nav class="page-nav" aria-label="Previous and next page">' + ''.join(nav) + '</nav>' if nav else ''
+        return '\n  '.join(head), nav_html
 
-    def file_to_html_link(file_path, title, is_auto_index=False):
-        if is_auto_index:
-            base = slugify(title)
+    def _finish(self, full_html):
+        if self.critical:
+            full_html = self.critical.inline(full_html, self.css_theme)
+        return full_html
+
+    def render_children(self, children, level=1):
+        # Use h2/h3/h4 for subgroups, and always list grandchildren if present
+        html = []
+        for child in children:
+            child_title = child.title or '(untitled)'
+            link = f'<a href="{child.html}">{child_title}</a>'
+            if child.file and child.children:
+                # Submenu/group with a file: link and heading, then list grandchildren
+                heading_tag = f'h{min(level+1, 4)}'
+                html.append(f'<{heading_tag}>{link}</{heading_tag}>')
+                html.append(self.render_children(child.children, level+1))
+            elif child.file:
+                # Just a file
+                html.append(f'<li>{link}</li>')
+            elif child.children:
+                # Submenu/group with no file: heading, then list grandchildren
+                heading_tag = f'h{min(level+1, 4)}'
+                html.append(f'<{heading_tag}>{child_title}</{heading_tag}>')
+                html.append(self.render_children(child.children, level+1))
+        # Only wrap in <ul> if there are <li> children at this level
+        if any(x.startswith('<li>') for x in html):
+            return '<ul class="menu-section">' + ''.join(html) + '</ul>'
         else:
-            base, ext = os.path.splitext(os.path.basename(file_path))
-        return f'<a href="{base}.html">{title}</a>'
-
-    def first_child_file(node):
-        if 'children' in node:
-            for child in node['children']:
-                if isinstance(child, dict):
-                    if 'file' in child:
-                        return child['file']
-                    result = first_child_file(child)
-                    if result:
-                        return result
-        return None
+            return ''.join(html)
 
-    def top_level_menu_items(menu):
-        items = []
-        if isinstance(menu, list):
-            for node in menu:
-                if not isinstance(node, dict):
-                    continue
-                title = node.get('title')
-                file = node.get('file')
-                is_auto_index = False
-                if not file and node.get('children'):
-                    # This is an auto-generated index
-                    is_auto_index = True
-                    file = slugify(title) + '.html'
-                elif file:
-                    # Use the file as normal
-                    pass
-                if title and (file or node.get('children')):
-                    items.append((file, title, node, is_auto_index))
-        return items
-
-    top_menu = top_level_menu_items(menu)
-
-    menu_html = ['<ul class="site-nav-menu" id="site-nav-menu">']
-    for file, title, _, is_auto_index in top_menu:
-        menu_html.append('<li>')
-        menu_html.append(file_to_html_link(file, title, is_auto_index=is_auto_index))
-        menu_html.append('</li>')
-    menu_html.append('</ul>')
-    menu_html = ''.join(menu_html)
-
-    footer_text = content.get('footer', {}).get('text', '')
-    # Load footer from template and fill variable
-    with open('static/templates/footer.html', 'r', encoding='utf-8') as f:
-        footer_html = f.read().replace('{{ footer_text }}', footer_text)
-
-    # Load header HTML from template and fill variables
-    logo = site['logo']
-    title = site['title']
-    description = site.get('description', '')
-    logo_web = './' + logo[len('static/'):] if logo.startswith('static/') else logo
-    with open('static/templates/header.html', 'r', encoding='utf-8') as f:
-        header_html = f.read()
-    header_html = (header_html
-        .replace('{{ logo_web }}', logo_web)
-        .replace('{{ title }}', title)
-        .replace('{{ description }}', description)
-    )
+    def render_index(self, node):
+        """Auto-generated index page of a top-level menu group without a file."""
+        title = node.title
+        section_html = f'<h2>{title}</h2>'
+        if node.description:
+            section_html += f'<div class="menu-description">{node.description}</div>'
+        section_html += self.render_children(node.children)
+        head_html = self.head_html(title)
+        full_html = f'''<!DOCTYPE html>\n<html lang="{self.language}">\n{head_html}\n<body>\n  {self.header_html}\n  <nav class="site-nav" id="site-nav" aria-label="Main navigation">{self.menu_html}</nav>\n  <main class="site-main container">\n    {self.theme_toggle_html}\n    {section_html}\n  </main>\n  <footer>\n    {self.footer_html}\n  </footer>\n</body>\n</html>\n'''
+        return self._finish(full_html)
 
-    # Load theme toggle HTML from template
-    with open('static/templates/theme-toggle.html', 'r', encoding='utf-8') as f:
-        theme_toggle_html = f.read()
+    def render_body(self, file_path):
+        """Body HTML of a markdown or notebook file, or None if it has nothing to render."""
+        debug = self.debug
+        ext = file_path.suffix.lower()
+        debug_print(f"[DEBUG] File extension: {ext}", debug)
+        if ext == '.md':
+            markdown = import_markdown()
+            debug_print(f"[DEBUG] Reading markdown file: {file_path}", debug)
+            with open(file_path, 'r', encoding='utf-8') as f:
+                md_content = f.read()
+            debug_print(f"[DEBUG] Rendering markdown to HTML...", debug)
+            return markdown.markdown(md_content, extensions=['extra', 'toc', 'tables'])
+        if ext != '.ipynb':
+            debug_print(f"[SKIP] Unsupported file type: {file_path}", debug)
+            return None
+        markdown = import_markdown()
+        import nbformat
+        debug_print(f"[DEBUG] Reading notebook file: {file_path}", debug)
+        try:
+            nb = nbformat.read(str(file_path), as_version=4)
+        except Exception as e:
+            debug_print(f"[ERROR] Could not read notebook: {file_path}: {e}", debug)
+            return None
+        debug_print(f"[DEBUG] Notebook loaded. Keys: {list(nb.keys())}", debug)
+        if not nb.get('cells'):
+            debug_print(f"[WARN] Notebook {file_path} has no cells.", debug)
+            return None
+        debug_print(f"[DEBUG] Notebook {file_path} has {len(nb['cells'])} cells.", debug)
+        body_html = []
+        for idx, cell in enumerate(nb.get('cells', [])):
+            debug_print(f"[DEBUG] Processing cell {idx+1} of type {cell.get('cell_type')}", debug)
+            cell_type = cell.get('cell_type')
+            lang = cell.get('metadata', {}).get('language', 'python' if cell_type == 'code' else 'markdown')
+            debug_print(f"[DEBUG] Cell {idx}: type={cell_type}, lang={lang}", debug)
+            if cell_type == 'markdown':
+                try:
+                    debug_print(f"[DEBUG] Rendering markdown cell {idx+1}", debug)
+                    cell_html = markdown.markdown(''.join(cell.get('source', [])), extensions=['extra', 'toc', 'tables'])
+                    body_html.append(f'<div class="notebook-markdown-cell">{cell_html}</div>')
+                except Exception as e:
+                    debug_print(f"[ERROR] Failed to render markdown cell {idx+1} in {file_path}: {e}", debug)
+            elif cell_type == 'code':
+                debug_print(f"[DEBUG] Rendering code cell {idx+1}", debug)
+                code = ''.join(cell.get('source', []))
+                code_html = f'<pre class="notebook-code-cell"><code>{code}</code></pre>'
+                outputs_html = []
+                for oidx, output in enumerate(cell.get('outputs', [])):
+                    otype = output.get('output_type')
+                    debug_print(f"[DEBUG]   Output {oidx+1}: type={otype}", debug)
+                    try:
+                        if otype == 'stream':
+                            text = ''.join(output.get('text', []))
+                            outputs_html.append(f'<div class="notebook-output-stream">{text}</div>')
+                        elif otype == 'execute_result' or otype == 'display_data':
+                            data = output.get('data', {})
+                            if 'text/plain' in data:
+                                outputs_html.append(f'<div class="notebook-output-text">{data["text/plain"]}</div>')
+                            if 'image/png' in data:
+                                img_data = data['image/png']
+                                outputs_html.append(f'<img class="notebook-output-img" src="data:image/png;base64,{img_data}" />')
+                            if 'image/jpeg' in data:
+                                img_data = data['image/jpeg']
+                                outputs_html.append(f'<img class="notebook-output-img" src="data:image/jpeg;base64,{img_data}" />')
+                            if 'text/html' in data:
+                                outputs_html.append(f'<div class="notebook-output-html">{data["text/html"]}</div>')
+                        elif otype == 'error':
+                            ename = output.get('ename', '')
+                            evalue = output.get('evalue', '')
+                            traceback = output.get('traceback', [])
+                            tb_html = '<br>'.join(traceback)
+                            outputs_html.append(f'<div class="notebook-output-error"><b>{ename}: {evalue}</b><br>{tb_html}</div>')
+                    except Exception as e:
+                        debug_print(f"[ERROR] Failed to render output {oidx+1} in code cell {idx+1} in {file_path}: {e}", debug)
+                cell_block = code_html + ''.join(outputs_html)
+                body_html.append(f'<div class="notebook-code-cell-block">{cell_block}</div>')
+        return '\n'.join(body_html)
+
+    def render_file(self, file):
+        """Full HTML page for a markdown or notebook file, or None if it has nothing to render."""
+        file_path = Path(file)
+        download_html = render_download_buttons(str(file_path))
+        body_html = self.render_body(file_path)
+        if not body_html:
+            debug_print(f"[WARN] No content generated for {file_path}, skipping HTML output.", self.debug)
+            return None
+        head_links, page_nav_html = self.page_links(file)
+        full_html = self.page_template \
+            .replace('{{ language }}', self.language) \
+            .replace('{{ head_html }}', self.head_html(self.page_title, head_links)) \
+            .replace('{{ header_html }}', self.header_html) \
+            .replace('{{ menu_html }}', self.menu_html) \
+            .replace('{{ theme_toggle_html }}', self.theme_toggle_html) \
+            .replace('{{ download_html }}', download_html) \
+            .replace('{{ body_html }}', body_html) \
+            .replace('{{ page_nav_html }}', page_nav_html) \
+            .replace('{{ footer_html }}', self.footer_html)
+        return self._finish(full_html)
 
-    head_path = os.path.join('static', 'templates', 'head.html')
-    with open(head_path, 'r') as f:
-        head_template = f.read()
-    css_light = 'css/theme-light.css'
-    css_dark = 'css/theme-dark.css'
 
-    import nbformat
-    import base64
+@metrics_stage('html')
+def build_html_for_files(files, debug=False, critical_css=False):
+    import time
+    import build_metrics
+    from output_writer import write_if_changed
+    from notebook_kernel_utils import fix_all_notebook_kernels
+    # Always fix kernels before building
+    fix_all_notebook_kernels("content/", debug=debug)
+    debug_print("[DEBUG] build_html_for_files() is running!", debug)
+    """
+    Build HTML for specified markdown and notebook files using YAML-driven templates and navigation.
+    debug: if True, print debug output for menu and notebook processing.
+    critical_css: if True, inline each page's above-the-fold CSS and load the stylesheet asynchronously.
+    """
+    renderer = HtmlRenderer(critical_css=critical_css, debug=debug)
+
     debug_print(f"[DEBUG] build_html_for_files called with {len(files)} files:", debug)
     for f in files:
         debug_print(f"  - {f}", debug)
@@ -355,50 +800,11 @@ def build_html_for_files(files, debug=False):
     missing_files = []
 
     # --- Auto-generate index pages for top-level menus with no file ---
-    for file, title, node, is_auto_index in top_menu:
-        if is_auto_index:
-            # Always generate at slugified-title.html for auto-indexes
-            slug = slugify(title)
-            out_path = Path('docs') / f"{slug}.html"
-            # Build a list of children (and grandchildren)
-            def render_children(children, level=1):
-                html = []
-                for child in children:
-                    if not isinstance(child, dict):
-                        continue
-                    child_title = child.get('title', '(untitled)')
-                    child_file = child.get('file')
-                    child_children = child.get('children')
-                    # Use h2/h3/h4 for subgroups, and always list grandchildren if present
-                    if child_file and child_children:
-                        # Submenu/group with a file: link and heading, then list grandchildren
-                        heading_tag = f'h{min(level+1, 4)}'
-                        html.append(f'<{heading_tag}>{file_to_html_link(child_file, child_title)}</{heading_tag}>')
-                        html.append(render_children(child_children, level+1))
-                    elif child_file:
-                        # Just a file
-                        html.append(f'<li>{file_to_html_link(child_file, child_title)}</li>')
-                    elif child_children:
-                        # Submenu/group with no file: heading, then list grandchildren
-                        heading_tag = f'h{min(level+1, 4)}'
-                        html.append(f'<{heading_tag}>{child_title}</{heading_tag}>')
-                        html.append(render_children(child_children, level+1))
-                # Only wrap in <ul> if there are <li> children at this level
-                if any(x.startswith('<li>') for x in html):
-                    return '<ul class="menu-section">' + ''.join(html) + '</ul>'
-                else:
-                    return ''.join(html)
-            section_html = f'<h2>{title}</h2>'
-            if node.get('description'):
-                section_html += f'<div class="menu-description">{node["description"]}</div>'
-            section_html += render_children(node['children'])
-            page_title = title
-            head_html = head_template.replace('{{ title }}', page_title).replace('{{ css_light }}', css_light).replace('{{ css_dark }}', css_dark)
-            full_html = f'''<!DOCTYPE html>\n<html lang="{site.get('language', 'en')}">\n{head_html}\n<body>\n  {header_html}\n  <nav class="site-nav" id="site-nav" aria-label="Main navigation">{menu_html}</nav>\n  <main class="site-main container">\n    {theme_toggle_html}\n    {section_html}\n  </main>\n  <footer>\n    {footer_html}\n  </footer>\n</body>\n</html>\n'''
-            out_path.parent.mkdir(exist_ok=True)
-            with open(out_path, 'w', encoding='utf-8') as f:
-                f.write(full_html)
-            debug_print(f"[OK] Auto-generated index page: {out_path}", debug)
+    for name, node in renderer.index_pages.items():
+        # Always generate at slugified-title.html for auto-indexes
+        out_path = Path('docs') / name
+        write_if_changed(out_path, renderer.render_index(node))
+        debug_print(f"[OK] Auto-generated index page: {out_path}", debug)
 
     # --- Normal file build logic ---
     for file in files:
@@ -409,109 +815,29 @@ def build_html_for_files(files, debug=False):
             debug_print(f"[ERROR] File not found: {file}", debug)
             missing_files.append(file)
             continue
-        ext = file_path.suffix.lower()
-        debug_print(f"[DEBUG] File extension: {ext}", debug)
         try:
-            download_html = render_download_buttons(str(file_path))
-            if ext == '.md':
-                debug_print(f"[DEBUG] Reading markdown file: {file_path}", debug)
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    md_content = f.read()
-                debug_print(f"[DEBUG] Rendering markdown to HTML...", debug)
-                body_html = markdown.markdown(md_content, extensions=['extra', 'toc', 'tables'])
-            elif ext == '.ipynb':
-                debug_print(f"[DEBUG] Reading notebook file: {file_path}", debug)
-                try:
-                    nb = nbformat.read(str(file_path), as_version=4)
-                except Exception as e:
-                    debug_print(f"[ERROR] Could not read notebook: {file_path}: {e}", debug)
-                    continue
-                debug_print(f"[DEBUG] Notebook loaded. Keys: {list(nb.keys())}", debug)
-                if not nb.get('cells'):
-                    debug_print(f"[WARN] Notebook {file_path} has no cells.", debug)
-                    continue
-                debug_print(f"[DEBUG] Notebook {file_path} has {len(nb['cells'])} cells.", debug)
-                body_html = []
-                for idx, cell in enumerate(nb.get('cells', [])):
-                    debug_print(f"[DEBUG] Processing cell {idx+1} of type {cell.get('cell_type')}", debug)
-                    cell_type = cell.get('cell_type')
-                    lang = cell.get('metadata', {}).get('language', 'python' if cell_type == 'code' else 'markdown')
-                    debug_print(f"[DEBUG] Cell {idx}: type={cell_type}, lang={lang}", debug)
-                    if cell_type == 'markdown':
-                        import markdown as mdmod
-                        try:
-                            debug_print(f"[DEBUG] Rendering markdown cell {idx+1}", debug)
-                            cell_html = mdmod.markdown(''.join(cell.get('source', [])), extensions=['extra', 'toc', 'tables'])
-                            body_html.append(f'<div class="notebook-markdown-cell">{cell_html}</div>')
-                        except Exception as e:
-                            debug_print(f"[ERROR] Failed to render markdown cell {idx+1} in {file_path}: {e}", debug)
-                    elif cell_type == 'code':
-                        debug_print(f"[DEBUG] Rendering code cell {idx+1}", debug)
-                        code = ''.join(cell.get('source', []))
-                        code_html = f'<pre class="notebook-code-cell"><code>{code}</code></pre>'
-                        outputs_html = []
-                        for oidx, output in enumerate(cell.get('outputs', [])):
-                            otype = output.get('output_type')
-                            debug_print(f"[DEBUG]   Output {oidx+1}: type={otype}", debug)
-                            try:
-                                if otype == 'stream':
-                                    text = ''.join(output.get('text', []))
-                                    outputs_html.append(f'<div class="notebook-output-stream">{text}</div>')
-                                elif otype == 'execute_result' or otype == 'display_data':
-                                    data = output.get('data', {})
-                                    if 'text/plain' in data:
-                                        outputs_html.append(f'<div class="notebook-output-text">{data["text/plain"]}</div>')
-                                    if 'image/png' in data:
-                                        img_data = data['image/png']
-                                        outputs_html.append(f'<img class="notebook-output-img" src="data:image/png;base64,{img_data}" />')
-                                    if 'image/jpeg' in data:
-                                        img_data = data['image/jpeg']
-                                        outputs_html.append(f'<img class="notebook-output-img" src="data:image/jpeg;base64,{img_data}" />')
-                                    if 'text/html' in data:
-                                        outputs_html.append(f'<div class="notebook-output-html">{data["text/html"]}</div>')
-                                elif otype == 'error':
-                                    ename = output.get('ename', '')
-                                    evalue = output.get('evalue', '')
-                                    traceback = output.get('traceback', [])
-                                    tb_html = '<br>'.join(traceback)
-                                    outputs_html.append(f'<div class="notebook-output-error"><b>{ename}: {evalue}</b><br>{tb_html}</div>')
-                            except Exception as e:
-                                debug_print(f"[ERROR] Failed to render output {oidx+1} in code cell {idx+1} in {file_path}: {e}", debug)
-                        cell_block = code_html + ''.join(outputs_html)
-                        body_html.append(f'<div class="notebook-code-cell-block">{cell_block}</div>')
-                body_html = '\n'.join(body_html)
-            else:
-                debug_print(f"[SKIP] Unsupported file type: {file}", debug)
-                continue
-            if not body_html:
-                debug_print(f"[WARN] No content generated for {file_path}, skipping HTML output.", debug)
+            start = time.perf_counter()
+            full_html = renderer.render_file(file_path)
+            if full_html is None:
                 continue
-            page_title = title
-            head_html = head_template.replace('{{ title }}', page_title).replace('{{ css_light }}', css_light).replace('{{ css_dark }}', css_dark)
-            # Use page skeleton template
-            with open('static/templates/page.html', 'r', encoding='utf-8') as f:
-                page_template = f.read()
-            full_html = page_template \
-                .replace('{{ language }}', site.get('language', 'en')) \
-                .replace('{{ head_html }}', head_html) \
-                .replace('{{ header_html }}', header_html) \
-                .replace('{{ menu_html }}', menu_html) \
-                .replace('{{ theme_toggle_html }}', theme_toggle_html) \
-                .replace('{{ download_html }}', download_html) \
-                .replace('{{ body_html }}', body_html) \
-                .replace('{{ footer_html }}', footer_html)
             out_dir = Path('docs')
             out_dir.mkdir(exist_ok=True)
             out_name = file_path.stem + '.html'
             out_path = out_dir / out_name
+            build_metrics.record_file(file, time.perf_counter() - start, len(full_html.encode('utf-8')))
             try:
-                with open(out_path, 'w', encoding='utf-8') as f:
-                    f.write(full_html)
-                debug_print(f"[OK] Built {out_path} from {file}", debug)
+                if write_if_changed(out_path, full_html):
+                    debug_print(f"[OK] Built {out_path} from {file}", debug)
+                else:
+                    debug_print(f"[CACHE] Unchanged: {out_path}", debug)
             except Exception as e:
                 debug_print(f"[ERROR] Failed to write HTML file {out_path}: {e}", debug)
         except Exception as e:
             debug_print(f"[FATAL] Unexpected error processing {file}: {e}", debug)
+    if renderer.critical:
+        print(f"[INFO] Critical CSS: {renderer.critical.summary()}")
+        stats = renderer.critical.stats
+        build_metrics.record_cache('critical_css', stats['cached'], stats['computed'])
     if missing_files:
         debug_print(f"[SUMMARY] {len(missing_files)} file(s) were missing and not processed:", debug)
         for mf in missing_files:
@@ -519,55 +845,61 @@ def build_html_for_files(files, debug=False):
         # Always output a valid HTML page with .container for any fallback or summary
         # (This block is only for summary, not for outputting a page, so no fallback HTML is written here)
 
-import subprocess
+def ensure_kernel():
+    """Register the open-physics-ed Jupyter kernel if it is not registered yet."""
+    try:
+        import ipykernel
+        import jupyter_client.kernelspec
+        ksm = jupyter_client.kernelspec.KernelSpecManager()
+        if 'open-physics-ed' in ksm.find_kernel_specs():
+            print('[OK] Jupyter kernel "open-physics-ed" already registered.')
+            return
+        print('[INFO] Registering Jupyter kernel: open-physics-ed')
+        import subprocess
+        result = subprocess.run([
+            sys.executable, '-m', 'ipykernel', 'install', '--user', '--name', 'open-physics-ed', '--display-name', 'Python (open-physics-ed)'
+        ], capture_output=True, text=True)
+        if result.returncode == 0:
+            print('[OK] Registered Jupyter kernel: open-physics-ed')
+        else:
+            print('[ERROR] Failed to register kernel:')
+            print(result.stderr)
+    except Exception as e:
+        print(f'[ERROR] Could not ensure Jupyter kernel: {e}')
+
+@metrics_stage('execute')
+def execute_notebooks_for_files(files=None, debug=False):
+    """Execute notebooks whose code or environment changed on the open-physics-ed kernel pool; exit nonzero on failure."""
+    import build_metrics
+    from execute_notebooks import execute_notebooks
+    if files:
+        files = [f for f in files if f.lower().endswith('.ipynb')]
+        if not files:
+            print("[INFO] No notebooks among --files; nothing to execute.")
+            return
+    ensure_kernel()
+    counts = execute_notebooks(files=files, debug=debug)
+    build_metrics.record_cache('notebook_execution', counts['cached'], counts['executed'] + counts['failed'])
+    if counts['failed']:
+        sys.exit(1)
+
+@metrics_stage('jupyter')
 def build_jupyter_for_files(debug=False):
     """
     Orchestrate a robust Jupyter Book build:
-    1. Generate flat _toc.yml
+    1. Generate flat _toc.yml (written only if changed)
     2. Fix notebook kernels
     3. Validate TOC and kernels
+       (steps 1-3 run in-process, see jb_prep.py)
     4. Build Jupyter Book
+    5. Sync the HTML output into docs/jupyter-book
     """
-    def run_script(cmd, desc):
-        import subprocess
-        print(f"[JUPYTER BUILD] {desc}...\n  $ {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"[ERROR] {desc} failed:\n{result.stderr}")
-            raise RuntimeError(f"Step failed: {desc}")
-        if debug:
-            print(result.stdout)
-    # 1. Generate flat _toc.yml
-    run_script([sys.executable, 'convert_content_to_jb_flat.py'], 'Generate flat _toc.yml')
-    # 2. Fix notebook kernels
-    run_script([sys.executable, 'fix_notebook_kernels.py'], 'Fix notebook kernels')
-    # 2.5. Ensure the Jupyter kernel is registered (idempotent)
-    import sys as _sys
-    def ensure_kernel():
-        try:
-            import ipykernel
-            import jupyter_client.kernelspec
-            ksm = jupyter_client.kernelspec.KernelSpecManager()
-            if 'open-physics-ed' in ksm.find_kernel_specs():
-                print('[OK] Jupyter kernel "open-physics-ed" already registered.')
-                return
-            print('[INFO] Registering Jupyter kernel: open-physics-ed')
-            import subprocess
-            result = subprocess.run([
-                _sys.executable, '-m', 'ipykernel', 'install', '--user', '--name', 'open-physics-ed', '--display-name', 'Python (open-physics-ed)'
-            ], capture_output=True, text=True)
-            if result.returncode == 0:
-                print('[OK] Registered Jupyter kernel: open-physics-ed')
-            else:
-                print('[ERROR] Failed to register kernel:')
-                print(result.stderr)
-        except Exception as e:
-            print(f'[ERROR] Could not ensure Jupyter kernel: {e}')
+    # 1-3. Generate flat _toc.yml, fix notebook kernels, validate TOC and kernels (in-process)
+    import build_metrics
+    from jb_prep import prepare_jupyter_book
+    prepare_jupyter_book(debug=debug)
+    # Ensure the Jupyter kernel is registered (idempotent)
     ensure_kernel()
-    # 3. Validate TOC and kernels
-    run_script([sys.executable, 'validate_yaml.py', '_toc.yml'], 'Validate _toc.yml YAML')
-    run_script([sys.executable, 'validate_jb_toc.py', '_toc.yml'], 'Validate _toc.yml for duplicates')
-    run_script([sys.executable, 'check_notebook_kernels.py', '--debug'], 'Check notebook kernels')
     # 4. Build Jupyter Book
     # Run jupyter-book build . and stream output live for better feedback
     print('[JUPYTER BUILD] Jupyter Book build (jupyter-book build .)...\n  $ jupyter-book build .')
@@ -586,14 +918,13 @@ def build_jupyter_for_files(debug=False):
     proc.wait()
     if proc.returncode != 0:
         raise RuntimeError('Step failed: Jupyter Book build (jupyter-book build .)')
-        # Copy Jupyter Book HTML output to docs/jupyter-book/
+    # 5. Sync Jupyter Book HTML output into docs/jupyter-book/ (changed files only, swapped in atomically)
     src = '_build/html'
     dest = 'docs/jupyter-book'
     if os.path.exists(src):
-        if os.path.exists(dest):
-            shutil.rmtree(dest)
-        shutil.copytree(src, dest)
-        print(f'[JUPYTER BUILD] Copied Jupyter Book HTML from {src} to {dest}')
+        from sync_tree import sync_tree
+        counts = sync_tree(src, dest, debug=debug)
+        build_metrics.record_cache('jupyter_sync', counts['skipped'], counts['copied'])
     else:
         print(f'[JUPYTER BUILD] WARNING: Source directory {src} does not exist. No files copied.')
 
@@ -602,49 +933,76 @@ def main():
     parser.add_argument('--all', action='store_true', help='Build all outputs in sequence (md, docx, tex, pdf, jupyter, ipynb, html)')
     parser.add_argument('--html', action='store_true', help='Build HTML output')
     parser.add_argument('--ipynb', action='store_true', help='Copy Jupyter notebooks to flat _build/ipynb and docs/ipynb')
+    parser.add_argument('--execute', action='store_true', help='Re-execute notebooks whose code cells or environment changed (cached in _build/exec-cache/)')
     parser.add_argument('--md', action='store_true', help='Build Markdown output')
     parser.add_argument('--docx', action='store_true', help='Build DOCX output')
     parser.add_argument('--tex', action='store_true', help='Build LaTeX output')
     parser.add_argument('--pdf', action='store_true', help='Build PDF output')
     parser.add_argument('--jupyter', action='store_true', help='Build Jupyter Notebook output')
     parser.add_argument('--ppt', action='store_true', help='Build PowerPoint output')
+    parser.add_argument('--book', action='store_true', help='Build the whole course as a single PDF and EPUB (docs/book/)')
+    parser.add_argument('--critical-css', action='store_true', help='With --html or --serve: inline each page\'s above-the-fold CSS and load the theme stylesheet asynchronously')
+    parser.add_argument('--serve', action='store_true', help='Serve the site locally, rendering pages on demand (no writes to docs/); runs after any requested builds')
+    parser.add_argument('--port', type=int, default=8000, help='Port for --serve (default: 8000)')
+    parser.add_argument('--check-links', action='store_true', help='Check internal links and anchors in docs/ after building')
+    parser.add_argument('--gc-images', action='store_true', help='Remove published images whose source page left _content.yml, and unreferenced store objects')
     parser.add_argument('--files', nargs='+', help='Only build the specified files')
+    parser.add_argument('--artifact-cache', metavar='DIR_OR_URL', help='Shared artifact cache (directory or http(s) URL) for nbconvert, pandoc and LaTeX results; overrides BUILD_ARTIFACT_CACHE and build.artifact_cache')
+    parser.add_argument('--offline', action='store_true', help='Embed remote images only from the local mirror (_build/remote-cache/); never fetch')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of concurrent pandoc jobs for print builds (default: CPU count)')
     parser.add_argument('--debug', action='store_true', help='Print debug information about menu extraction')
     args = parser.parse_args()
+    # Summarize generated files (written vs unchanged) however the build exits
+    import atexit
+    from output_writer import report_outputs
+    atexit.register(report_outputs)
+    # Append this run's timings, output sizes and cache counters to _build/metrics.jsonl
+    import build_metrics
+    atexit.register(build_metrics.write_record)
+    if args.offline:
+        from remote_assets import get_remote_cache
+        get_remote_cache(offline=True)
+    if args.artifact_cache:
+        from artifact_cache import get_artifact_cache
+        get_artifact_cache(remote=args.artifact_cache)
 
+    # Notebook execution runs first so every later output sees fresh notebook outputs
+    if args.execute:
+        if args.debug:
+            print("[INFO] Notebook execution selected.")
+        execute_notebooks_for_files(files=args.files, debug=args.debug)
 
     # All build
     if args.all:
         if args.debug:
             print("[INFO] Full build (--all) selected.")
         build_md_all(debug=args.debug)
-        build_docx_all(debug=args.debug)
-        build_tex_all(debug=args.debug)
-        build_pdf_all(debug=args.debug)
+        # docx, tex and pdf share one cached pandoc AST per source
+        build_print_all(['docx', 'tex', 'pdf'], debug=args.debug, jobs=args.jobs)
         build_jupyter_for_files(debug=args.debug)
         # IPYNB flat copy build
-        cmd = [sys.executable, 'copy_ipynb_flat.py']
-        if args.debug:
-            cmd.append('--debug')
-        print(f"[INFO] Running: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=False)
-        if result.returncode != 0:
-            print(f"[ERROR] copy_ipynb_flat.py failed with exit code {result.returncode}")
-            sys.exit(result.returncode)
-        build_html_all(debug=args.debug)
+        publish_ipynb_flat(debug=args.debug)
+        build_html_all(debug=args.debug, critical_css=args.critical_css)
+        # Every live image was just republished, so anything else in docs/images is stale
+        gc_images(sweep=True, debug=args.debug)
+        if args.check_links:
+            run_link_check(debug=args.debug)
+        if args.serve:
+            serve_preview(args)
         return
-    # LaTeX build
-    if args.tex:
+    # Print builds (DOCX, LaTeX, PDF) run together from one cached pandoc AST per source
+    print_formats = [fmt for fmt in PRINT_FORMATS if getattr(args, fmt)]
+    if print_formats:
         if args.debug:
-            print("[INFO] LaTeX build selected.")
+            print(f"[INFO] Print build selected: {', '.join(print_formats)}")
         if args.files:
             if args.debug:
-                print(f"[INFO] Building LaTeX for specified files: {args.files}")
-            build_tex_for_files(args.files, debug=args.debug)
+                print(f"[INFO] Building {', '.join(print_formats)} for specified files: {args.files}")
+            build_print_for_files(args.files, print_formats, debug=args.debug, jobs=args.jobs)
         else:
             if args.debug:
-                print("[INFO] Building LaTeX for all content.")
-            build_tex_all(debug=args.debug)
+                print("[INFO] Building print formats for all content.")
+            build_print_all(print_formats, debug=args.debug, jobs=args.jobs)
 
     if args.debug:
         print("[INFO] Build flags:")
@@ -670,26 +1028,15 @@ def main():
         if args.files:
             if args.debug:
                 print(f"[INFO] Building HTML for specified files: {args.files}")
-            build_html_for_files(args.files, debug=args.debug)
+            build_html_for_files(args.files, debug=args.debug, critical_css=args.critical_css)
         else:
             if args.debug:
                 print("[INFO] Building HTML for all content.")
-            build_html_all(debug=args.debug)
+            build_html_all(debug=args.debug, critical_css=args.critical_css)
     
     # IPYNB flat copy build
     if args.ipynb:
-        cmd = [sys.executable, 'copy_ipynb_flat.py']
-        if args.files:
-            cmd.append('--files')
-            cmd.extend(args.files)
-        if args.debug:
-            cmd.append('--debug')
-        print(f"[INFO] Running: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=False)
-        if result.returncode != 0:
-            print(f"[ERROR] copy_ipynb_flat.py failed with exit code {result.returncode}")
-            sys.exit(result.returncode)
-        return
+        publish_ipynb_flat(files=args.files, debug=args.debug)
     
     # Markdown build
     if args.md:
@@ -703,30 +1050,60 @@ def main():
             if args.debug:
                 print("[INFO] Building Markdown for all content.")
             build_md_all(debug=args.debug)
-    if args.docx:
-        if args.debug:
-            print("[INFO] DOCX build selected.")
-        if args.files:
-            if args.debug:
-                print(f"[INFO] Building DOCX for specified files: {args.files}")
-            build_docx_for_files(args.files, debug=args.debug)
-        else:
-            if args.debug:
-                print("[INFO] Building DOCX for all content.")
-            build_docx_all(debug=args.debug)
-    
-    if args.pdf:
+
+    if args.book:
         if args.debug:
-            print("[INFO] PDF build selected.")
-        if args.files:
-            if args.debug:
-                print(f"[INFO] Building PDF for specified files: {args.files}")
-            build_pdf_for_files(args.files, debug=args.debug)
-        else:
-            if args.debug:
-                print("[INFO] Building PDF for all content.")
-            build_pdf_all(debug=args.debug)
-    
+            print("[INFO] Book build selected.")
+        build_book_all(debug=args.debug, jobs=args.jobs)
+
+    if args.gc_images:
+        gc_images(debug=args.debug)
+
+    if args.check_links:
+        run_link_check(debug=args.debug)
+
+    if args.serve:
+        serve_preview(args)
+
+def serve_preview(args):
+    """Run the on-demand preview server (preview_server.py) until interrupted."""
+    from preview_server import serve
+    serve(port=args.port, critical_css=args.critical_css, debug=args.debug)
+
+@metrics_stage('ipynb')
+def publish_ipynb_flat(files=None, debug=False):
+    """Publish notebooks flat to _build/ipynb and docs/ipynb (in-process); exit nonzero on failure."""
+    from copy_ipynb_flat import copy_ipynb_flat, NotebookNameCollision
+    try:
+        counts = copy_ipynb_flat(files=files, debug=debug)
+    except NotebookNameCollision as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    if counts['failed']:
+        sys.exit(1)
+
+@metrics_stage('gc_images')
+def gc_images(sweep=False, debug=False):
+    """
+    Garbage-collect the image store: drop images owned by pages no longer in _content.yml and
+    store objects nothing references. With sweep, also delete files the store created in docs/images
+    that nothing references any more (only safe right after a full build; other files are kept).
+    """
+    from content_parser import load_and_validate_content_yml, get_all_content_files
+    from image_store import get_store
+    content = load_and_validate_content_yml('_content.yml')
+    live = {Path(f).stem for f in get_all_content_files(content)}
+    img_dir = Path(__file__).parent.resolve() / 'docs' / 'images'
+    get_store().gc(live_sources=live, sweep=[img_dir] if sweep else (), debug=debug)
+
+@metrics_stage('check_links')
+def run_link_check(debug=False):
+    """Check every internal link and anchor in docs/; exit nonzero if any are broken."""
+    from check_links import check_links
+    broken = check_links('docs', debug=debug)
+    if broken:
+        sys.exit(1)
+
 def build_docx_all(debug=False):
     """Build DOCX for all files referenced in the menu/content tree (_content.yml)."""
     from content_parser import load_and_validate_content_yml, get_all_content_files
@@ -740,108 +1117,10 @@ def build_docx_all(debug=False):
         print(f"[INFO] Building DOCX for {len(files)} files from menu/content tree.")
     build_docx_for_files(files, debug=debug)
 
-def build_docx_for_files(files, debug=False):
+def build_docx_for_files(files, debug=False, jobs=None):
     """Build DOCX for specified markdown and notebook files."""
-    import subprocess
-    import sys
-    import os
-    from pathlib import Path
-    import shutil
-    import re
-    repo_root = Path(__file__).parent.resolve()
-    img_dir = repo_root / 'docs' / 'images'
-    docx_dir = repo_root / 'docs' / 'docx'
-    img_dir.mkdir(parents=True, exist_ok=True)
-    docx_dir.mkdir(parents=True, exist_ok=True)
-    missing_files = []
-    for file in files:
-        file_path = Path(file)
-        if not file_path.exists():
-            print(f"[ERROR] File not found: {file}")
-            missing_files.append(file)
-            continue
-        ext = file_path.suffix.lower()
-        stem = file_path.stem
-        out_md = docx_dir / f"{stem}.md"
-        out_docx = docx_dir / f"{stem}.docx"
-        # Step 1: Ensure we have a markdown file with correct image links
-        if ext == '.md':
-            print(f"[INFO] Copying markdown file: {file_path} -> {out_md}")
-            shutil.copy2(file_path, out_md)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                md_content = f.read()
-            def replace_img_link(match):
-                img_path = match.group(1)
-                if img_path.startswith('http'):
-                    # Always replace remote images with a warning/placeholder for PDF export
-                    warning = '\\n> **[Image not embedded: remote images are not included in PDF export. Check the original file for the image.]**\\n'
-                    placeholder = f'![Image not embedded: remote image]({img_path})'
-                    if debug:
-                        print(f"[WARN] Replacing ALL remote images with placeholder: {img_path}")
-                    return warning + placeholder
-                img_filename = os.path.basename(img_path)
-                flat_name = f"{stem}_{img_filename}"
-                src_img = build_pdf_dir / img_path
-                dest_img = img_dir / flat_name
-                if src_img.exists():
-                    shutil.copy2(src_img, dest_img)
-                    if debug:
-                        print(f"[INFO] Copied image {src_img} -> {dest_img}")
-                rel_path = os.path.relpath(dest_img, build_pdf_dir)
-                return match.group(0).replace(img_path, rel_path)
-            new_md_content = re.sub(r'!\[[^\]]*\]\(([^)]+)\)', replace_img_link, md_content)
-            with open(out_md, 'w', encoding='utf-8') as f:
-                f.write(new_md_content)
-        elif ext == '.ipynb':
-            print(f"[INFO] Converting notebook to markdown: {file_path} -> {out_md}")
-            import nbformat
-            import subprocess
-            nb = nbformat.read(str(file_path), as_version=4)
-            tmp_md = docx_dir / f"{stem}_tmp.md"
-            cmd = [sys.executable, '-m', 'nbconvert', '--to', 'markdown', str(file_path), '--output', tmp_md.name, '--output-dir', str(docx_dir)]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                print(f"[ERROR] nbconvert failed for {file_path}: {result.stderr}")
-                continue
-            with open(tmp_md, 'r', encoding='utf-8') as f:
-                md_content = f.read()
-            def replace_img_link(match):
-                img_path = match.group(1)
-                if img_path.startswith('http'):
-                    # Always replace remote images with a warning/placeholder for PDF export
-                    warning = '\n> **[Image not embedded: remote images are not included in PDF export. Check the original file for the image.]**\n'
-                    placeholder = f'![Image not embedded: remote image]({img_path})'
-                    if debug:
-                        print(f"[WARN] Replacing ALL remote images with placeholder: {img_path}")
-                    return warning + placeholder
-                img_filename = os.path.basename(img_path)
-                flat_name = f"{stem}_{img_filename}"
-                src_img = docx_dir / img_path
-                dest_img = img_dir / flat_name
-                if src_img.exists():
-                    shutil.copy2(src_img, dest_img)
-                    print(f"[INFO] Copied image {src_img} -> {dest_img}")
-                rel_path = os.path.relpath(dest_img, docx_dir)
-                return match.group(0).replace(img_path, rel_path)
-            new_md_content = re.sub(r'!\[[^\]]*\]\(([^)]+)\)', replace_img_link, md_content)
-            with open(out_md, 'w', encoding='utf-8') as f:
-                f.write(new_md_content)
-            tmp_md.unlink()
-        else:
-            print(f"[SKIP] Unsupported file type: {file}")
-            continue
-        # Step 2: Convert markdown to docx with pandoc
-        print(f"[INFO] Converting markdown to docx: {out_md} -> {out_docx}")
-        cmd = ['pandoc', str(out_md), '-o', str(out_docx), '--resource-path', str(img_dir)]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"[ERROR] pandoc failed for {out_md}: {result.stderr}")
-            continue
-        print(f"[OK] Built {out_docx} from {file}")
-    if missing_files:
-        print(f"[SUMMARY] {len(missing_files)} file(s) were missing and not processed:")
-        for mf in missing_files:
-            print(f"  - {mf}")
+    build_print_for_files(files, ['docx'], debug=debug, jobs=jobs)
+
 import re
 import shutil
 from pathlib import Path
@@ -858,8 +1137,14 @@ def build_md_all(debug=False):
         print(f"[INFO] Building Markdown for {len(files)} files from menu/content tree.")
     build_md_for_files(files, debug=debug)
 
+@metrics_stage('md')
 def build_md_for_files(files, debug=False):
     """Build Markdown for specified markdown and notebook files."""
+    import time
+    import build_metrics
+    from image_store import get_store
+    from output_writer import write_if_changed
+    store = get_store()
     repo_root = Path(__file__).parent.resolve()
     md_dir = repo_root / 'docs' / 'md'
     img_dir = repo_root / 'docs' / 'images'
@@ -876,9 +1161,10 @@ def build_md_for_files(files, debug=False):
         ext = file_path.suffix.lower()
         stem = file_path.stem
         out_md = md_dir / f"{stem}.md"
+        published = []
+        start = time.perf_counter()
         if ext == '.md':
             print(f"[INFO] Copying markdown file: {file_path} -> {out_md}")
-            shutil.copy2(file_path, out_md)
             # Copy images referenced in the markdown
             with open(file_path, 'r', encoding='utf-8') as f:
                 md_content = f.read()
@@ -891,25 +1177,21 @@ def build_md_for_files(files, debug=False):
                 src_img = file_path.parent / img_path
                 dest_img = img_dir / flat_name
                 if src_img.exists():
-                    shutil.copy2(src_img, dest_img)
-                    print(f"[INFO] Copied image {src_img} -> {dest_img}")
+                    if store.publish(src_img, dest_img, owner=f"md:{stem}"):
+                        print(f"[INFO] Published image {src_img} -> {dest_img}")
+                    published.append(dest_img)
                 # Use ../images/ for correct relative path from docs/md/
                 return match.group(0).replace(img_path, f"../images/{flat_name}")
             new_md_content = re.sub(r'!\[[^\]]*\]\(([^)]+)\)', replace_img_link, md_content)
-            with open(out_md, 'w', encoding='utf-8') as f:
-                f.write(new_md_content)
+            write_if_changed(out_md, new_md_content)
         elif ext == '.ipynb':
             print(f"[INFO] Converting notebook to markdown: {file_path} -> {out_md}")
-            import nbformat
-            import subprocess
-            nb = nbformat.read(str(file_path), as_version=4)
-            tmp_md = md_dir / f"{stem}_tmp.md"
-            # Use nbconvert to convert to markdown
-            cmd = [sys.executable, '-m', 'nbconvert', '--to', 'markdown', str(file_path), '--output', tmp_md.name, '--output-dir', str(md_dir)]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
+            # Use nbconvert to convert to markdown (restored from the artifact cache when possible)
+            try:
+                tmp_md = nbconvert_markdown(file_path, md_dir, f"{stem}_tmp", debug=debug)
+            except RuntimeError as e:
                 if debug:
-                    print(f"[ERROR] nbconvert failed for {file_path}: {result.stderr}")
+                    print(f"[ERROR] {e}")
                 continue
             # Read and fix image links in the generated markdown
             with open(tmp_md, 'r', encoding='utf-8') as f:
@@ -923,19 +1205,26 @@ def build_md_for_files(files, debug=False):
                 src_img = md_dir / img_path
                 dest_img = img_dir / flat_name
                 if src_img.exists():
-                    shutil.copy2(src_img, dest_img)
-                    print(f"[INFO] Copied image {src_img} -> {dest_img}")
+                    if store.publish(src_img, dest_img, owner=f"md:{stem}"):
+                        print(f"[INFO] Published image {src_img} -> {dest_img}")
+                    published.append(dest_img)
                 # Use ../images/ for correct relative path from docs/md/
                 return match.group(0).replace(img_path, f"../images/{flat_name}")
             new_md_content = re.sub(r'!\[[^\]]*\]\(([^)]+)\)', replace_img_link, md_content)
-            with open(out_md, 'w', encoding='utf-8') as f:
-                f.write(new_md_content)
+            write_if_changed(out_md, new_md_content)
             tmp_md.unlink()  # Remove temp file
         else:
             if debug:
                 print(f"[SKIP] Unsupported file type: {file}")
             continue
+        store.retire(f"md:{stem}", published)
+        build_metrics.record_file(file, time.perf_counter() - start, out_md.stat().st_size)
         print(f"[OK] Built {out_md} from {file}")
+    store.save()
+    print(f"[INFO] Images: {store.summary()}")
+    from artifact_cache import get_artifact_cache
+    print(f"[INFO] Shared artifacts: {get_artifact_cache().summary()}")
+    record_cache_metrics(store, artifacts=get_artifact_cache())
     if missing_files:
         print(f"[SUMMARY] {len(missing_files)} file(s) were missing and not processed:")
         for mf in missing_files:
@@ -954,123 +1243,9 @@ def build_pdf_all(debug=False):
         print(f"[INFO] Building PDF for {len(files)} files from menu/content tree.")
     build_pdf_for_files(files, debug=debug)
 
-def build_pdf_for_files(files, debug=False):
+def build_pdf_for_files(files, debug=False, jobs=None):
     """Build PDF for specified markdown and notebook files."""
-    import subprocess
-    import sys
-    import os
-    from pathlib import Path
-    import shutil
-    import re
-    from sanitize_unicode import sanitize_text as sanitize_unicode
-    repo_root = Path(__file__).parent.resolve()
-    pdf_dir = repo_root / 'docs' / 'pdf'
-    build_pdf_dir = repo_root / '_build' / 'pdf'
-    img_dir = repo_root / 'docs' / 'images'
-    pdf_dir.mkdir(parents=True, exist_ok=True)
-    build_pdf_dir.mkdir(parents=True, exist_ok=True)
-    img_dir.mkdir(parents=True, exist_ok=True)
-    missing_files = []
-    for file in files:
-        file_path = Path(file)
-        if not file_path.exists():
-            if debug:
-                print(f"[ERROR] File not found: {file}")
-            missing_files.append(file)
-            continue
-        ext = file_path.suffix.lower()
-        stem = file_path.stem
-        out_md = build_pdf_dir / f"{stem}.md"
-        out_pdf = build_pdf_dir / f"{stem}.pdf"
-        # Step 1: Ensure we have a markdown file with correct image links
-        if ext == '.md':
-            if debug:
-                print(f"[INFO] Copying markdown file: {file_path} -> {out_md}")
-            shutil.copy2(file_path, out_md)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                md_content = f.read()
-            def replace_img_link(match):
-                img_path = match.group(1)
-                if img_path.startswith('http'):
-                    # Always replace remote images with a warning/placeholder for PDF export
-                    warning = '\n> **[Image not embedded: remote images are not included in PDF export. Check the original file for the image.]**\n'
-                    placeholder = f'![Image not embedded: remote image]({img_path})'
-                    if debug:
-                        print(f"[WARN] Replacing ALL remote images with placeholder: {img_path}")
-                    return warning + placeholder
-                img_filename = os.path.basename(img_path)
-                flat_name = f"{stem}_{img_filename}"
-                src_img = file_path.parent / img_path
-                dest_img = img_dir / flat_name
-                if src_img.exists():
-                    shutil.copy2(src_img, dest_img)
-                    if debug:
-                        print(f"[INFO] Copied image {src_img} -> {dest_img}")
-                # For pdf, use relative path from build_pdf_dir to img_dir
-                rel_path = os.path.relpath(dest_img, build_pdf_dir)
-                return match.group(0).replace(img_path, rel_path)
-            new_md_content = re.sub(r'!\[[^\]]*\]\(([^)]+)\)', replace_img_link, md_content)
-            sanitized_md_content = sanitize_unicode(new_md_content)
-            with open(out_md, 'w', encoding='utf-8') as f:
-                f.write(sanitized_md_content)
-        elif ext == '.ipynb':
-            if debug:
-                print(f"[INFO] Converting notebook to markdown: {file_path} -> {out_md}")
-            import nbformat
-            nb = nbformat.read(str(file_path), as_version=4)
-            tmp_md = build_pdf_dir / f"{stem}_tmp.md"
-            cmd = [sys.executable, '-m', 'nbconvert', '--to', 'markdown', str(file_path), '--output', tmp_md.name, '--output-dir', str(build_pdf_dir)]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                if debug:
-                    print(f"[ERROR] nbconvert failed for {file_path}: {result.stderr}")
-                continue
-            with open(tmp_md, 'r', encoding='utf-8') as f:
-                md_content = f.read()
-            def replace_img_link(match):
-                img_path = match.group(1)
-                if img_path.startswith('http'):
-                    # Always replace remote images with a warning/placeholder for PDF export
-                    warning = '\n> **[Image not embedded: remote images are not included in PDF export. Check the original file for the image.]**\n'
-                    placeholder = f'![Image not embedded: remote image]({img_path})'
-                    if debug:
-                        print(f"[WARN] Replacing ALL remote images with placeholder: {img_path}")
-                    return warning + placeholder
-                img_filename = os.path.basename(img_path)
-                flat_name = f"{stem}_{img_filename}"
-                src_img = build_pdf_dir / img_path
-                dest_img = img_dir / flat_name
-                if src_img.exists():
-                    shutil.copy2(src_img, dest_img)
-                    if debug:
-                        print(f"[INFO] Copied image {src_img} -> {dest_img}")
-                rel_path = os.path.relpath(dest_img, build_pdf_dir)
-                return match.group(0).replace(img_path, rel_path)
-            new_md_content = re.sub(r'!\[[^\]]*\]\(([^)]+)\)', replace_img_link, md_content)
-            with open(out_md, 'w', encoding='utf-8') as f:
-                f.write(new_md_content)
-            tmp_md.unlink()
-        else:
-            if debug:
-                print(f"[SKIP] Unsupported file type: {file}")
-            continue
-        # Step 2: Convert markdown to pdf with pandoc
-        if debug:
-            print(f"[INFO] Converting markdown to pdf: {out_md} -> {out_pdf}")
-        cmd = ['pandoc', str(out_md), '-o', str(out_pdf), '--resource-path', str(img_dir)]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            if debug:
-                print(f"[ERROR] pandoc failed for {out_md}: {result.stderr}")
-            continue
-        # Copy to docs/pdf as well
-        shutil.copy2(out_pdf, pdf_dir / f"{stem}.pdf")
-        if debug:
-            print(f"[OK] Built {out_pdf} and copied to {pdf_dir / f'{stem}.pdf'} from {file}")
-    if missing_files:
-        print(f"[SUMMARY] {len(missing_files)} file(s) were missing and not processed:")
-        for mf in missing_files:
-            print(f"  - {mf}")
+    build_print_for_files(files, ['pdf'], debug=debug, jobs=jobs)
 
 if __name__ == "__main__":
     main()
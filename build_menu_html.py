@@ -2,7 +2,7 @@
 build_menu_html.py
 
 Script to generate the HTML <nav> menu for the site, matching the structure and output of the current index.html navigation.
-- Uses menu_parser.get_menu_tree to extract the validated menu structure from _content.yml.
+- Queries the SiteTree (site_tree.py) of the validated _content.yml for the menu structure.
 - Outputs a single HTML <ul> structure suitable for direct inclusion in index.html or other templates.
 - Recursively builds dropdowns for children.
 - Converts .md/.ipynb to .html for links.
@@ -11,33 +11,25 @@ Script to generate the HTML <nav> menu for the site, matching the structure and
 Usage:
     python build_menu_html.py > menu.html
 """
-from menu_parser import get_menu_tree
-import os
-
-def file_to_html_link(file_path, title):
-    base, ext = os.path.splitext(os.path.basename(file_path))
-    return f'<a href="{base}.html">{title}</a>'
+from site_tree import load_site_tree
 
 def build_menu_ul(menu, level=0):
+    """Nested <ul> for a list of SiteTree nodes (e.g. tree.menu_items())."""
     html = []
     ul_class = 'site-nav-menu' if level == 0 else f'dropdown-menu menu-level-{level}'
     html.append(f'<ul class="{ul_class}">')
-    for item in menu:
-        title = item['title']
-        file = item.get('file')
-        children = item.get('children')
+    for node in menu:
         html.append('<li>')
-        if file:
-            html.append(file_to_html_link(file, title))
+        if node.file:
+            html.append(f'<a href="{node.html}">{node.title}</a>')
         else:
-            html.append(f'<span>{title}</span>')
-        if children:
-            html.append(build_menu_ul(children, level+1))
+            html.append(f'<span>{node.title}</span>')
+        if node.children:
+            html.append(build_menu_ul(node.children, level+1))
         html.append('</li>')
     html.append('</ul>')
     return ''.join(html)
 
 if __name__ == '__main__':
-    menu = get_menu_tree('_content.yml')
-    html = build_menu_ul(menu)
+    html = build_menu_ul(load_site_tree('_content.yml').menu_items())
     print(html)
@@ -0,0 +1,127 @@
+"""
+build_metrics.py
+
+Per-run build metrics: every build.py run appends one JSON line to _build/metrics.jsonl.
+- stage(name) times a build stage (html, md, print, execute, ...), as a decorator or context manager.
+  A stage entered again while it is running is counted once. build.py wraps its builders with
+  metrics_stage(name), which imports this module only when a builder runs.
+- record_file() files a source's duration and output size under the running stage (or a named group,
+  such as a print format); worker threads may call it.
+- record_cache() stores a cache's hit/miss counters. Caches count cumulatively per process, so the last
+  report of a run wins.
+- write_record() adds the total duration, the generated-output totals of output_writer and the peak
+  RSS of the process and of its largest child (pandoc, LaTeX, nbconvert), then appends the record.
+  Runs that entered no stage (--help, --serve alone) are not recorded.
+- scripts/build_report.py compares the latest record with a rolling baseline of earlier runs.
+
+Usage:
+    import build_metrics
+    @build_metrics.stage('html')
+    def build_html_all(...): ...
+    build_metrics.record_file('content/intro.md', 0.12, 5400)
+    build_metrics.record_cache('image_store', hits=40, misses=2)
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import ContextDecorator
+from pathlib import Path
+
+# BUILD_METRICS_PATH redirects the records (scripts/bench_startup.py keeps its runs out of the history)
+METRICS_PATH = Path(os.environ.get('BUILD_METRICS_PATH') or Path(__file__).parent.resolve() / '_build' / 'metrics.jsonl')
+METRICS_VERSION = 1
+
+_lock = threading.Lock()
+_started = time.time()
+_active = []      # (stage name, start) of running stages, outermost first
+_stages = {}      # stage -> seconds
+_files = {}       # group -> {file: {'seconds': float, 'bytes': int}}
+_caches = {}      # cache -> {'hits': int, 'misses': int}
+
+
+class stage(ContextDecorator):
+    """Time a build stage; nested entries of the same stage are folded into the outer one."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        with _lock:
+            _active.append((self.name, time.perf_counter()))
+        return self
+
+    def __exit__(self, *exc):
+        with _lock:
+            name, start = _active.pop()
+            if all(outer != name for outer, _ in _active):
+                _stages[name] = _stages.get(name, 0.0) + time.perf_counter() - start
+        return False
+
+
+def current_stage():
+    with _lock:
+        return _active[-1][0] if _active else 'build'
+
+
+def record_file(file, seconds, nbytes=None, group=None):
+    """Record how long file took (and how many bytes it produced) in group (default: the running stage)."""
+    group = group or current_stage()
+    with _lock:
+        entry = _files.setdefault(group, {}).setdefault(str(file), {'seconds': 0.0})
+        entry['seconds'] = round(entry['seconds'] + seconds, 4)
+        if nbytes is not None:
+            entry['bytes'] = entry.get('bytes', 0) + nbytes
+
+
+def record_cache(name, hits, misses):
+    """Record a cache's cumulative hit and miss counts."""
+    with _lock:
+        _caches[name] = {'hits': int(hits), 'misses': int(misses)}
+
+
+def peak_rss_mb():
+    """Peak resident set size in MB of this process and of its largest finished child, or None."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 / 1024 / 1024 if sys.platform == 'darwin' else 1 / 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, 1),
+    }
+
+
+def snapshot(argv=None):
+    """The metrics record of this run so far."""
+    from output_writer import output_counts
+    argv = sys.argv[1:] if argv is None else argv
+    with _lock:
+        record = {
+            'version': METRICS_VERSION,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(_started)),
+            'command': ' '.join(a for a in argv if a.startswith('--')),
+            'argv': list(argv),
+            'duration': round(time.time() - _started, 3),
+            'stages': {k: round(v, 3) for k, v in _stages.items()},
+            'files': {g: dict(sorted(files.items())) for g, files in _files.items()},
+            'caches': dict(_caches),
+        }
+    record['outputs'] = output_counts()
+    record['peak_rss_mb'] = peak_rss_mb()
+    return record
+
+
+def write_record(path=METRICS_PATH):
+    """Append this run's record to path (once stages have run). Never fails the build."""
+    import json
+    if not _stages:
+        return
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(snapshot(), sort_keys=True) + '\n')
+    except OSError as e:
+        print(f"[WARN] Could not append build metrics to {path}: {e}")
@@ -2,7 +2,7 @@
 build_top_menu_html.py
 
 Script to generate the top-level HTML <ul> menu for the site, with no submenus.
-- Uses menu_parser.get_menu_tree to extract the validated menu structure from _content.yml.
+- Queries the SiteTree (site_tree.py) of the validated _content.yml for the top-level menu items.
 - Outputs a single HTML <ul> structure with only top-level menu items (no dropdowns).
 - Converts .md/.ipynb to .html for links.
 - Prints the HTML to stdout.
@@ -10,24 +10,16 @@ Script to generate the top-level HTML <ul> menu for the site, with no submenus.
 Usage:
     python build_top_menu_html.py > top_menu.html
 """
-from menu_parser import get_menu_tree
-import os
-
-def file_to_html_link(file_path, title):
-    base, ext = os.path.splitext(os.path.basename(file_path))
-    return f'<a href="{base}.html">{title}</a>'
+from site_tree import load_site_tree
 
 if __name__ == '__main__':
-    menu = get_menu_tree('_content.yml')
     html = ['<ul class="site-nav-menu" id="site-nav-menu">']
-    for item in menu:
-        title = item['title']
-        file = item.get('file')
+    for node in load_site_tree('_content.yml').menu_items():
         html.append('<li>')
-        if file:
-            html.append(file_to_html_link(file, title))
+        if node.file:
+            html.append(f'<a href="{node.html}">{node.title}</a>')
         else:
-            html.append(f'<span>{title}</span>')
+            html.append(f'<span>{node.title}</span>')
         html.append('</li>')
     html.append('</ul>')
     print(''.join(html))
@@ -0,0 +1,200 @@
+"""
+check_links.py
+
+Parallel internal link and anchor checker for the generated site in docs/.
+- Parses every HTML page under docs/ exactly once, spread across a process pool.
+- Builds a global index of every file in the tree and every anchor id (id="..." / name="...") per page.
+- Resolves every relative href/src against that index in a single pass.
+- Reports broken targets (missing files, missing anchors, links escaping the site root) with file:line locations.
+- External links (http:, https:, mailto:, ...) are skipped by default.
+- Jinja/Sphinx templates shipped under docs/ (e.g. jupyter-book/_static/webpack-macros.html) are not
+  pages: HTML files inside _static/ or _templates/ directories are indexed but not scanned, and
+  templated URLs ({{ pathto(...) }}) are never reported. Pages are never skipped for their content.
+
+Usage:
+    python check_links.py [--root docs] [--jobs N] [--external] [--debug]
+    # or via the main build script:
+    python build.py --check-links
+"""
+import argparse
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import unquote, urlsplit
+
+HTML_SUFFIXES = ('.html', '.htm')
+# Attribute scanners run over the raw page text; this is much faster than a full
+# HTML parse on pages that embed megabytes of base64 plot output.
+LINK_RE = re.compile(r'''\s(href|src)\s*=\s*(?:"([^"]*)"|'([^']*)')''', re.IGNORECASE)
+ANCHOR_RE = re.compile(r'''\s(?:id|name)\s*=\s*(?:"([^"]*)"|'([^']*)')''', re.IGNORECASE)
+# Sphinx/Jupyter Book copy their theme's unrendered Jinja templates into these directories
+TEMPLATE_DIRS = ('_static', '_templates')
+
+
+def scan_page(path):
+    """
+    Scan a single HTML page. Returns (anchor_ids, links), where links is a list of
+    (line, attribute, url) tuples. Runs inside worker processes.
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    anchors = set()
+    for m in ANCHOR_RE.finditer(text):
+        anchors.add(m.group(1) if m.group(1) is not None else m.group(2))
+    links = []
+    line, pos = 1, 0
+    for m in LINK_RE.finditer(text):
+        url = m.group(2) if m.group(2) is not None else m.group(3)
+        if url.startswith('data:') or '{{' in url or '{%' in url:
+            continue
+        # Matches arrive in order, so count newlines incrementally
+        line += text.count('\n', pos, m.start())
+        pos = m.start()
+        links.append((line, m.group(1).lower(), url))
+    return anchors, links
+
+
+def is_template(rel):
+    """True for an unrendered template file (by its path relative to the site root)."""
+    return any(part in TEMPLATE_DIRS for part in rel.split(os.sep)[:-1])
+
+
+def _scan_page_task(args):
+    root, rel = args
+    try:
+        anchors, links = scan_page(os.path.join(root, rel))
+    except Exception as e:
+        return rel, set(), [], str(e)
+    return rel, anchors, links, None
+
+
+def build_site_index(root, jobs=None, debug=False):
+    """
+    Walk root once and parse every HTML page in parallel.
+    Returns (files, anchors, links) where files is a set of relative paths,
+    anchors maps page -> set of ids and links maps page -> list of (line, attr, url).
+    """
+    files = set()
+    pages = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        for name in filenames:
+            rel = os.path.normpath(os.path.join(rel_dir, name))
+            files.add(rel)
+            if name.lower().endswith(HTML_SUFFIXES) and not is_template(rel):
+                pages.append(rel)
+    if debug:
+        print(f"[INFO] Indexed {len(files)} files, {len(pages)} HTML pages under {root}")
+    anchors = {}
+    links = {}
+    jobs = jobs or os.cpu_count() or 1
+    tasks = [(root, rel) for rel in pages]
+    if jobs > 1 and len(pages) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_scan_page_task, tasks, chunksize=max(1, len(tasks) // (jobs * 4))))
+    else:
+        results = [_scan_page_task(t) for t in tasks]
+    for rel, page_anchors, page_links, error in results:
+        if error:
+            print(f"[ERROR] Could not read {os.path.join(root, rel)}: {error}")
+        anchors[rel] = page_anchors
+        links[rel] = page_links
+    return files, anchors, links
+
+
+def resolve_link(page, url, files, anchors):
+    """
+    Resolve one relative link found on page against the site index.
+    Returns None if the target exists, otherwise a short reason string.
+    """
+    parts = urlsplit(url)
+    path = unquote(parts.path)
+    fragment = unquote(parts.fragment)
+    if path:
+        target = os.path.normpath(os.path.join(os.path.dirname(page), path))
+        if target == '..' or target.startswith('..' + os.sep):
+            return 'points outside the site root'
+        if target not in files:
+            index = os.path.normpath(os.path.join(target, 'index.html'))
+            if index in files:
+                target = index
+            else:
+                return 'missing file'
+    else:
+        target = page
+    if fragment and target.lower().endswith(HTML_SUFFIXES):
+        if fragment not in anchors.get(target, ()):
+            return f"missing anchor '#{fragment}'"
+    return None
+
+
+def _is_external(url):
+    # Anything with a scheme (http:, mailto:, javascript:, ...) or protocol-relative
+    return url.startswith('//') or bool(urlsplit(url).scheme)
+
+
+def _check_external(urls, jobs=8, timeout=10):
+    """HEAD every distinct external http(s) URL; returns {url: reason} for failures."""
+    import urllib.request
+    def probe(url):
+        req = urllib.request.Request(url, method='HEAD', headers={'User-Agent': 'check_links.py'})
+        try:
+            with urllib.request.urlopen(req, timeout=timeout):
+                return url, None
+        except Exception as e:
+            return url, str(e)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return {url: reason for url, reason in pool.map(probe, sorted(urls)) if reason}
+
+
+def check_links(root='docs', jobs=None, external=False, debug=False):
+    """
+    Check every link in the generated site under root.
+    Returns a list of (page, line, url, reason) tuples for broken links.
+    """
+    if not os.path.isdir(root):
+        print(f"[ERROR] Site directory not found: {root}")
+        return [(root, 0, '', 'missing site root')]
+    files, anchors, links = build_site_index(root, jobs=jobs, debug=debug)
+    broken = []
+    external_refs = {}
+    checked = 0
+    for page in sorted(links):
+        for line, attr, url in links[page]:
+            if not url or url == '#':
+                continue
+            if _is_external(url):
+                if external and urlsplit(url).scheme.lower() in ('http', 'https'):
+                    external_refs.setdefault(url, []).append((page, line))
+                continue
+            checked += 1
+            reason = resolve_link(page, url, files, anchors)
+            if reason:
+                broken.append((page, line, url, reason))
+    if external_refs:
+        for url, reason in _check_external(external_refs).items():
+            for page, line in external_refs[url]:
+                broken.append((page, line, url, reason))
+    for page, line, url, reason in broken:
+        print(f"[BROKEN] {os.path.join(root, page)}:{line}: {url} ({reason})")
+    if broken:
+        print(f"[FAIL] {len(broken)} broken link(s) out of {checked} internal link(s) checked.")
+    else:
+        print(f"[OK] All {checked} internal links resolve.")
+    return broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check internal links and anchors in the generated site.")
+    parser.add_argument('--root', default='docs', help='Site directory to check (default: docs)')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--external', action='store_true', help='Also check external http(s) links (slow, needs network)')
+    parser.add_argument('--debug', action='store_true', help='Print debug information')
+    args = parser.parse_args()
+    broken = check_links(args.root, jobs=args.jobs, external=args.external, debug=args.debug)
+    sys.exit(1 if broken else 0)
+
+
+if __name__ == '__main__':
+    main()
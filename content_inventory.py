@@ -0,0 +1,269 @@
+"""
+content_inventory.py
+
+One shared scan of the content tree for every tool that walks it.
+- Scans content/ once per process with os.scandir and records, per entry, its type, size and
+  mtime (plus a SHA-256 computed on demand and cached while size and mtime hold).
+- Answers glob patterns (`*`, `?`, `[...]`, `**`), suffix and directory-listing queries from
+  memory. Like glob, entries whose name starts with '.' (.DS_Store, .ipynb_checkpoints) are skipped.
+- Persisted in _build/cache/content_inventory.json. The next scan re-lists only directories whose
+  mtime changed and, with quick=True, trusts unchanged directories entirely (files replaced by
+  editors, Jupyter or git are written via rename, which bumps the directory mtime).
+- changes() reports what was added, modified or removed since the previous persisted scan.
+
+Usage:
+    from content_inventory import get_inventory
+    inv = get_inventory()                        # scans content/ (once per process)
+    notebooks = inv.glob('content/**/*.ipynb')   # like glob.glob(..., recursive=True)
+    added, modified, removed = inv.changes()
+    # or: python content_inventory.py [--changed] [--glob PATTERN]
+"""
+import argparse
+import glob as _glob
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).parent.resolve()
+CONTENT_ROOT = REPO_ROOT / 'content'
+INVENTORY_PATH = REPO_ROOT / '_build' / 'cache' / 'content_inventory.json'
+INVENTORY_VERSION = 1
+
+
+def _pattern_regex(pattern):
+    """Compile a glob pattern over '/'-separated relative paths, with '**' spanning directories."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        if pattern.startswith('**/', i):
+            out.append('(?:[^/]+/)*')
+            i += 3
+        elif pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            out.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            out.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            j = pattern.index(']', i + 2)
+            body = pattern[i + 1:j]
+            body = body.replace('\\', '\\\\')
+            out.append('[^' + body[1:] + ']' if body[0] in '!^' else '[' + body + ']')
+            i = j + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile(''.join(out) + r'\Z')
+
+
+class ContentInventory:
+    def __init__(self, root=CONTENT_ROOT, path=INVENTORY_PATH):
+        self.root = Path(root).resolve()
+        self.path = Path(path)
+        self.dirs = {}      # relative dir ('' for root) -> {'mtime_ns': int, 'names': [...]}
+        self.entries = {}   # relative path -> {'type': 'file'|'dir', 'size', 'mtime_ns'[, 'sha256']}
+        self.previous = {}  # entries of the persisted scan, for changes()
+        self.stats = {'listed': 0, 'reused': 0}
+        self.scanned = False
+        self._lock = threading.Lock()
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == INVENTORY_VERSION and data.get('root') == str(self.root):
+                    self.dirs = data.get('dirs', {})
+                    self.previous = data.get('entries', {})
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Ignoring unreadable content inventory {self.path}: {e}")
+
+    def scan(self, quick=False):
+        """
+        Bring the inventory up to date with the tree. Directories whose mtime is unchanged are not
+        re-listed; with quick=True their files are not re-stat'ed either.
+        """
+        old_dirs, old_entries = self.dirs, (self.entries if self.scanned else self.previous)
+        dirs, entries = {}, {}
+        self.stats = {'listed': 0, 'reused': 0}
+
+        def walk(rel_dir, abs_dir):
+            try:
+                st = os.stat(abs_dir)
+            except OSError:
+                return
+            cached = old_dirs.get(rel_dir)
+            prefix = f"{rel_dir}/" if rel_dir else ''
+            if cached and cached['mtime_ns'] == st.st_mtime_ns:
+                self.stats['reused'] += 1
+                names = cached['names']
+                kinds = {name: old_entries.get(prefix + name, {}).get('type') for name in names}
+            else:
+                self.stats['listed'] += 1
+                names, kinds = [], {}
+                with os.scandir(abs_dir) as it:
+                    for e in it:
+                        if e.name.startswith('.'):
+                            continue
+                        names.append(e.name)
+                        kinds[e.name] = 'dir' if e.is_dir() else 'file'
+                names.sort()
+                cached = None
+            dirs[rel_dir] = {'mtime_ns': st.st_mtime_ns, 'names': names}
+            for name in names:
+                rel = prefix + name
+                path = os.path.join(abs_dir, name)
+                if kinds.get(name) == 'dir':
+                    entries[rel] = {'type': 'dir'}
+                    walk(rel, path)
+                    continue
+                old = old_entries.get(rel)
+                if quick and cached and old:
+                    entries[rel] = old
+                    continue
+                try:
+                    fst = os.stat(path)
+                except OSError:
+                    continue
+                entry = {'type': 'file', 'size': fst.st_size, 'mtime_ns': fst.st_mtime_ns}
+                if old and old.get('sha256') and old.get('size') == fst.st_size and old.get('mtime_ns') == fst.st_mtime_ns:
+                    entry['sha256'] = old['sha256']
+                entries[rel] = entry
+
+        walk('', str(self.root))
+        self.dirs, self.entries = dirs, entries
+        self.scanned = True
+        return self
+
+    # --- queries ---------------------------------------------------------------------------
+
+    def rel(self, path):
+        """Path relative to the inventory root ('/'-separated), or None if path is outside it."""
+        rel = os.path.relpath(os.path.abspath(path), self.root)
+        if rel == '.':
+            return ''
+        if rel.startswith('..'):
+            return None
+        return rel.replace(os.sep, '/')
+
+    def files(self, pattern='**', kind='file'):
+        """Relative paths (sorted) matching a glob pattern relative to the root; kind None for files and dirs."""
+        regex = _pattern_regex(pattern)
+        return [rel for rel, e in sorted(self.entries.items())
+                if (kind is None or e['type'] == kind) and regex.match(rel)]
+
+    def glob(self, pattern, kind=None):
+        """
+        Drop-in for glob.glob(pattern, recursive=True): pattern and results are paths as given
+        (relative to the working directory or absolute). Patterns outside the root fall back to glob.
+        """
+        head = pattern
+        while _glob.has_magic(head):
+            head = os.path.dirname(head)
+        base = self.rel(head or '.')
+        if base is None:
+            matches = sorted(_glob.glob(pattern, recursive=True))
+            if kind is not None:
+                matches = [m for m in matches if os.path.isdir(m) == (kind == 'dir')]
+            return matches
+        rel_pattern = pattern[len(head):].lstrip('/' + os.sep) if head else pattern
+        prefix = f"{base}/" if base else ''
+        if not rel_pattern:
+            return [pattern] if base in self.entries or base == '' else []
+        return [os.path.join(head, m[len(prefix):]) if head else m
+                for m in self.files(prefix + rel_pattern.replace(os.sep, '/'), kind=kind)]
+
+    def with_suffix(self, *suffixes):
+        """Absolute paths of files whose name ends with one of suffixes (case-insensitive)."""
+        suffixes = tuple(s.lower() for s in suffixes)
+        return [self.root / rel for rel, e in sorted(self.entries.items())
+                if e['type'] == 'file' and rel.lower().endswith(suffixes)]
+
+    def listdir(self, path):
+        """Names directly inside a directory of the tree (sorted), or None if it is not inventoried."""
+        rel = self.rel(path)
+        d = self.dirs.get(rel) if rel is not None else None
+        return list(d['names']) if d else None
+
+    def sha256(self, path):
+        """SHA-256 of a file, cached in the inventory while its size and mtime are unchanged."""
+        rel = self.rel(path)
+        entry = self.entries.get(rel)
+        if entry is None or entry['type'] != 'file':
+            raise FileNotFoundError(path)
+        if 'sha256' not in entry:
+            h = hashlib.sha256()
+            with open(self.root / rel, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            with self._lock:
+                entry['sha256'] = h.hexdigest()
+        return entry['sha256']
+
+    def changes(self):
+        """(added, modified, removed) relative file paths since the previously persisted scan."""
+        old = {k for k, e in self.previous.items() if e['type'] == 'file'}
+        new = {k for k, e in self.entries.items() if e['type'] == 'file'}
+        modified = [k for k in sorted(old & new)
+                    if (self.previous[k].get('size'), self.previous[k].get('mtime_ns')) !=
+                       (self.entries[k]['size'], self.entries[k]['mtime_ns'])]
+        return sorted(new - old), modified, sorted(old - new)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with self._lock:
+            data = json.dumps({'version': INVENTORY_VERSION, 'root': str(self.root),
+                               'dirs': self.dirs, 'entries': self.entries}, indent=1, sort_keys=True)
+        tmp.write_text(data, encoding='utf-8')
+        os.replace(tmp, self.path)
+
+
+_inventory = None
+
+
+def get_inventory(root=CONTENT_ROOT, quick=False):
+    """The process-wide inventory of content/, scanned (and persisted) on first use."""
+    global _inventory
+    if _inventory is None:
+        _inventory = ContentInventory(root).scan(quick=quick)
+        _inventory.save()
+    return _inventory
+
+
+def inventory_glob(pattern, kind=None):
+    """
+    sorted(glob.glob(pattern, recursive=True)), answered from the content inventory when pattern
+    lies in content/. kind 'file' or 'dir' restricts the result.
+    """
+    return get_inventory().glob(pattern, kind=kind)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan content/ and answer inventory queries.")
+    parser.add_argument('--changed', action='store_true', help='List files added, modified or removed since the last scan')
+    parser.add_argument('--glob', help='List paths matching a glob pattern (e.g. "content/**/*.ipynb")')
+    parser.add_argument('--quick', action='store_true', help='Trust unchanged directory mtimes (skip file stats there)')
+    args = parser.parse_args()
+    inv = ContentInventory().scan(quick=args.quick)
+    files = [e for e in inv.entries.values() if e['type'] == 'file']
+    print(f"[INFO] {len(files)} files in {len(inv.dirs)} directories, {sum(e['size'] for e in files) / 1e6:.1f} MB "
+          f"({inv.stats['listed']} directories listed, {inv.stats['reused']} unchanged)")
+    if args.changed:
+        added, modified, removed = inv.changes()
+        for label, paths in (('A', added), ('M', modified), ('D', removed)):
+            for p in paths:
+                print(f"  {label} {p}")
+        print(f"[INFO] {len(added)} added, {len(modified)} modified, {len(removed)} removed since the last scan")
+    if args.glob:
+        for p in inv.glob(args.glob):
+            print(p)
+    inv.save()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,11 @@
 import yaml
 from pathlib import Path
 from typing import Any, Dict, List, Optional
-import glob
 import os
 
+from content_inventory import inventory_glob
+from site_tree import site_tree_for
+
 class ContentValidationError(Exception):
     pass
 
@@ -27,13 +29,13 @@ def _expand_autogen(entry, base_path):
     """Expand an entry with a .autogen key into a list of file entries."""
     pattern = entry[".autogen"]
     # Use glob relative to base_path
-    files = sorted(glob.glob(os.path.join(base_path, pattern)))
+    files = inventory_glob(os.path.join(base_path, pattern))
     return [{"file": os.path.relpath(f, base_path)} for f in files]
 
 def _append_children(entry, base_path):
     """Append children from a directory to the entry."""
     dir_path = os.path.join(base_path, entry["append_children"])
-    files = sorted([f for f in glob.glob(os.path.join(dir_path, "*")) if os.path.isfile(f)])
+    files = inventory_glob(os.path.join(dir_path, "*"), kind='file')
     children = [{"file": os.path.relpath(f, base_path)} for f in files]
     if "children" in entry:
         entry["children"].extend(children)
@@ -70,6 +72,8 @@ def validate_content(content: dict):
     for theme_key in ['default', 'light', 'dark']:
         if theme_key not in content['site']['theme']:
             raise ContentValidationError(f"Missing theme key in 'site.theme': {theme_key}")
+    if 'base_url' in content['site'] and not isinstance(content['site']['base_url'], str):
+        raise ContentValidationError("'base_url' in 'site' must be a string")
 
     # Validate 'toc' section
     if 'toc' not in content or not isinstance(content['toc'], list):
@@ -115,6 +119,23 @@ def validate_content(content: dict):
     for key in required_build_keys[1:]:
         if not isinstance(content['build'][key], str):
             raise ContentValidationError(f"'{key}' in 'build' must be a string")
+    if 'latex_jobs' in content['build']:
+        latex_jobs = content['build']['latex_jobs']
+        if not isinstance(latex_jobs, int) or isinstance(latex_jobs, bool) or latex_jobs < 1:
+            raise ContentValidationError("'latex_jobs' in 'build' must be a positive integer")
+    for key, minimum in (('execute_jobs', 1), ('execute_timeout', 1), ('execute_memory_mb', 0), ('prefetch_budget_kb', 0)):
+        if key in content['build']:
+            value = content['build'][key]
+            if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+                kind = 'a positive' if minimum else 'a non-negative'
+                raise ContentValidationError(f"'{key}' in 'build' must be {kind} integer")
+    if 'artifact_cache' in content['build'] and not isinstance(content['build']['artifact_cache'], str):
+        raise ContentValidationError("'artifact_cache' in 'build' must be a string (a directory or an http(s) URL)")
+    if 'unicode_replacements' in content['build']:
+        replacements = content['build']['unicode_replacements']
+        if not isinstance(replacements, dict) or not all(
+                isinstance(k, str) and k and isinstance(v, str) for k, v in replacements.items()):
+            raise ContentValidationError("'unicode_replacements' in 'build' must map non-empty strings to strings")
 
 def validate_menu_item(item: dict, level: int):
     # Enforce max depth (menu > group > subgroup > page):
@@ -151,38 +172,17 @@ def get_menu_structure(content: dict) -> List[dict]:
     """
     Return the list of top-level menu items (those with menu: true).
     """
-    return [item for item in content['toc'] if item.get('menu', False)]
+    return [node.data for node in site_tree_for(content).menu_items()]
 
 def get_all_content_files(content: dict) -> List[str]:
     """
-    Recursively collect all 'file' values from the toc tree.
+    All 'file' values from the toc tree, depth-first (answered by the content's SiteTree).
     """
-    files = []
-    def walk(node):
-        if 'file' in node:
-            files.append(node['file'])
-        if 'children' in node:
-            for child in node['children']:
-                walk(child)
-    for item in content['toc']:
-        walk(item)
-    return files
+    return site_tree_for(content).files()
 
 def get_group_page_info(content: dict, group_title: str) -> Optional[dict]:
     """
     Find a group by title and return its dict (with file, children, etc), or None if not found.
     """
-    def walk(node):
-        if node.get('title', '').lower() == group_title.lower():
-            return node
-        if 'children' in node:
-            for child in node['children']:
-                found = walk(child)
-                if found:
-                    return found
-        return None
-    for item in content['toc']:
-        found = walk(item)
-        if found:
-            return found
-    return None
+    node = site_tree_for(content).group(group_title)
+    return node.data if node else None
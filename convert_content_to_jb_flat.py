@@ -2,10 +2,12 @@
 convert_content_to_jb_flat.py
 
 Script to convert _content.yml (custom menu/content tree) to a minimal, flat Jupyter Book _toc.yml.
-- Only includes notebooks/files listed in toc: (recursively), in order.
+- Only includes notebooks/files listed in toc: (recursively), in order, taken from the SiteTree's pages.
 - No parts, no nesting, just a flat list of files.
 - The first file becomes the root.
 
+- _toc.yml is only rewritten when its content changes.
+
 Usage:
     python convert_content_to_jb_flat.py
 
@@ -15,40 +17,42 @@ Outputs:
 import yaml
 from pathlib import Path
 
+from output_writer import write_if_changed
+from site_tree import site_tree_for
+
 def load_content_yml(path):
     with open(path, 'r', encoding='utf-8') as f:
         return yaml.safe_load(f)
 
-def flatten_files(menu):
-    files = []
-    for node in menu:
-        if not isinstance(node, dict):
-            continue
-        file = node.get('file')
-        if file:
-            files.append(Path(file).with_suffix('').as_posix())
-        children = node.get('children')
-        if children:
-            files.extend(flatten_files(children))
-    return files
-
-def write_yaml(obj, path):
-    with open(path, 'w', encoding='utf-8') as f:
-        yaml.dump(obj, f, sort_keys=False, allow_unicode=True)
-
-def main():
-    content = load_content_yml('_content.yml')
-    toc_list = content.get('toc', [])
-    files = flatten_files(toc_list)
+def build_flat_toc(content):
+    """Flat Jupyter Book toc (dict) for a loaded _content.yml."""
+    files = [node.stem for node in site_tree_for(content).pages]
     if not files:
         raise RuntimeError('No files found in toc:')
-    toc = {
+    return {
         'format': 'jb-book',
         'root': files[0],
         'chapters': [{'file': f} for f in files[1:]]
     }
-    write_yaml(toc, '_toc.yml')
-    print('[OK] Wrote flat _toc.yml with', len(files), 'files')
+
+def render_yaml(obj):
+    return yaml.dump(obj, sort_keys=False, allow_unicode=True)
+
+def write_yaml(obj, path):
+    return write_if_changed(path, render_yaml(obj))
+
+def write_toc_if_changed(toc, path='_toc.yml'):
+    """Write toc to path unless the file already has exactly this content. Returns True if written."""
+    return write_yaml(toc, path)
+
+def main():
+    content = load_content_yml('_content.yml')
+    toc = build_flat_toc(content)
+    count = 1 + len(toc['chapters'])
+    if write_toc_if_changed(toc, '_toc.yml'):
+        print('[OK] Wrote flat _toc.yml with', count, 'files')
+    else:
+        print('[OK] _toc.yml is up to date with', count, 'files')
 
 if __name__ == '__main__':
     main()
@@ -12,15 +12,9 @@ Outputs:
     _config.yml and _toc.yml in the current directory.
 """
 import yaml
-import sys
-from pathlib import Path
 
-def slugify(title):
-    import re
-    slug = title.lower().strip()
-    slug = re.sub(r'\s+', '-', slug)
-    slug = re.sub(r'[^a-z0-9\-]', '', slug)
-    return slug
+from output_writer import open_output
+from site_tree import site_tree_for
 
 def load_content_yml(path):
     with open(path, 'r', encoding='utf-8') as f:
@@ -35,102 +29,53 @@ def make_config_yml(site):
     }
     return config
 
-def make_toc_entries(menu):
+def make_toc_entries(nodes, top=False):
     """
-    Recursively convert menu tree to Jupyter Book toc entries.
-    Each entry: {'file': path, 'title': ...} or {'part': ..., 'sections': [...]}
+    Recursively convert SiteTree nodes to Jupyter Book toc entries.
+    Each entry: {'file': path, 'title': ...} or {'part': ..., 'chapters': [...]}
+    top: the chapters directly under the root, which keep empty 'chapters'/'part' entries.
     """
     entries = []
-    for node in menu:
-        if not isinstance(node, dict):
-            continue
-        title = node.get('title', '')
-        file = node.get('file')
-        children = node.get('children')
-        if file:
-            # Remove extension for Jupyter Book (expects .md/.ipynb omitted)
-            file_path = Path(file)
-            stem = file_path.with_suffix('').as_posix()
-            entry = {'file': stem, 'title': title}
-            if children:
-                child_chapters = make_toc_entries(children)
-                if child_chapters:
+    for node in nodes:
+        if node.file:
+            # Jupyter Book expects the path without .md/.ipynb
+            entry = {'file': node.stem, 'title': node.title}
+            if node.children:
+                child_chapters = make_toc_entries(node.children)
+                if child_chapters or top:
                     entry['chapters'] = child_chapters
             entries.append(entry)
-        elif children:
-            # Only use 'part' for non-root levels; flatten at root
-            child_chapters = make_toc_entries(children)
-            if child_chapters:
-                # If this is the root level, flatten children
-                if title.lower() == 'chapters' or title.lower() == 'sections':
-                    entries.extend(child_chapters)
-                else:
-                    entry = {'part': title, 'chapters': child_chapters}
-                    entries.append(entry)
-    return entries
+        elif node.children:
+            child_chapters = make_toc_entries(node.children)
+            if node.title.lower() in ('chapters', 'sections'):
+                # A 'Chapters'/'Sections' grouping is flattened into its parent
+                entries.extend(child_chapters)
+            elif child_chapters or top:
+                entries.append({'part': node.title, 'chapters': child_chapters})
     return entries
 
 def write_yaml(obj, path):
-    with open(path, 'w', encoding='utf-8') as f:
+    with open_output(path) as f:
         yaml.dump(obj, f, sort_keys=False, allow_unicode=True)
+    return f.changed
 
 def main():
     content = load_content_yml('_content.yml')
     site = content.get('site', {})
-    toc_list = content.get('toc', [])
+    tree = site_tree_for(content)
     # _config.yml
     config = make_config_yml(site)
-    write_yaml(config, '_config.yml')
-    print('[OK] Wrote _config.yml')
-    # Find root file (first file in top-level toc)
-    def find_first_file_and_rest(toc):
-        for i, node in enumerate(toc):
-            if node.get('file'):
-                root_file = Path(node['file']).with_suffix('').as_posix()
-                # All other nodes after the first file node
-                rest = toc[:i] + toc[i+1:]
-                return root_file, rest
-        return 'index', toc
-
-    root_file, rest = find_first_file_and_rest(toc_list)
-    # Find the title for the root file
-    def get_root_title(toc, root_file):
-        for node in toc:
-            if node.get('file'):
-                return node.get('title', 'Home')
-        return 'Home'
-    root_title = get_root_title(toc_list, root_file)
-
-
-    # All other top-level nodes (except the root) become chapters/parts under the root
-    def make_chapters(rest):
-        chapters = []
-        for node in rest:
-            if not isinstance(node, dict):
-                continue
-            file = node.get('file')
-            title = node.get('title', '')
-            children = node.get('children')
-            if file:
-                entry = {'file': Path(file).with_suffix('').as_posix(), 'title': title}
-                if children:
-                    entry['chapters'] = make_toc_entries(children)
-                chapters.append(entry)
-            elif children:
-                # If this is a top-level grouping (e.g., 'Chapters'), flatten its children
-                if title.lower() in ('chapters', 'sections'):
-                    chapters.extend(make_toc_entries(children))
-                else:
-                    chapters.append({'part': title, 'chapters': make_toc_entries(children)})
-        return chapters
+    print('[OK] Wrote _config.yml' if write_yaml(config, '_config.yml') else '[OK] _config.yml is up to date')
+    # The first top-level file is the root; all other top-level nodes become chapters/parts under it
+    root = next((node for node in tree.roots if node.file), None)
+    rest = [node for node in tree.roots if node is not root]
 
     toc = {
         'format': 'jb-book',
-        'root': root_file,
-        'chapters': make_chapters(rest)
+        'root': root.stem if root else 'index',
+        'chapters': make_toc_entries(rest, top=True)
     }
-    write_yaml(toc, '_toc.yml')
-    print('[OK] Wrote _toc.yml')
+    print('[OK] Wrote _toc.yml' if write_yaml(toc, '_toc.yml') else '[OK] _toc.yml is up to date')
 
 if __name__ == '__main__':
     main()
@@ -1,62 +1,310 @@
 #!/usr/bin/env python3
 """
-Copy all .ipynb files from content/ (recursively) to _build/ipynb and docs/ipynb as a flat set (no subfolders).
-Supports --debug and --files FILE1 FILE2 ...
+Publish the course notebooks as a flat set (no subfolders) to _build/ipynb and docs/ipynb.
+- By default publishes every notebook in the _content.yml toc; --files limits the run to the given notebooks.
+- A manifest (_build/ipynb/.manifest.json) records each source's (path, size, mtime, sha256) and its
+  destinations, so unchanged notebooks are skipped with a stat() and content-identical ones without a copy.
+- The docs/ipynb copy is a hardlink to the _build/ipynb copy (falling back to a reflink or copy).
+- Copies run in a thread pool.
+- Notebooks removed from _content.yml are pruned from both directories on full runs, including flat
+  copies (and variants) left there by earlier publishers that no manifest entry records.
+- TOC entries whose notebook does not exist are listed in one warning at the end of the run.
+- Two notebooks with the same basename would overwrite each other, so the run fails before copying anything.
+- Also publishes slim download variants (notebook_variants.py) to clean/ and light/ subdirectories:
+  outputs cleared, or embedded images moved to light/outputs/ and linked from the hosted site.
+  Variants are generated in a process pool and only when the source hash (or variant format) changed.
+  Light images a regenerated notebook no longer links to are deleted right away (unless another
+  notebook links to them); full runs also sweep light/outputs/ for images no notebook links to.
+Supports --debug, --no-variants and --files FILE1 FILE2 ...
 """
 import os
 from pathlib import Path
 import shutil
 import argparse
+import json
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-def copy_ipynb_flat(files=None, src_root="content", build_dir="_build/ipynb", docs_dir="docs/ipynb", debug=False):
-    print("[DEBUG] Script started.")
+from image_store import file_sha256, link_or_copy
+from notebook_variants import OUTPUTS_DIR, VARIANTS, VARIANTS_VERSION, hosted_base_url, make_variants
+
+MANIFEST_NAME = '.manifest.json'
+
+
+class NotebookNameCollision(Exception):
+    pass
+
+
+def site_base_url(content_yml='_content.yml'):
+    """Hosting URL for light-variant images ('' if _content.yml is missing or names no site)."""
+    if not Path(content_yml).exists():
+        return ''
+    from content_parser import load_and_validate_content_yml
+    return hosted_base_url(load_and_validate_content_yml(content_yml).get('site', {}))
+
+
+def toc_notebooks(content_yml='_content.yml'):
+    """All .ipynb files referenced in the _content.yml toc."""
+    from content_parser import load_and_validate_content_yml, get_all_content_files
+    content = load_and_validate_content_yml(content_yml)
+    return [f for f in get_all_content_files(content) if f.lower().endswith('.ipynb')]
+
+
+def check_collisions(notebooks):
+    """Raise NotebookNameCollision if two different sources share a flat name."""
+    by_name = {}
+    for nb in notebooks:
+        by_name.setdefault(nb.name, set()).add(nb)
+    collisions = {name: sorted(str(p) for p in paths) for name, paths in by_name.items() if len(paths) > 1}
+    if collisions:
+        lines = [f"  {name}: {', '.join(paths)}" for name, paths in sorted(collisions.items())]
+        raise NotebookNameCollision("Notebooks with the same flat name would overwrite each other:\n" + '\n'.join(lines))
+
+
+def load_manifest(path):
+    if path.exists():
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Ignoring unreadable manifest {path}: {e}")
+    return {}
+
+
+def save_manifest(path, manifest):
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def _outputs_current(dest_build, dest_docs, size):
+    try:
+        return (dest_build.stat().st_size == size and
+                (os.path.samefile(dest_build, dest_docs) or dest_docs.stat().st_size == size))
+    except OSError:
+        return False
+
+
+def publish_notebook(nb, entry, build_dir, docs_dir, debug=False):
+    """
+    Bring the flat copies of one notebook up to date. Returns (status, manifest entry),
+    where status is 'unchanged', 'copied' or 'missing'.
+    """
+    try:
+        st = nb.stat()
+    except OSError:
+        return 'missing', None
+    dest_build = build_dir / nb.name
+    dest_docs = docs_dir / nb.name
+    current = _outputs_current(dest_build, dest_docs, st.st_size)
+    if entry and current and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+        return 'unchanged', entry
+    sha = file_sha256(nb)
+    new_entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': sha,
+                 'dests': [str(dest_build), str(dest_docs)]}
+    if entry and current and entry.get('sha256') == sha:
+        # Touched but identical: refresh the manifest only
+        return 'unchanged', new_entry
+    tmp = dest_build.with_name(f".{dest_build.name}.{os.getpid()}.tmp")
+    shutil.copy2(nb, tmp)
+    os.replace(tmp, dest_build)
+    method = link_or_copy(dest_build, dest_docs)
+    if debug:
+        print(f"[OK] Published {nb} -> {dest_build} ({method} -> {dest_docs})")
+    return 'copied', new_entry
+
+
+def _link_if_needed(src, dest):
+    """Make dest a link (or copy) of src unless it already is one."""
+    try:
+        if os.path.samefile(src, dest):
+            return
+    except OSError:
+        pass
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    link_or_copy(src, dest)
+
+
+def variant_dests(nb, build_dir, docs_dir):
+    return [d / variant / nb.name for variant in VARIANTS for d in (build_dir, docs_dir)]
+
+
+def publish_variants(notebooks, manifest, build_dir, docs_dir, base_url, jobs=None, debug=False):
+    """
+    Regenerate the clean/light variants of notebooks whose source hash, variant format or hosting URL
+    changed (in a process pool) and link them into docs_dir. Light images that a regenerated notebook
+    stopped linking to, and no other notebook links to, are deleted. Returns the number regenerated.
+    """
+    stale = []
+    dropped = set()
+    for nb in notebooks:
+        entry = manifest.get(str(nb))
+        if entry is None:
+            continue
+        key = f"{entry['sha256']}:{VARIANTS_VERSION}:{base_url}"
+        dests = variant_dests(nb, build_dir, docs_dir)
+        entry['dests'] = [str(build_dir / nb.name), str(docs_dir / nb.name)] + [str(d) for d in dests]
+        if entry.get('variants_key') != key or not all(d.exists() for d in dests):
+            stale.append((nb, key))
+    if stale:
+        with ProcessPoolExecutor(max_workers=min(jobs or os.cpu_count() or 1, len(stale))) as pool:
+            futures = [(nb, key, pool.submit(make_variants, nb, build_dir, base_url)) for nb, key in stale]
+            for nb, key, future in futures:
+                entry = manifest[str(nb)]
+                try:
+                    outputs = future.result()
+                except (OSError, ValueError) as e:
+                    print(f"[ERROR] Failed to build download variants of {nb}: {e}")
+                    entry.pop('variants_key', None)
+                    continue
+                dropped |= set(entry.get('outputs', [])) - set(outputs)
+                entry['outputs'] = outputs
+                entry['variants_key'] = key
+                for variant in VARIANTS:
+                    _link_if_needed(build_dir / variant / nb.name, docs_dir / variant / nb.name)
+                for name in entry['outputs']:
+                    _link_if_needed(build_dir / 'light' / OUTPUTS_DIR / name, docs_dir / 'light' / OUTPUTS_DIR / name)
+                if debug:
+                    print(f"[OK] Download variants of {nb.name}: clean, light ({len(entry['outputs'])} images externalized)")
+    if dropped:
+        prune_variant_outputs(manifest, build_dir, docs_dir, candidates=dropped, debug=debug)
+    return len(stale)
+
+
+def prune_variant_outputs(manifest, build_dir, docs_dir, candidates=None, debug=False):
+    """
+    Delete light-variant images no notebook in the manifest links to: every such file in
+    light/outputs/, or only those among candidates. Returns the number of files deleted.
+    """
+    live = {name for entry in manifest.values() for name in entry.get('outputs', [])}
+    removed = 0
+    for d in (build_dir, docs_dir):
+        outputs_dir = d / 'light' / OUTPUTS_DIR
+        if not outputs_dir.is_dir():
+            continue
+        paths = outputs_dir.iterdir() if candidates is None else (outputs_dir / name for name in candidates)
+        for path in paths:
+            if path.name not in live and path.is_file():
+                path.unlink()
+                removed += 1
+                if debug:
+                    print(f"[INFO] Pruned {path}")
+    return removed
+
+
+def prune_unlisted_copies(live_names, build_dir, docs_dir, debug=False):
+    """
+    Delete flat notebook copies (and their variants) whose name is not in live_names, e.g. copies
+    published before the toc decided what is published. Returns the number of files deleted.
+    """
+    removed = 0
+    for d in (build_dir, docs_dir):
+        for sub in ('',) + tuple(VARIANTS):
+            directory = d / sub
+            if not directory.is_dir():
+                continue
+            for path in directory.glob('*.ipynb'):
+                if path.name not in live_names:
+                    path.unlink()
+                    removed += 1
+                    if debug:
+                        print(f"[INFO] Pruned {path}")
+    return removed
+
+
+def copy_ipynb_flat(files=None, src_root="content", build_dir="_build/ipynb", docs_dir="docs/ipynb", jobs=None,
+                    variants=True, debug=False):
+    """
+    Publish notebooks flat to build_dir and docs_dir, plus their clean/light download variants
+    (unless variants=False). Raises NotebookNameCollision before copying anything if two notebooks
+    share a basename. Returns a dict of counts.
+    src_root is kept for callers of the old directory-scanning interface and is only used when
+    _content.yml is missing.
+    """
     build_dir = Path(build_dir).resolve()
     docs_dir = Path(docs_dir).resolve()
-    print(f"[DEBUG] Target build_dir: {build_dir}")
-    print(f"[DEBUG] Target docs_dir: {docs_dir}")
-    try:
-        build_dir.mkdir(parents=True, exist_ok=True)
-        docs_dir.mkdir(parents=True, exist_ok=True)
-    except Exception as e:
-        print(f"[ERROR] Failed to create directories: {e}")
-        sys.exit(1)
+    build_dir.mkdir(parents=True, exist_ok=True)
+    docs_dir.mkdir(parents=True, exist_ok=True)
+    full_run = not files
     if files:
         notebooks = [Path(f).resolve() for f in files]
-        print(f"[DEBUG] Using --files: {notebooks}")
+    elif Path('_content.yml').exists():
+        notebooks = [Path(f).resolve() for f in toc_notebooks()]
     else:
-        src_root = Path(src_root).resolve()
-        print(f"[DEBUG] Searching for .ipynb in: {src_root}")
-        notebooks = list(src_root.rglob("*.ipynb"))
+        from content_inventory import inventory_glob
+        notebooks = [Path(f).resolve() for f in inventory_glob(os.path.join(src_root, '**', '*.ipynb'), kind='file')]
+    notebooks = list(dict.fromkeys(notebooks))
+    check_collisions(notebooks)
     if debug:
-        print(f"[INFO] Found {len(notebooks)} notebooks to copy.")
-    copied = 0
-    for nb in notebooks:
-        if not nb.exists():
-            print(f"[WARN] Notebook not found: {nb}")
-            continue
-        dest_build = build_dir / nb.name
-        try:
-            shutil.copy2(nb, dest_build)
-            if debug:
-                print(f"[OK] Copied {nb} -> {dest_build}")
-        except Exception as e:
-            print(f"[ERROR] Failed to copy {nb} to {dest_build}: {e}")
-            continue
-        dest_docs = docs_dir / nb.name
+        print(f"[INFO] {len(notebooks)} notebooks to publish to {build_dir} and {docs_dir}")
+
+    manifest_path = build_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    counts = {'copied': 0, 'unchanged': 0, 'missing': 0, 'pruned': 0, 'failed': 0, 'variants': 0}
+    missing = []
+
+    def task(nb):
+        old = manifest.get(str(nb))
         try:
-            shutil.copy2(dest_build, dest_docs)
-            if debug:
-                print(f"[OK] Published {dest_build} -> {dest_docs}")
-            copied += 1
-        except Exception as e:
-            print(f"[ERROR] Failed to copy {dest_build} to {dest_docs}: {e}")
-    print(f"[DEBUG] Script finished. {copied} notebooks published.")
+            status, entry = publish_notebook(nb, old, build_dir, docs_dir, debug=debug)
+        except OSError as e:
+            print(f"[ERROR] Failed to publish {nb}: {e}")
+            return nb, ('failed', old)
+        if entry is not None and old and entry is not old:
+            # The light images published so far, so a regeneration can delete the ones it drops
+            if 'outputs' in old:
+                entry['outputs'] = old['outputs']
+            # Same bytes: the download variants generated from them are still valid
+            if old.get('sha256') == entry['sha256'] and 'variants_key' in old:
+                entry['variants_key'] = old['variants_key']
+        return nb, (status, entry)
+
+    with ThreadPoolExecutor(max_workers=jobs or min(8, (os.cpu_count() or 1) * 2)) as pool:
+        for nb, (status, entry) in pool.map(task, notebooks):
+            counts[status] += 1
+            if status == 'missing':
+                missing.append(nb)
+            if entry is not None:
+                manifest[str(nb)] = entry
+
+    if full_run:
+        live = {str(nb) for nb in notebooks}
+        live_dests = {str(d / nb.name) for nb in notebooks for d in (build_dir, docs_dir)}
+        for src in [s for s in manifest if s not in live]:
+            for dest in manifest[src].get('dests', []):
+                if dest not in live_dests and os.path.exists(dest):
+                    os.unlink(dest)
+                    if debug:
+                        print(f"[INFO] Pruned {dest}")
+            del manifest[src]
+            counts['pruned'] += 1
+        counts['pruned'] += prune_unlisted_copies({nb.name for nb in notebooks}, build_dir, docs_dir, debug=debug)
+    if variants:
+        counts['variants'] = publish_variants(notebooks, manifest, build_dir, docs_dir, site_base_url(),
+                                              jobs=jobs, debug=debug)
+        if full_run:
+            prune_variant_outputs(manifest, build_dir, docs_dir, debug=debug)
+    save_manifest(manifest_path, manifest)
+    if missing:
+        where = 'requested' if files else 'listed in _content.yml'
+        print(f"[WARN] {len(missing)} notebook(s) {where} do not exist and were not published:")
+        for nb in missing:
+            print(f"[WARN]   - {os.path.relpath(nb)}")
+    print(f"[OK] Notebooks: {counts['copied']} published, {counts['unchanged']} unchanged, "
+          f"{counts['pruned']} pruned, {counts['missing']} missing, {counts['failed']} failed; "
+          f"{counts['variants']} download variant set(s) rebuilt.")
+    return counts
 
 if __name__ == "__main__":
-    print("[DEBUG] __main__ block reached.")
-    parser = argparse.ArgumentParser(description="Copy .ipynb files from content/ to _build/ipynb and docs/ipynb (flat)")
+    parser = argparse.ArgumentParser(description="Copy .ipynb files from the _content.yml toc to _build/ipynb and docs/ipynb (flat)")
     parser.add_argument('--debug', action='store_true', help='Enable debug output')
     parser.add_argument('--files', nargs='+', help='Only copy the specified notebook files')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of concurrent copies')
+    parser.add_argument('--no-variants', action='store_true', help='Skip the clean/light download variants')
     args = parser.parse_args()
-    copy_ipynb_flat(files=args.files, debug=args.debug)
\ No newline at end of file
+    try:
+        counts = copy_ipynb_flat(files=args.files, jobs=args.jobs, variants=not args.no_variants, debug=args.debug)
+    except NotebookNameCollision as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    sys.exit(1 if counts['failed'] else 0)
@@ -0,0 +1,436 @@
+"""
+critical_css.py
+
+Critical-CSS inlining for the HTML builder (`python build.py --html --critical-css`).
+- Finds the above-the-fold part of a rendered page: <html>/<body>, the site header, the main nav and
+  the first children of <main> up to and including the first content block (theme toggle, download
+  buttons, first heading/paragraph/cell).
+- Keeps the rules of the compiled theme stylesheet (static/css/theme.css) whose selectors can match
+  those elements, plus the theme custom-property blocks (:root / [data-theme=...]), inside their
+  @media wrappers. Matching is conservative: pseudo-classes, sibling combinators, classes toggled from
+  JavaScript (dark, open) and selectors it cannot parse all count as matches.
+- Inlines that subset as <style id="critical-css"> in the page head and turns the stylesheet link into
+  a preload that applies itself on load (with a <noscript> fallback).
+- The first content block's own markup is page text, so the extraction works on the page's template
+  fold instead: the block's contents are replaced by every tag Markdown can produce there.
+- Critical sets are cached in memory and in _build/cache/critical-css/, keyed on the stylesheet hash
+  and the tag/class structure of the template fold (no ids or other per-page attributes), so pages
+  built from the same template share one computation.
+
+Usage:
+    from critical_css import CriticalCss
+    critical = CriticalCss('static/css/theme.css')
+    html = critical.inline(html, 'css/theme.css')
+"""
+import hashlib
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+
+from output_writer import write_if_changed
+
+REPO_ROOT = Path(__file__).parent.resolve()
+CACHE_DIR = REPO_ROOT / '_build' / 'cache' / 'critical-css'
+# Bump when the extraction changes so cached critical sets are recomputed
+CRITICAL_VERSION = 2
+# Classes added from JavaScript (theme toggle, open dropdowns): assume they may be present
+DYNAMIC_CLASSES = {'dark', 'open'}
+# Attributes set from JavaScript on <html>
+DYNAMIC_ATTRIBUTES = {'data-theme'}
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source',
+                 'track', 'wbr'}
+# Children of <main> that precede the first content block
+FOLD_PREAMBLE = {'button', 'script', 'style', 'noscript'}
+# Markup that Markdown and notebook cells produce inside a content block (see template_fold)
+CONTENT_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'div', 'span', 'a', 'em', 'strong', 'b', 'i', 'code',
+                'pre', 'img', 'ul', 'ol', 'li', 'dl', 'dt', 'dd', 'blockquote', 'table', 'thead', 'tbody', 'tr',
+                'th', 'td', 'hr', 'br', 'sup', 'sub')
+_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_ATTR_RE = re.compile(r'\[\s*([\w-]+)\s*(?:([~|^$*]?=)\s*("[^"]*"|\'[^\']*\'|[^\]\s]+)\s*)?(?:\s[iIsS])?\s*\]')
+
+
+# --- CSS -------------------------------------------------------------------------------------
+
+def parse_css(css):
+    """
+    Split a stylesheet into a list of rules: ('rule', selectors, body) or ('block', prelude, [rules])
+    for @media/@supports, and ('at', text) for any other at-rule (kept verbatim).
+    """
+    css = _COMMENT_RE.sub('', css)
+    rules, stack = [], []
+    current = rules
+    i, n, start = 0, len(css), 0
+    while i < n:
+        c = css[i]
+        if c in '"\'':
+            i = css.find(c, i + 1) + 1 or n
+            continue
+        if c == '{':
+            prelude = css[start:i].strip()
+            if prelude.startswith(('@media', '@supports')):
+                block = ('block', prelude, [])
+                current.append(block)
+                stack.append(current)
+                current = block[2]
+                i += 1
+                start = i
+                continue
+            end = _matching_brace(css, i)
+            body = css[i + 1:end].strip()
+            if prelude.startswith('@'):
+                current.append(('at', f"{prelude}{{{body}}}"))
+            elif prelude:
+                current.append(('rule', prelude, body))
+            i = start = end + 1
+            continue
+        if c == '}':
+            if stack:
+                current = stack.pop()
+            i += 1
+            start = i
+            continue
+        if c == ';' and css[start:i].strip().startswith('@'):
+            current.append(('at', css[start:i + 1].strip()))
+            start = i + 1
+        i += 1
+    return rules
+
+
+def _matching_brace(css, i):
+    depth = 0
+    while i < len(css):
+        c = css[i]
+        if c in '"\'':
+            i = css.find(c, i + 1)
+            if i < 0:
+                return len(css)
+        elif c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(css)
+
+
+def split_selectors(text):
+    """Split a selector list on top-level commas."""
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(text):
+        if c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return [p for p in parts if p]
+
+
+def parse_selector(selector):
+    """
+    Parse a complex selector into [(combinator, compound)], left to right, where compound is
+    {'tag', 'ids', 'classes', 'attrs', 'root'}. Returns None if the selector is not understood.
+    """
+    tokens = re.findall(r'\s*([>+~])\s*|(\s+)|((?:[^\s>+~()\[]|\[[^\]]*\]|\([^)]*\))+)', selector.strip())
+    result, combinator = [], None
+    for explicit, space, compound in tokens:
+        if explicit or space:
+            combinator = explicit or (combinator if combinator and combinator != ' ' else ' ')
+            continue
+        parsed = _parse_compound(compound)
+        if parsed is None:
+            return None
+        result.append((combinator, parsed))
+        combinator = None
+    return result or None
+
+
+def _parse_compound(text):
+    compound = {'tag': None, 'ids': [], 'classes': [], 'attrs': [], 'root': False}
+    m = re.match(r'\*|[a-zA-Z][\w-]*', text)
+    if m:
+        compound['tag'] = None if m.group(0) == '*' else m.group(0).lower()
+        text = text[m.end():]
+    while text:
+        if text[0] == '#':
+            m = re.match(r'#([\w-]+)', text)
+            compound['ids'].append(m.group(1))
+        elif text[0] == '.':
+            m = re.match(r'\.([\w-]+)', text)
+            compound['classes'].append(m.group(1))
+        elif text[0] == '[':
+            m = _ATTR_RE.match(text)
+            if m:
+                value = m.group(3)
+                if value and value[0] in '"\'':
+                    value = value[1:-1]
+                compound['attrs'].append((m.group(1).lower(), m.group(2), value))
+        elif text[0] == ':':
+            # Pseudo-classes and pseudo-elements never rule a match out; :root pins <html>
+            m = re.match(r'::?([\w-]+)(\([^)]*\))?', text)
+            if m and m.group(1) == 'root':
+                compound['root'] = True
+        else:
+            return None
+        if not m:
+            return None
+        text = text[m.end():]
+    return compound
+
+
+# --- HTML ------------------------------------------------------------------------------------
+
+class _Element:
+    __slots__ = ('tag', 'id', 'classes', 'attrs', 'parent', 'fold')
+
+    def __init__(self, tag, attrs, parent, fold):
+        self.tag = tag
+        self.attrs = {k: (v or '') for k, v in attrs}
+        self.id = self.attrs.get('id')
+        self.classes = set(self.attrs.get('class', '').split())
+        self.parent = parent
+        self.fold = fold
+
+
+class _FoldComplete(Exception):
+    pass
+
+
+class FoldParser(HTMLParser):
+    """Collects the above-the-fold elements of a page (see module docstring)."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.elements = []
+        self.main = None
+        self.main_done = False  # first content block of <main> seen
+        self.first_block = None
+
+    def handle_starttag(self, tag, attrs):
+        parent = self.stack[-1] if self.stack else None
+        fold = parent is not None and parent.fold
+        if not fold and parent is not None:
+            if parent.tag == 'body' and tag in ('header', 'nav'):
+                fold = True
+            elif parent is self.main and not self.main_done:
+                fold = True
+                classes = dict(attrs).get('class') or ''
+                if tag not in FOLD_PREAMBLE and 'chapter-downloads' not in classes.split():
+                    self.main_done = True
+        element = _Element(tag, attrs, parent, fold)
+        if self.main_done and self.first_block is None:
+            self.first_block = element
+        if tag == 'main' and self.main is None:
+            self.main = element
+        if fold or tag in ('html', 'body') or element is self.main:
+            self.elements.append(element)
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        # Pop to the matching element, tolerating unclosed tags
+        for depth in range(len(self.stack) - 1, -1, -1):
+            if self.stack[depth].tag == tag:
+                closed = self.stack[depth:]
+                del self.stack[depth:]
+                if self.first_block is not None and self.first_block in closed:
+                    raise _FoldComplete  # nothing after the first content block is above the fold
+                return
+
+
+def fold_elements(html):
+    """The above-the-fold elements of html, exactly as on the page."""
+    return _parse_fold(html).elements
+
+
+def _parse_fold(html):
+    parser = FoldParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except _FoldComplete:
+        pass
+    return parser
+
+
+def template_fold(html):
+    """
+    The fold of html as its template sees it: the page's own elements down to the first content block,
+    whose contents (page text) are replaced by every CONTENT_TAGS element as a child and a grandchild.
+    Pages of one template get the same elements and the critical set covers any first block's markup.
+    """
+    parser = _parse_fold(html)
+    block = parser.first_block
+    if block is None:
+        return parser.elements
+
+    def inside(el):
+        node = el.parent
+        while node is not None:
+            if node is block:
+                return True
+            node = node.parent
+        return False
+
+    elements = [el for el in parser.elements if not inside(el)]
+    for tag in CONTENT_TAGS:
+        child = _Element(tag, (), block, True)
+        elements.append(child)
+        elements += [_Element(inner, (), child, True) for inner in CONTENT_TAGS]
+    return elements
+
+
+def fold_signature(elements):
+    """
+    Hashable description of the fold structure: each element's ancestor chain of tags and classes.
+    Ids and other attributes (heading anchors, link targets) are per-page and left out.
+    """
+    features = set()
+    for el in elements:
+        chain = []
+        node = el
+        while node is not None:
+            chain.append(node.tag + ''.join(f'.{c}' for c in sorted(node.classes)))
+            node = node.parent
+        features.add('<'.join(chain))
+    return hashlib.sha256('\n'.join(sorted(features)).encode('utf-8')).hexdigest()
+
+
+# --- Matching --------------------------------------------------------------------------------
+
+def _compound_matches(compound, el):
+    if compound['tag'] and compound['tag'] != el.tag:
+        return False
+    if compound['root'] and el.tag != 'html':
+        return False
+    if any(i != el.id for i in compound['ids']):
+        return False
+    if any(c not in el.classes and c not in DYNAMIC_CLASSES for c in compound['classes']):
+        return False
+    for name, op, value in compound['attrs']:
+        if name in DYNAMIC_ATTRIBUTES:
+            continue
+        if name not in el.attrs:
+            return False
+        actual = el.attrs[name]
+        if op is None:
+            continue
+        if not {
+            '=': actual == value,
+            '~=': value in actual.split(),
+            '|=': actual == value or actual.startswith(value + '-'),
+            '^=': actual.startswith(value),
+            '$=': actual.endswith(value),
+            '*=': value in actual,
+        }[op]:
+            return False
+    return True
+
+
+def _complex_matches(parts, el):
+    combinator, compound = parts[-1]
+    if not _compound_matches(compound, el):
+        return False
+    if len(parts) == 1:
+        return True
+    rest = parts[:-1]
+    if combinator in ('+', '~'):
+        return True  # siblings are not tracked; keep the rule
+    if combinator == '>':
+        return el.parent is not None and _complex_matches(rest, el.parent)
+    node = el.parent
+    while node is not None:
+        if _complex_matches(rest, node):
+            return True
+        node = node.parent
+    return False
+
+
+def selector_matches(selector, elements):
+    parts = parse_selector(selector)
+    if parts is None:
+        return True
+    return any(_complex_matches(parts, el) for el in elements)
+
+
+def critical_rules(rules, elements):
+    """Serialize the rules (recursively through @media/@supports) that apply to elements."""
+    out = []
+    for rule in rules:
+        if rule[0] == 'rule':
+            _, selectors, body = rule
+            if any(selector_matches(s, elements) for s in split_selectors(selectors)):
+                out.append(f"{selectors}{{{body}}}")
+        elif rule[0] == 'block':
+            inner = critical_rules(rule[2], elements)
+            if inner:
+                out.append(f"{rule[1]}{{{inner}}}")
+        else:
+            out.append(rule[1])
+    return ''.join(out)
+
+
+def _minify(css):
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{};,>])\s*', r'\1', css).replace(';}', '}')
+
+
+# --- Inlining --------------------------------------------------------------------------------
+
+class CriticalCss:
+    """Critical-CSS extractor for one stylesheet, with a cache shared by every page of a build."""
+
+    def __init__(self, css_path, cache_dir=CACHE_DIR):
+        text = Path(css_path).read_text(encoding='utf-8')
+        self.css_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        self.rules = parse_css(text)
+        self.cache_dir = Path(cache_dir)
+        self.cache = {}
+        self.stats = {'computed': 0, 'cached': 0}
+
+    def critical_for(self, html):
+        elements = template_fold(html)
+        key = hashlib.sha256(f"{CRITICAL_VERSION}:{self.css_hash}:{fold_signature(elements)}".encode()).hexdigest()
+        if key in self.cache:
+            self.stats['cached'] += 1
+            return self.cache[key]
+        path = self.cache_dir / f"{key[:32]}.css"
+        try:
+            css = path.read_text(encoding='utf-8')
+            self.stats['cached'] += 1
+        except OSError:
+            css = _minify(critical_rules(self.rules, elements))
+            write_if_changed(path, css)
+            self.stats['computed'] += 1
+        self.cache[key] = css
+        return css
+
+    def inline(self, html, href):
+        """
+        Inline the critical CSS of html and load the stylesheet linked as href asynchronously.
+        Pages without a <link ... href="{href}" ...> are returned unchanged.
+        """
+        link_re = re.compile(r'<link\b[^>]*\bhref="' + re.escape(href) + r'"[^>]*>')
+        m = link_re.search(html)
+        if not m:
+            return html
+        link_id = re.search(r'\bid="([^"]*)"', m.group(0))
+        id_attr = f' id="{link_id.group(1)}"' if link_id else ''
+        replacement = (
+            f'<style id="critical-css">{self.critical_for(html)}</style>\n'
+            f'  <link{id_attr} rel="preload" href="{href}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">\n'
+            f'  <noscript><link rel="stylesheet" href="{href}"></noscript>'
+        )
+        return html[:m.start()] + replacement + html[m.end():]
+
+    def summary(self):
+        return f"{self.stats['computed']} critical set(s) computed, {self.stats['cached']} reused"
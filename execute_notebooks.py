@@ -0,0 +1,349 @@
+"""
+execute_notebooks.py
+
+Parallel notebook execution on the open-physics-ed kernel (build.py --execute).
+- Each notebook's outputs are cached in _build/exec-cache/ under a key made of the kernel name, the
+  hash of the environment lockfile (requirements.txt) and the hashes of its code cells, in order.
+  A notebook whose key is cached is never re-executed; its cached outputs are applied instead, and the
+  file is rewritten only if they differ from what it holds.
+- Notebooks that do need to run are spread over a pool of pre-started kernels: while a notebook runs,
+  a fresh kernel for the next one is already starting, and every notebook gets a clean kernel.
+- Per-notebook wall-clock timeout (the kernel is interrupted when it runs out) and, on POSIX, a
+  per-kernel address-space limit. Both default from _content.yml (build.execute_timeout,
+  build.execute_memory_mb); concurrency from build.execute_jobs.
+- Reports the runtime of every notebook and its slowest cells.
+- Executed notebooks are written back without nbclient's per-cell timing metadata, so reruns that
+  produce the same outputs leave the files untouched.
+
+Requires nbformat, nbclient and jupyter_client (see requirements.txt).
+
+Usage:
+    python execute_notebooks.py [--files NB1 NB2 ...] [--jobs N] [--timeout S] [--memory-mb MB] [--force] [--debug]
+"""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from build_metrics import record_file
+from notebook_kernel_utils import KERNEL_NAME
+from output_writer import write_if_changed
+
+REPO_ROOT = Path(__file__).parent.resolve()
+EXEC_CACHE_DIR = REPO_ROOT / '_build' / 'exec-cache'
+LOCKFILE = REPO_ROOT / 'requirements.txt'
+DEFAULT_EXECUTE_JOBS = 2
+DEFAULT_TIMEOUT = 600
+DEFAULT_MEMORY_MB = 4096
+SLOWEST_CELLS = 3
+_ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
+# Applies the address-space limit in the kernel process itself, then execs the real kernel command
+_LIMIT_WRAPPER = ("import os, resource, sys; n = int(sys.argv[1]); "
+                  "resource.setrlimit(resource.RLIMIT_AS, (n, n)); os.execvp(sys.argv[2], sys.argv[2:])")
+
+
+def lockfile_hash(path=LOCKFILE):
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except OSError:
+        return ''
+
+
+def code_cells(nb):
+    return [cell for cell in nb.cells if cell.cell_type == 'code']
+
+
+def notebook_cache_key(nb, lock_hash, kernel_name=KERNEL_NAME):
+    """Cache key of a notebook: kernel, environment lockfile and its code cells' sources."""
+    h = hashlib.sha256()
+    h.update(f"{kernel_name}\0{lock_hash}\0".encode('utf-8'))
+    for cell in code_cells(nb):
+        h.update(hashlib.sha256(cell.source.encode('utf-8')).digest())
+    return h.hexdigest()
+
+
+class ExecutionCache:
+    """Executed outputs per cache key, one JSON file per key in _build/exec-cache/ab/abcdef....json."""
+
+    def __init__(self, root=EXEC_CACHE_DIR):
+        self.root = Path(root)
+
+    def path(self, key):
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, nb, timings, source):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        record = {
+            'source': str(source),
+            'cells': [{'execution_count': c.get('execution_count'), 'outputs': c.get('outputs', [])}
+                      for c in code_cells(nb)],
+            'timings': timings,
+        }
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(record), encoding='utf-8')
+        os.replace(tmp, path)
+
+
+def apply_outputs(nb, cells):
+    """Copy cached outputs onto nb's code cells. Returns True if anything changed."""
+    import nbformat
+    changed = False
+    for cell, cached in zip(code_cells(nb), cells):
+        outputs = [nbformat.from_dict(o) for o in cached['outputs']]
+        if cell.get('outputs') != outputs or cell.get('execution_count') != cached['execution_count']:
+            cell.outputs = outputs
+            cell.execution_count = cached['execution_count']
+            changed = True
+    return changed
+
+
+def write_notebook(nb, path):
+    """Serialize nb like nbformat.write and write it only if the bytes differ. Returns True if written."""
+    import nbformat
+    return write_if_changed(path, nbformat.writes(nb) + '\n')
+
+
+def cell_timings(nb):
+    """Per-code-cell runtimes in seconds from nbclient's record_timing metadata; strips that metadata."""
+    timings = []
+    for index, cell in enumerate(code_cells(nb)):
+        execution = cell.metadata.pop('execution', {})
+        start = execution.get('iopub.execute_input')
+        end = execution.get('shell.execute_reply')
+        if start and end:
+            seconds = (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
+            timings.append({'cell': index, 'seconds': round(seconds, 3)})
+    return timings
+
+
+def make_kernel_manager(kernel_name=KERNEL_NAME, memory_mb=None):
+    """KernelManager whose kernel process runs under an address-space limit (POSIX only)."""
+    from jupyter_client import KernelManager
+
+    class LimitedKernelManager(KernelManager):
+        def format_kernel_cmd(self, extra_arguments=None):
+            cmd = super().format_kernel_cmd(extra_arguments)
+            if memory_mb and os.name == 'posix':
+                cmd = [sys.executable, '-c', _LIMIT_WRAPPER, str(memory_mb * 1024 * 1024)] + cmd
+            return cmd
+
+    return LimitedKernelManager(kernel_name=kernel_name)
+
+
+class KernelPool:
+    """
+    Pool of pre-started kernels. acquire() hands out a ready kernel; release() shuts it down and
+    starts a replacement in the background (up to total kernels), so no notebook waits for kernel
+    start-up after the first. The first kernel that fails to start stops the pool: no more kernels
+    are started, and every acquire() that has no ready kernel left raises instead of waiting.
+    """
+
+    def __init__(self, size, total=None, kernel_name=KERNEL_NAME, memory_mb=None):
+        self.kernel_name = kernel_name
+        self.memory_mb = memory_mb
+        self._ready = queue.Queue()
+        self._starter = ThreadPoolExecutor(max_workers=size)
+        self._lock = threading.Lock()
+        self._to_start = total if total is not None else float('inf')  # kernels still needed
+        self._closed = False
+        for _ in range(size):
+            self._start_next()
+
+    def _start_next(self):
+        with self._lock:
+            if self._closed or self._to_start <= 0:
+                return
+            self._to_start -= 1
+        self._starter.submit(self._start_one)
+
+    def _start_one(self):
+        try:
+            km = make_kernel_manager(self.kernel_name, self.memory_mb)
+            km.start_kernel()
+        except Exception as e:
+            with self._lock:
+                self._closed = True
+            self._ready.put(e)
+            return
+        self._ready.put(km)
+
+    def acquire(self):
+        item = self._ready.get()
+        if isinstance(item, Exception):
+            # Put the error back for the next waiter: no replacement kernel is coming
+            self._ready.put(item)
+            raise RuntimeError(f"Could not start kernel '{self.kernel_name}': {item}")
+        return item
+
+    def release(self, km):
+        self._start_next()
+        threading.Thread(target=km.shutdown_kernel, kwargs={'now': True}, daemon=True).start()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._starter.shutdown(wait=True)
+        while not self._ready.empty():
+            item = self._ready.get()
+            if not isinstance(item, Exception):
+                item.shutdown_kernel(now=True)
+
+
+def _chdir_kernel(km, directory, timeout=60):
+    """Pre-started kernels begin in the repository root; move one into the notebook's directory."""
+    kc = km.client()
+    kc.start_channels()
+    try:
+        kc.wait_for_ready(timeout=timeout)
+        kc.execute_interactive(f"import os as _os; _os.chdir({str(directory)!r}); del _os",
+                               silent=True, store_history=False, timeout=timeout)
+    finally:
+        kc.stop_channels()
+
+
+def execute_notebook(path, pool, timeout=DEFAULT_TIMEOUT, debug=False):
+    """
+    Run one notebook on a pooled kernel. Returns (executed notebook, per-cell timings).
+    Raises on cell errors (unless the notebook allows them), timeouts and dead kernels.
+    """
+    import nbformat
+    from nbclient import NotebookClient
+    nb = nbformat.read(path, as_version=4)
+    metadata = copy.deepcopy(nb.metadata)
+    allow_errors = bool(nb.metadata.get('execution', {}).get('allow_errors', False))
+    km = pool.acquire()
+    client = NotebookClient(nb, km=km, timeout=timeout, allow_errors=allow_errors, record_timing=True,
+                            kernel_name=pool.kernel_name, resources={'metadata': {'path': str(Path(path).parent)}})
+    # Per-notebook budget: interrupt the kernel once the whole notebook has used up the timeout
+    watchdog = threading.Timer(timeout, km.interrupt_kernel)
+    watchdog.daemon = True
+    try:
+        _chdir_kernel(km, Path(path).resolve().parent)
+        watchdog.start()
+        client.execute()
+    finally:
+        watchdog.cancel()
+        pool.release(km)
+    # Keep the notebook-level metadata managed by notebook_kernel_utils (nbclient replaces language_info)
+    nb.metadata = metadata
+    return nb, cell_timings(nb)
+
+
+def execution_settings(content_yml='_content.yml'):
+    """(jobs, timeout, memory_mb) from the build section of _content.yml, with defaults."""
+    build = {}
+    if Path(content_yml).exists():
+        from content_parser import load_and_validate_content_yml
+        build = load_and_validate_content_yml(content_yml)['build']
+    return (build.get('execute_jobs', DEFAULT_EXECUTE_JOBS),
+            build.get('execute_timeout', DEFAULT_TIMEOUT),
+            build.get('execute_memory_mb', DEFAULT_MEMORY_MB))
+
+
+def execute_notebooks(files=None, jobs=None, timeout=None, memory_mb=None, force=False, debug=False):
+    """
+    Bring the outputs of files (default: every notebook in the _content.yml toc) up to date,
+    executing only notebooks whose cache key changed. Returns a dict of counts.
+    """
+    import nbformat
+    from copy_ipynb_flat import toc_notebooks
+    default_jobs, default_timeout, default_memory = execution_settings()
+    jobs = jobs or default_jobs
+    timeout = timeout or default_timeout
+    memory_mb = default_memory if memory_mb is None else memory_mb
+    files = list(dict.fromkeys(files or toc_notebooks()))
+    cache = ExecutionCache()
+    lock_hash = lockfile_hash()
+    counts = {'executed': 0, 'cached': 0, 'updated': 0, 'failed': 0, 'missing': 0}
+
+    pending = []
+    for path in files:
+        if not os.path.exists(path):
+            print(f"[WARN] Notebook not found: {path}")
+            counts['missing'] += 1
+            continue
+        nb = nbformat.read(path, as_version=4)
+        key = notebook_cache_key(nb, lock_hash)
+        record = None if force else cache.get(key)
+        if record is None:
+            pending.append((path, key))
+            continue
+        counts['cached'] += 1
+        if apply_outputs(nb, record['cells']) and write_notebook(nb, path):
+            counts['updated'] += 1
+            print(f"[CACHE] Restored outputs of {path}")
+        elif debug:
+            print(f"[CACHE] Up to date: {path}")
+
+    if pending:
+        print(f"[INFO] Executing {len(pending)} notebook(s) on {min(jobs, len(pending))} kernel(s) "
+              f"(timeout {timeout}s, memory limit {memory_mb or 'none'} MB); {counts['cached']} cached")
+        pool = KernelPool(min(jobs, len(pending)), total=len(pending), memory_mb=memory_mb)
+
+        def run(item):
+            path, key = item
+            start = time.perf_counter()
+            try:
+                nb, timings = execute_notebook(path, pool, timeout=timeout, debug=debug)
+            except Exception as e:
+                return path, key, None, None, time.perf_counter() - start, e
+            return path, key, nb, timings, time.perf_counter() - start, None
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(jobs, len(pending))) as executor:
+                for path, key, nb, timings, elapsed, error in executor.map(run, pending):
+                    record_file(path, elapsed, group='execute')
+                    if error is not None:
+                        counts['failed'] += 1
+                        message = _ANSI_RE.sub('', str(error)).strip()
+                        print(f"[ERROR] {path} failed after {elapsed:.1f}s: {type(error).__name__}"
+                              + (f": {message.splitlines()[-1]}" if message else ''))
+                        continue
+                    counts['executed'] += 1
+                    if write_notebook(nb, path):
+                        counts['updated'] += 1
+                    cache.put(key, nb, timings, path)
+                    print(f"[OK] Executed {path} in {elapsed:.1f}s")
+                    slowest = sorted(timings, key=lambda t: -t['seconds'])
+                    for t in (slowest if debug else slowest[:SLOWEST_CELLS]):
+                        print(f"    cell {t['cell']:3d}: {t['seconds']:8.2f}s")
+        finally:
+            pool.close()
+    print(f"[OK] Notebooks: {counts['executed']} executed, {counts['cached']} cached, "
+          f"{counts['updated']} updated on disk, {counts['failed']} failed, {counts['missing']} missing.")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Execute course notebooks on a pool of kernels, skipping unchanged ones.")
+    parser.add_argument('--files', nargs='+', help='Only execute the specified notebooks')
+    parser.add_argument('--jobs', type=int, default=None, help='Concurrent kernels (default: build.execute_jobs)')
+    parser.add_argument('--timeout', type=int, default=None, help='Per-notebook timeout in seconds (default: build.execute_timeout)')
+    parser.add_argument('--memory-mb', type=int, default=None, help='Per-kernel memory limit in MB, 0 for none (default: build.execute_memory_mb)')
+    parser.add_argument('--force', action='store_true', help='Ignore cached outputs and execute every notebook')
+    parser.add_argument('--debug', action='store_true', help='Print every cell timing')
+    args = parser.parse_args()
+    counts = execute_notebooks(args.files, jobs=args.jobs, timeout=args.timeout, memory_mb=args.memory_mb,
+                               force=args.force, debug=args.debug)
+    sys.exit(1 if counts['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
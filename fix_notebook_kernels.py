@@ -4,51 +4,39 @@ fix_notebook_kernels.py
 Batch update all .ipynb notebooks in the repo to use the local Jupyter kernel for the .venv environment.
 - Sets kernelspec name to 'open-physics-ed' and display_name to 'Python (.venv)'.
 - Optionally updates language_info to match the current Python version.
+- Only notebooks whose kernel metadata differs are rewritten (see notebook_kernel_utils.py).
 
 Usage:
     python fix_notebook_kernels.py [notebook_path ...]
     # If no paths are given, will scan content/ for all .ipynb files.
 """
 import sys
-import json
-import glob
-import os
-import platform
 
-KERNEL_NAME = "open-physics-ed"
-KERNEL_DISPLAY_NAME = "Python (.venv)"
-PYTHON_VERSION = f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
+from notebook_kernel_utils import fix_notebook_kernel, fix_all_notebook_kernels, KERNEL_NAME, KERNEL_DISPLAY_NAME, PYTHON_VERSION
 
 
 def fix_kernel(notebook_path):
-    with open(notebook_path, 'r', encoding='utf-8') as f:
-        nb = json.load(f)
-    if 'metadata' not in nb:
-        nb['metadata'] = {}
-    nb['metadata']['kernelspec'] = {
-        "name": KERNEL_NAME,
-        "display_name": KERNEL_DISPLAY_NAME,
-        "language": "python"
-    }
-    nb['metadata']['language_info'] = {
-        "name": "python",
-        "version": PYTHON_VERSION
-    }
-    with open(notebook_path, 'w', encoding='utf-8') as f:
-        json.dump(nb, f, indent=1, ensure_ascii=False)
-    print(f"[OK] Updated kernel in {notebook_path}")
-
+    status = fix_notebook_kernel(notebook_path)
+    if status == 'rewritten':
+        print(f"[OK] Updated kernel in {notebook_path}")
+    elif status == 'failed':
+        print(f"[ERROR] Could not fix kernel in {notebook_path}")
+    return status
 
 def main():
-    if len(sys.argv) > 1:
-        files = sys.argv[1:]
-    else:
-        files = glob.glob("content/**/*.ipynb", recursive=True)
+    if len(sys.argv) == 1:
+        # Whole tree: the notebook index skips notebooks already known to be correct
+        fix_all_notebook_kernels("content/")
+        return
+    files = sys.argv[1:]
     if not files:
         print("No notebooks found.")
         return
+    counts = {'skipped': 0, 'rewritten': 0, 'failed': 0}
     for nb_path in files:
-        fix_kernel(nb_path)
+        counts[fix_kernel(nb_path)] += 1
+    print(f"[INFO] {len(files)} notebooks checked, {counts['skipped']} already correct, "
+          f"{counts['rewritten']} rewritten, {counts['failed']} failed.")
 
 if __name__ == "__main__":
     main()
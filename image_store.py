@@ -0,0 +1,270 @@
+"""
+image_store.py
+
+Content-addressed image store shared by every builder that publishes images.
+- Each image is stored once under its SHA-256 in _build/images/store/ab/abcdef....png.
+- Source hashes are cached by (size, mtime), so unchanged images are only stat()ed.
+- Per-format destinations (docs/images/{stem}_{name}, ...) are reflinks (copy-on-write clones) of
+  the stored object where the filesystem supports them, else copies. They are never hardlinks: a
+  writer that edits a published file in place would otherwise change the object under its old hash.
+  A destination is only touched when it is missing or stale (its size or mtime differs from when it
+  was published, or it is a hardlink left by an older store).
+- Every published destination is recorded with the set of its owners ("<builder>:<source stem>"),
+  since several builders (md:, print:) publish the same docs/images files. retire() withdraws an
+  owner from the destinations a rebuild no longer produces and deletes a file only once no owner is
+  left; gc() does the same for sources that left the TOC, removes unreferenced store objects and
+  deletes objects whose bytes no longer match their hash (they are re-ingested from the source).
+- Sweeps only ever delete files the store itself created (recorded in the index), never images
+  committed by hand.
+
+Usage:
+    from image_store import get_store
+    store = get_store()
+    store.publish('content/images/plot.png', 'docs/images/notes_plot.png', owner='md:notes')
+    store.save()
+    store.gc(live_sources={'notes'}, sweep=['docs/images'])
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).parent.resolve()
+IMAGE_STORE_DIR = REPO_ROOT / '_build' / 'images'
+FICLONE = 0x40049409  # Linux ioctl for reflink (copy-on-write) clones
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _reflink(src, dest):
+    """Clone src to dest with FICLONE. Raises OSError where reflinks are unsupported."""
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dest)
+            raise
+
+
+def link_or_copy(src, dest, hardlink=True):
+    """
+    Materialize src at dest as a hardlink (if allowed), else a reflink, else a copy (e.g. across
+    filesystems). The destination is replaced atomically. Returns 'link', 'reflink' or 'copy'.
+    """
+    dest = Path(dest)
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    method = None
+    if hardlink:
+        try:
+            os.link(src, tmp)
+            method = 'link'
+        except OSError:
+            pass
+    if method is None:
+        try:
+            _reflink(src, tmp)
+            method = 'reflink'
+        except (OSError, ImportError):
+            shutil.copy2(src, tmp)
+            method = 'copy'
+    os.replace(tmp, dest)
+    return method
+
+
+class ImageStore:
+    def __init__(self, root=IMAGE_STORE_DIR):
+        self.root = Path(root)
+        self.objects_dir = self.root / 'store'
+        self.index_path = self.root / 'index.json'
+        self._lock = threading.Lock()
+        self.hashes = {}  # source path -> [size, mtime_ns, sha]
+        self.refs = {}    # destination path -> {'sha': ..., 'owners': [...], 'stat': [size, mtime_ns]}
+        self.created = set()  # destination paths this store has written and not deleted since
+        self.stats = {'published': 0, 'skipped': 0, 'ingested': 0}
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.hashes = data.get('hashes', {})
+                self.refs = data.get('refs', {})
+                for ref in self.refs.values():
+                    # Indexes written before destinations could have several owners
+                    if 'owners' not in ref:
+                        owner = ref.pop('owner', None)
+                        ref['owners'] = [owner] if owner else []
+                self.created = set(data.get('created', self.refs))
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Ignoring unreadable image store index {self.index_path}: {e}")
+
+    def object_path(self, sha, suffix=''):
+        return self.objects_dir / sha[:2] / f"{sha}{suffix.lower()}"
+
+    def source_hash(self, src):
+        """SHA-256 of src, reusing the cached value while size and mtime are unchanged."""
+        src = Path(src).resolve()
+        st = src.stat()
+        key = str(src)
+        cached = self.hashes.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        sha = file_sha256(src)
+        with self._lock:
+            self.hashes[key] = [st.st_size, st.st_mtime_ns, sha]
+        return sha
+
+    def ingest(self, src):
+        """Store src under its content hash (once) and return (sha, object path)."""
+        src = Path(src)
+        sha = self.source_hash(src)
+        obj = self.object_path(sha, src.suffix)
+        if not obj.exists():
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            # Never hardlink sources into the store: an in-place edit would change the object
+            link_or_copy(src, obj, hardlink=False)
+            with self._lock:
+                self.stats['ingested'] += 1
+        return sha, obj
+
+    def publish(self, src, dest, owner=None):
+        """
+        Make dest hold the bytes of src, adding owner to its owners. Returns True if dest was
+        (re)created, False if it was already up to date.
+        """
+        sha, obj = self.ingest(src)
+        dest = Path(dest)
+        key = str(dest.resolve())
+        ref = self.refs.get(key)
+        up_to_date = False
+        if ref is not None and ref['sha'] == sha:
+            try:
+                st = dest.stat()
+                # Indexes written before stats were recorded only have the size to go by
+                recorded = ref.get('stat') or [obj.stat().st_size]
+                # A hardlink into the store (published by an older store) is replaced by a copy
+                up_to_date = (recorded in ([st.st_size, st.st_mtime_ns], [st.st_size])
+                              and not os.path.samefile(dest, obj))
+            except OSError:
+                up_to_date = False
+        if not up_to_date:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            link_or_copy(obj, dest, hardlink=False)
+            st = dest.stat()
+        with self._lock:
+            owners = set(ref['owners']) if ref else set()
+            if owner:
+                owners.add(owner)
+            self.refs[key] = {'sha': sha, 'owners': sorted(owners), 'stat': [st.st_size, st.st_mtime_ns]}
+            self.created.add(key)
+            self.stats['skipped' if up_to_date else 'published'] += 1
+        return not up_to_date
+
+    def retire(self, owner, keep):
+        """
+        Withdraw owner from destinations it published before that are not in keep. Destinations left
+        without owners are dropped and deleted. Returns the deleted destinations.
+        """
+        keep = {str(Path(d).resolve()) for d in keep}
+        with self._lock:
+            stale = self._withdraw(lambda o: o == owner, lambda d: d not in keep)
+        for d in stale:
+            Path(d).unlink(missing_ok=True)
+        return stale
+
+    def _withdraw(self, dead_owner, applies=lambda d: True):
+        """Remove dead owners from the destinations applies() selects; return (and forget) orphaned ones."""
+        orphaned = []
+        for d, ref in list(self.refs.items()):
+            if not ref['owners'] or not applies(d):
+                continue
+            ref['owners'] = [o for o in ref['owners'] if not dead_owner(o)]
+            if not ref['owners']:
+                orphaned.append(d)
+                del self.refs[d]
+                self.created.discard(d)
+        return orphaned
+
+    def gc(self, live_sources=None, sweep=(), debug=False):
+        """
+        Garbage-collect images:
+        - destinations all of whose owners' source stems are not in live_sources (when given),
+        - files in the sweep directories that the store created but no longer references (left over
+          from an interrupted build or a lost reference); other files there are never touched,
+        - store objects that no destination references, and objects whose bytes no longer hash to
+          their name (changed in place); the next publish re-ingests them from the source.
+        Only sweep directories right after a full build, when every live image was republished.
+        Returns (destinations removed, objects removed).
+        """
+        removed_dests = []
+        with self._lock:
+            if live_sources is not None:
+                live_sources = set(live_sources)
+                removed_dests += self._withdraw(lambda o: o.rsplit(':', 1)[-1] not in live_sources)
+            live_shas = {ref['sha'] for ref in self.refs.values()}
+            tracked = set(self.refs)
+            for directory in sweep:
+                directory = Path(directory).resolve()
+                if not directory.is_dir():
+                    continue
+                for path in directory.iterdir():
+                    if path.is_file() and str(path) in self.created and str(path) not in tracked:
+                        removed_dests.append(str(path))
+                        self.created.discard(str(path))
+        for d in removed_dests:
+            Path(d).unlink(missing_ok=True)
+            if debug:
+                print(f"[GC] Removed unreferenced image {d}")
+        removed_objects = 0
+        corrupted = set()
+        if self.objects_dir.exists():
+            for obj in self.objects_dir.glob('*/*'):
+                if obj.stem not in live_shas:
+                    obj.unlink()
+                    removed_objects += 1
+                elif file_sha256(obj) != obj.stem:
+                    print(f"[WARN] Store object {obj} no longer matches its hash; removing it")
+                    corrupted.add(obj.stem)
+                    obj.unlink()
+                    removed_objects += 1
+        with self._lock:
+            for ref in self.refs.values():
+                if ref['sha'] in corrupted:
+                    # Its destinations may hold the same bad bytes: republish them from the source
+                    ref['sha'] = None
+        self.save()
+        print(f"[GC] Removed {len(removed_dests)} stale image(s) and {removed_objects} unreferenced store object(s).")
+        return removed_dests, removed_objects
+
+    def save(self):
+        """Persist the hash cache and reference table atomically."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = json.dumps({'hashes': self.hashes, 'refs': self.refs, 'created': sorted(self.created)},
+                              indent=1, sort_keys=True)
+        tmp = self.index_path.with_name(f"index.json.{os.getpid()}.tmp")
+        tmp.write_text(data, encoding='utf-8')
+        os.replace(tmp, self.index_path)
+
+    def summary(self):
+        s = self.stats
+        return f"{s['published']} image(s) published, {s['skipped']} up to date, {s['ingested']} new in store"
+
+
+_store = None
+
+
+def get_store():
+    """Return the process-wide ImageStore."""
+    global _store
+    if _store is None:
+        _store = ImageStore()
+    return _store
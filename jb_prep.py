@@ -0,0 +1,94 @@
+"""
+jb_prep.py
+
+In-process preparation for `jupyter-book build`, replacing the chain of helper subprocesses
+(convert_content_to_jb_flat.py, fix_notebook_kernels.py, validate_yaml.py, validate_jb_toc.py,
+check_notebook_kernels.py), which remain as thin CLI wrappers around the same functions.
+- _content.yml and _config.yml are parsed once; the flat toc is built in memory, validated from its
+  rendered text and written to _toc.yml only if its content changed.
+- One notebook index (notebook_index.py) is loaded once and shared by the kernel fix, the TOC
+  notebook check and the kernel check.
+- Raises RuntimeError('Step failed: ...') like the subprocess steps did.
+
+Usage:
+    from jb_prep import prepare_jupyter_book
+    prepare_jupyter_book(debug=True)
+    # or: python jb_prep.py [--debug]
+"""
+import argparse
+import sys
+import time
+
+import yaml
+
+from convert_content_to_jb_flat import build_flat_toc, load_content_yml, render_yaml, write_toc_if_changed
+from notebook_index import NotebookIndex
+from notebook_kernel_utils import check_all_notebook_kernels, fix_all_notebook_kernels
+from validate_jb_toc import toc_all_files, toc_duplicates, toc_notebook_errors
+from validate_yaml import validate_yaml_files
+
+NOTEBOOK_ROOT = 'content/'
+
+
+def prepare_jupyter_book(content_yml='_content.yml', toc_yml='_toc.yml', config_yml='_config.yml', debug=False):
+    """Generate _toc.yml, fix and check notebook kernels and validate the book configuration."""
+    start = time.perf_counter()
+    timings = []
+
+    def step(desc, fn):
+        t0 = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            print(f"[ERROR] {desc} failed: {e}")
+            raise RuntimeError(f"Step failed: {desc}") from e
+        timings.append((desc, time.perf_counter() - t0))
+        return result
+
+    # 1. Flat _toc.yml from the in-memory site model
+    content = step('Load _content.yml', lambda: load_content_yml(content_yml))
+    toc = step('Generate flat _toc.yml', lambda: build_flat_toc(content))
+    if step('Write _toc.yml', lambda: write_toc_if_changed(toc, toc_yml)):
+        print(f"[OK] Wrote flat {toc_yml} with {1 + len(toc['chapters'])} files")
+    elif debug:
+        print(f"[OK] {toc_yml} is up to date")
+
+    # 2. Fix notebook kernels (the index skips notebooks already known to be correct)
+    index = NotebookIndex()
+    counts = step('Fix notebook kernels', lambda: fix_all_notebook_kernels(NOTEBOOK_ROOT, debug=debug, index=index))
+    if counts['failed']:
+        raise RuntimeError('Step failed: Fix notebook kernels')
+
+    # 3. Validate YAML, TOC duplicates, TOC notebooks and kernels
+    step(f'Validate {toc_yml} YAML', lambda: yaml.safe_load(render_yaml(toc)))
+    step(f'Validate {config_yml} YAML', lambda: validate_yaml_files([config_yml]))
+    files, duplicates = toc_duplicates(toc)
+    if duplicates:
+        print(f"[ERROR] Duplicate file: {duplicates[0]}")
+        raise RuntimeError(f'Step failed: Validate {toc_yml} for duplicates')
+    if step('Check TOC notebooks', lambda: toc_notebook_errors(toc_all_files(toc, files), index=index)):
+        raise RuntimeError('Step failed: Check TOC notebooks')
+    bad = step('Check notebook kernels', lambda: check_all_notebook_kernels(NOTEBOOK_ROOT, debug=debug, index=index))
+    if bad:
+        print(f"[FAIL] {len(bad)} notebook(s) have wrong kernel.")
+        raise RuntimeError('Step failed: Check notebook kernels')
+
+    if debug:
+        for desc, seconds in timings:
+            print(f"  {seconds * 1000:7.1f} ms  {desc}")
+    print(f"[OK] Jupyter Book prep finished in {time.perf_counter() - start:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare the Jupyter Book sources (toc, kernels, validation) in one process.")
+    parser.add_argument('--debug', action='store_true', help='Print per-step timings and details')
+    args = parser.parse_args()
+    try:
+        prepare_jupyter_book(debug=args.debug)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+latex_build.py
+
+Precompiled-preamble, latexmk-driven LaTeX compilation for the PDF builders.
+- Generates the shared LaTeX preamble once from pandoc's template (using a probe document that
+  enables every optional package block) and caches it by pandoc version and options.
+- Dumps that preamble into a precompiled format file (pdflatex -ini ... \\dump) in _build/pdf/format/,
+  reused until the preamble or the engine version changes.
+- Compiles each document with latexmk in a persistent output directory under _build/pdf/latex/<name>/,
+  so unchanged documents are skipped and LaTeX reruns reuse their auxiliary files. A document counts
+  as unchanged only if its source and the digest of its \\includegraphics files both match.
+- Callers bound LaTeX concurrency with a semaphore (build.latex_jobs in _content.yml).
+- Before running latexmk, compile_document() looks the PDF up in the shared artifact cache (keyed on
+  the engine version, the preamble, the body and the included graphics) and uploads new PDFs to it.
+
+Usage:
+    from latex_build import latex_preamble, ensure_format, compile_document
+    preamble = latex_preamble(graphics_dir)
+    fmt = ensure_format(preamble)
+    pdf = compile_document('notes', body_tex, preamble, fmt=fmt)
+"""
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+from pathlib import Path
+
+from output_writer import write_if_changed
+from pandoc_ast import pandoc_version
+
+REPO_ROOT = Path(__file__).parent.resolve()
+PDF_BUILD_DIR = REPO_ROOT / '_build' / 'pdf'
+FORMAT_DIR = PDF_BUILD_DIR / 'format'
+LATEX_DIR = PDF_BUILD_DIR / 'latex'
+LATEX_ENGINE = 'pdflatex'
+DEFAULT_LATEX_JOBS = 2
+
+# Exercises every optional block of pandoc's LaTeX template (graphics, tables, code
+# highlighting, strikeout, footnotes, links) so one preamble fits every document.
+PREAMBLE_PROBE = """\
+text ~~strike~~ $x^2$ [link](https://example.org) ![image](probe.png) footnote[^1]
+
+[^1]: note
+
+```python
+x = 1
+```
+
+| a | b |
+|---|---|
+| 1 | 2 |
+"""
+
+_engine_versions = {}
+_GRAPHICSPATH_RE = re.compile(r'\\graphicspath\{\{([^}]*)\}\}')
+_INCLUDEGRAPHICS_RE = re.compile(r'\\includegraphics(?:\[[^\]]*\])?\{([^}]*)\}')
+
+
+def _digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8') if isinstance(part, str) else part)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def engine_version(engine=LATEX_ENGINE):
+    """Return the first line of `<engine> --version` (cached per process)."""
+    if engine not in _engine_versions:
+        result = subprocess.run([engine, '--version'], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{engine} --version failed: {result.stderr}")
+        _engine_versions[engine] = result.stdout.splitlines()[0].strip()
+    return _engine_versions[engine]
+
+
+def latex_available(engine=LATEX_ENGINE):
+    """True if both latexmk and the LaTeX engine are on PATH."""
+    return bool(shutil.which('latexmk') and shutil.which(engine))
+
+
+def latex_preamble(graphics_dir, pandoc_args=(), cache_dir=FORMAT_DIR, debug=False):
+    """
+    Return the shared LaTeX preamble (everything before \\begin{document}) for pandoc output.
+    pandoc_args are extra template options (e.g. -V documentclass=book, -M title=...).
+    Generated once and cached until pandoc, the options or graphics_dir change.
+    """
+    graphics_dir = Path(graphics_dir).as_posix()
+    key = _digest(pandoc_version(), PREAMBLE_PROBE, '\0'.join(pandoc_args), graphics_dir)
+    cache_file = Path(cache_dir) / f"preamble-{key[:16]}.src.tex"
+    if cache_file.exists():
+        return cache_file.read_text(encoding='utf-8')
+    if debug:
+        print(f"[INFO] Generating LaTeX preamble ({key[:12]})")
+    cmd = ['pandoc', '-f', 'markdown', '-t', 'latex', '-s'] + list(pandoc_args)
+    result = subprocess.run(cmd, input=PREAMBLE_PROBE, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"pandoc failed generating the LaTeX preamble: {result.stderr}")
+    preamble = result.stdout.split('\\begin{document}')[0]
+    # Images are linked as ../images/<name>, relative to a sibling of docs/images
+    preamble += f"\\graphicspath{{{{{graphics_dir}/}}}}\n"
+    write_if_changed(cache_file, preamble)
+    return preamble
+
+
+def ensure_format(preamble, engine=LATEX_ENGINE, fmt_dir=FORMAT_DIR, debug=False):
+    """
+    Dump preamble into a precompiled format file and return its name (for -fmt), or None if the
+    dump failed. The format is reused until the preamble or the engine version changes.
+    """
+    fmt_dir = Path(fmt_dir)
+    name = f"preamble-{_digest(engine_version(engine), preamble)[:16]}"
+    if (fmt_dir / f"{name}.fmt").exists():
+        return name
+    fmt_dir.mkdir(parents=True, exist_ok=True)
+    write_if_changed(fmt_dir / f"{name}.tex", preamble)
+    cmd = [engine, '-ini', '-interaction=nonstopmode', f"-jobname={name}", f"&{engine} {name}.tex\\dump"]
+    if debug:
+        print(f"[INFO] Dumping LaTeX format: {' '.join(cmd)}")
+    result = subprocess.run(cmd, cwd=fmt_dir, capture_output=True, text=True)
+    if result.returncode != 0 or not (fmt_dir / f"{name}.fmt").exists():
+        print(f"[WARN] Could not precompile LaTeX format {name}; compiling without it.\n{result.stdout[-2000:]}")
+        return None
+    print(f"[OK] Precompiled LaTeX format {fmt_dir / name}.fmt")
+    return name
+
+
+def run_latexmk(tex_path, out_dir, fmt=None, engine=LATEX_ENGINE, fmt_dir=FORMAT_DIR, debug=False):
+    """Compile tex_path with latexmk into out_dir. Returns the PDF path, or None on failure."""
+    tex_path = Path(tex_path)
+    out_dir = Path(out_dir)
+    engine_cmd = f"{engine} -fmt={fmt} %O %S" if fmt else f"{engine} %O %S"
+    cmd = ['latexmk', '-pdf', '-interaction=nonstopmode', '-halt-on-error',
+           f"-pdflatex={engine_cmd}", f"-outdir={out_dir}", tex_path.name]
+    env = dict(os.environ)
+    # Let kpathsea find the dumped format; the trailing separator keeps the default search path
+    env['TEXFORMATS'] = f"{Path(fmt_dir)}{os.pathsep}{env.get('TEXFORMATS', '')}"
+    if debug:
+        print(f"[INFO] Running: {' '.join(cmd)}")
+    result = subprocess.run(cmd, cwd=tex_path.parent, env=env, capture_output=True, text=True)
+    pdf = out_dir / f"{tex_path.stem}.pdf"
+    if result.returncode != 0 or not pdf.exists():
+        print(f"[ERROR] latexmk failed for {tex_path}:\n{result.stdout[-4000:]}")
+        return None
+    return pdf
+
+
+def graphics_digest(body, preamble):
+    """Digest of every graphic body includes (resolved against the preamble's \\graphicspath)."""
+    m = _GRAPHICSPATH_RE.search(preamble)
+    graphics_dir = Path(m.group(1)) if m else Path('.')
+    h = hashlib.sha256()
+    for name in sorted(set(_INCLUDEGRAPHICS_RE.findall(body))):
+        path = graphics_dir / name
+        h.update(name.encode('utf-8') + b'\0')
+        h.update(hashlib.sha256(path.read_bytes()).digest() if path.is_file() else b'missing')
+    return h.hexdigest()
+
+
+def document_source(body, preamble, fmt=None):
+    """Full .tex source for a body; the preamble is left out when it is loaded from the format fmt."""
+    head = f"% preamble loaded from format {fmt}\n" if fmt else preamble
+    return f"{head}\\begin{{document}}\n{body}\n\\end{{document}}\n"
+
+
+def compile_document(name, body, preamble, fmt=None, slots=None, latex_dir=LATEX_DIR, debug=False):
+    """
+    Compile a LaTeX body (the text between \\begin{document} and \\end{document}) using the
+    precompiled preamble format fmt (or the inline preamble when fmt is None). The source is only
+    rewritten when it changed, and latexmk is skipped entirely when the source and the graphics it
+    includes are unchanged (<name>.graphics holds their digest) and its PDF is up to date.
+    slots is an optional semaphore that bounds concurrent LaTeX runs.
+    """
+    work_dir = Path(latex_dir) / name
+    tex_path = work_dir / f"{name}.tex"
+    pdf = work_dir / f"{name}.pdf"
+    stamp = work_dir / f"{name}.graphics"
+    changed = write_if_changed(tex_path, document_source(body, preamble, fmt))
+    graphics = graphics_digest(body, preamble)
+    try:
+        graphics_changed = stamp.read_text(encoding='utf-8') != graphics
+    except OSError:
+        graphics_changed = True
+    if not changed and not graphics_changed and pdf.exists() and pdf.stat().st_mtime >= tex_path.stat().st_mtime:
+        if debug:
+            print(f"[CACHE] PDF up to date: {pdf}")
+        return pdf
+    from artifact_cache import get_artifact_cache, artifact_key
+    artifacts = get_artifact_cache()
+    # The preamble's \graphicspath is absolute; clones at other paths should still share the PDF
+    key = artifact_key('latex-pdf', engine_version(), preamble.replace(str(REPO_ROOT), '<repo>'),
+                       'format' if fmt else 'inline', body, graphics)
+    if artifacts.fetch_file(key, pdf):
+        write_if_changed(stamp, graphics)
+        if debug:
+            print(f"[CACHE] PDF restored from the artifact cache: {pdf}")
+        return pdf
+    if slots is None:
+        result = run_latexmk(tex_path, work_dir, fmt=fmt, debug=debug)
+    else:
+        with slots:
+            result = run_latexmk(tex_path, work_dir, fmt=fmt, debug=debug)
+    if result is not None:
+        write_if_changed(stamp, graphics)
+        artifacts.store_file(key, result)
+    return result
@@ -0,0 +1,201 @@
+"""
+notebook_index.py
+
+Persistent notebook metadata index (_build/cache/notebook_index.json).
+- One entry per notebook path, keyed by (size, mtime): kernelspec, language_info, nbformat version,
+  cell counts, output counts, output bytes and embedded image counts (or the parse error).
+- Refreshed incrementally: unchanged notebooks cost a stat(); changed ones are parsed in parallel
+  across a process pool.
+- Used by the kernel checkers/fixers (notebook_kernel_utils.py) and the Jupyter Book TOC validator,
+  so repeated checks during a build do not re-parse any JSON.
+- Output sizes give a cheap build cost estimate (see `python notebook_index.py --top N`).
+
+Usage:
+    from notebook_index import load_index
+    index = load_index('content/')
+    for path, entry in index.items():
+        print(path, entry['kernelspec'].get('name'))
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).parent.resolve()
+INDEX_PATH = REPO_ROOT / '_build' / 'cache' / 'notebook_index.json'
+INDEX_VERSION = 1
+IMAGE_MIME_PREFIX = 'image/'
+
+
+def scan_notebook(path):
+    """Parse one notebook and summarize it. Runs inside worker processes."""
+    st = os.stat(path)
+    entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            nb = json.load(f)
+    except (OSError, ValueError) as e:
+        entry['error'] = str(e)
+        return path, entry
+    metadata = nb.get('metadata', {}) if isinstance(nb, dict) else {}
+    cells = nb.get('cells', []) if isinstance(nb, dict) else []
+    counts = {'cells': len(cells), 'code_cells': 0, 'markdown_cells': 0,
+              'outputs': 0, 'output_bytes': 0, 'images': 0, 'attachments': 0}
+    for cell in cells:
+        cell_type = cell.get('cell_type')
+        if cell_type == 'code':
+            counts['code_cells'] += 1
+        elif cell_type == 'markdown':
+            counts['markdown_cells'] += 1
+        counts['attachments'] += len(cell.get('attachments', {}) or {})
+        for output in cell.get('outputs', []) or []:
+            counts['outputs'] += 1
+            text = output.get('text')
+            if text:
+                counts['output_bytes'] += len(''.join(text) if isinstance(text, list) else text)
+            for mime, value in (output.get('data') or {}).items():
+                if mime.startswith(IMAGE_MIME_PREFIX):
+                    counts['images'] += 1
+                counts['output_bytes'] += len(''.join(value) if isinstance(value, list) else
+                                              value if isinstance(value, str) else json.dumps(value))
+    entry.update(counts)
+    entry['kernelspec'] = metadata.get('kernelspec', {})
+    entry['language_info'] = metadata.get('language_info', {})
+    entry['nbformat'] = [nb.get('nbformat'), nb.get('nbformat_minor')]
+    return path, entry
+
+
+class NotebookIndex:
+    root = str(REPO_ROOT)
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = Path(path)
+        self.entries = {}
+        self.stats = {'reused': 0, 'scanned': 0, 'removed': 0}  # of the most recent refresh()
+        self.scope = None  # keys of the most recent refresh()
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == INDEX_VERSION:
+                    self.entries = data.get('notebooks', {})
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Ignoring unreadable notebook index {self.path}: {e}")
+        self._dirty = False
+
+    @staticmethod
+    def key(path):
+        return os.path.relpath(os.path.abspath(path), REPO_ROOT)
+
+    def refresh(self, files, jobs=None, prune_root=None, debug=False):
+        """
+        Bring the entries for files up to date, parsing only notebooks whose size or mtime changed.
+        With prune_root, entries under that directory that are not in files are dropped.
+        """
+        self.stats = {'reused': 0, 'scanned': 0, 'removed': 0}
+        stale = []
+        keys = set()
+        for path in files:
+            key = self.key(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            keys.add(key)
+            entry = self.entries.get(key)
+            if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+                self.stats['reused'] += 1
+            else:
+                stale.append(path)
+        if prune_root is not None:
+            prefix = self.key(prune_root).rstrip(os.sep) + os.sep
+            for key in [k for k in self.entries if (k.startswith(prefix) or prefix == '.' + os.sep) and k not in keys]:
+                del self.entries[key]
+                self.stats['removed'] += 1
+                self._dirty = True
+        if stale:
+            if debug:
+                print(f"[INFO] Indexing {len(stale)} changed notebook(s)")
+            jobs = jobs or os.cpu_count() or 1
+            if jobs > 1 and len(stale) > 1:
+                with ProcessPoolExecutor(max_workers=min(jobs, len(stale))) as pool:
+                    results = list(pool.map(scan_notebook, stale))
+            else:
+                results = [scan_notebook(p) for p in stale]
+            for path, entry in results:
+                self.entries[self.key(path)] = entry
+            self.stats['scanned'] += len(stale)
+            self._dirty = True
+        self.scope = sorted(keys)
+        return self
+
+    def get(self, path):
+        return self.entries.get(self.key(path))
+
+    def items(self, files=None):
+        """
+        (key, entry) pairs, keys being paths relative to the repository root (index.root),
+        for files (default: the notebooks of the most recent refresh, else every indexed notebook).
+        """
+        if files is None:
+            keys = self.scope if self.scope is not None else sorted(self.entries)
+            return [(k, self.entries[k]) for k in keys if k in self.entries]
+        return [(self.key(f), self.entries.get(self.key(f))) for f in files]
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({'version': INDEX_VERSION, 'notebooks': self.entries}, indent=1, sort_keys=True),
+                       encoding='utf-8')
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+
+def find_notebooks(root_dir):
+    from content_inventory import inventory_glob
+    return inventory_glob(os.path.join(root_dir, "**", "*.ipynb"), kind='file')
+
+
+def load_index(root_dir='content/', files=None, jobs=None, debug=False, index=None):
+    """
+    Return a NotebookIndex that is current for every notebook under root_dir (or for files),
+    refreshing changed entries and persisting the index. Pass an already loaded index to reuse it
+    (only a stat() per notebook) instead of reading the index file again.
+    """
+    if index is None:
+        index = NotebookIndex()
+    if files is None:
+        index.refresh(find_notebooks(root_dir), jobs=jobs, prune_root=root_dir, debug=debug)
+    else:
+        index.refresh(files, jobs=jobs, debug=debug)
+    index.save()
+    if debug:
+        s = index.stats
+        print(f"[INFO] Notebook index: {s['reused']} cached, {s['scanned']} scanned, {s['removed']} removed")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh and summarize the notebook metadata index.")
+    parser.add_argument('--root', default='content/', help='Root directory to index')
+    parser.add_argument('--top', type=int, default=10, help='Show the N notebooks with the largest outputs')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes for re-indexing')
+    parser.add_argument('--debug', action='store_true', help='Print debug information')
+    args = parser.parse_args()
+    index = load_index(args.root, jobs=args.jobs, debug=args.debug)
+    entries = [(p, e) for p, e in index.items() if 'error' not in e]
+    total = sum(e['output_bytes'] for _, e in entries)
+    print(f"[INFO] {len(entries)} notebooks, {sum(e['cells'] for _, e in entries)} cells, "
+          f"{sum(e['images'] for _, e in entries)} images, {total / 1e6:.1f} MB of outputs")
+    for path, entry in sorted(entries, key=lambda pe: -pe[1]['output_bytes'])[:args.top]:
+        print(f"  {entry['output_bytes'] / 1e6:7.2f} MB  {entry['code_cells']:4d} code cells  {entry['images']:3d} images  {path}")
+    for path, entry in index.items():
+        if 'error' in entry:
+            print(f"[ERROR] {path}: {entry['error']}")
+
+
+if __name__ == '__main__':
+    main()
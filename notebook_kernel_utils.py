@@ -2,60 +2,166 @@
 notebook_kernel_utils.py
 
 Utility functions for fixing and checking Jupyter notebook kernels in a project.
+- Kernel checks read only the top-level metadata block (first line + file tail), not the cells.
+- Notebooks are rewritten only when their kernelspec or language_info differ, atomically and
+  byte-for-byte identical outside the metadata object, so unchanged notebooks keep their mtime.
 """
 import os
+import re
 import json
 import sys
-import glob
+
+from output_writer import write_if_changed
 
 KERNEL_NAME = "open-physics-ed"
 KERNEL_DISPLAY_NAME = "Python (.venv)"
 PYTHON_VERSION = f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
+# The top-level metadata object is searched for in this many bytes at the end of the file
+PROBE_BYTES = 64 * 1024
+_INDENT_RE = re.compile(rb'\{[ \t]*\r?\n([ \t]+)"')
+_KEY_VALUE_RE = re.compile(rb'[ \t]*:[ \t]*\{')
 
 
-def fix_notebook_kernel(path, debug=False):
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            nb = json.load(f)
-        if 'metadata' not in nb:
-            nb['metadata'] = {}
-        nb['metadata']['kernelspec'] = {
+def desired_kernel_metadata():
+    """The kernelspec and language_info every notebook should carry."""
+    return {
+        'kernelspec': {
             "name": KERNEL_NAME,
             "display_name": KERNEL_DISPLAY_NAME,
             "language": "python"
-        }
-        nb['metadata']['language_info'] = {
+        },
+        'language_info': {
             "name": "python",
             "version": PYTHON_VERSION
-        }
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(nb, f, indent=1, ensure_ascii=False)
+        },
+    }
+
+
+def _find_metadata(data, indent, last=True):
+    """Byte offset of the top-level metadata object's '{' in data, or None."""
+    key = b'\n' + indent + b'"metadata"'
+    pos = data.rfind(key) if last else data.find(key)
+    while pos != -1:
+        m = _KEY_VALUE_RE.match(data, pos + len(key))
+        if m:
+            return m.end() - 1
+        pos = data.rfind(key, 0, pos) if last else data.find(key, pos + 1)
+    return None
+
+
+def probe_notebook_metadata(path):
+    """
+    Read only the top-level metadata object of a notebook without parsing its cells.
+    Notebooks are written with the metadata block near the end, so normally only the first
+    line and the last PROBE_BYTES are read. Returns (metadata, start, end, indent) where
+    start/end are byte offsets of the metadata object and indent is the file's indent unit,
+    or None if the file is not laid out as expected (e.g. minified).
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(256)
+        m = _INDENT_RE.match(head)
+        if not m:
+            return None
+        indent = m.group(1)
+        offset = max(0, size - PROBE_BYTES)
+        f.seek(offset)
+        tail = f.read()
+    for base, data in ((offset, tail), (0, None)):
+        if data is None:
+            if offset == 0:
+                break
+            with open(path, 'rb') as f:
+                data = f.read()
+        start = _find_metadata(data, indent, last=base > 0)
+        if start is None:
+            continue
+        try:
+            text = data[start:].decode('utf-8')
+            metadata, end = json.JSONDecoder().raw_decode(text)
+        except ValueError:
+            continue  # object truncated by the tail window; retry on the whole file
+        return metadata, base + start, base + start + len(text[:end].encode('utf-8')), indent
+    return None
+
+
+def fix_notebook_kernel(path, debug=False):
+    """
+    Make sure the notebook at path uses the project kernel. Only the metadata block is probed;
+    the file is rewritten (atomically, byte-for-byte identical outside the metadata object) only
+    when kernelspec or language_info differ. Returns 'skipped', 'rewritten' or 'failed'.
+    """
+    desired = desired_kernel_metadata()
+    try:
+        probe = probe_notebook_metadata(path)
+        if probe is None:
+            # Unusual layout: fall back to a full parse and a standard nbformat-style dump
+            with open(path, 'r', encoding='utf-8') as f:
+                nb = json.load(f)
+            metadata = nb.setdefault('metadata', {})
+            if all(metadata.get(k) == v for k, v in desired.items()):
+                return 'skipped'
+            metadata.update(desired)
+            write_if_changed(path, (json.dumps(nb, indent=1, ensure_ascii=False) + '\n').encode('utf-8'))
+        else:
+            metadata, start, end, indent = probe
+            if all(metadata.get(k) == v for k, v in desired.items()):
+                return 'skipped'
+            metadata.update(desired)
+            with open(path, 'rb') as f:
+                data = f.read()
+            unit = indent.decode('ascii')
+            block = json.dumps(metadata, indent=unit, ensure_ascii=False).replace('\n', '\n' + unit)
+            new_data = data[:start] + block.encode('utf-8') + data[end:]
+            json.loads(new_data)  # never write a notebook we cannot read back
+            write_if_changed(path, new_data)
         if debug:
             print(f"[OK] Fixed kernel in {path}")
-        return True
+        return 'rewritten'
     except Exception as e:
         if debug:
             print(f"[ERROR] Could not fix kernel in {path}: {e}")
-        return False
+        return 'failed'
 
-def fix_all_notebook_kernels(root_dir, debug=False):
-    """Fix all .ipynb files under root_dir recursively."""
-    files = glob.glob(os.path.join(root_dir, "**", "*.ipynb"), recursive=True)
-    if debug:
-        print(f"[INFO] Found {len(files)} notebooks in {root_dir}")
-    count = 0
-    for nb_path in files:
-        if fix_notebook_kernel(nb_path, debug=debug):
-            count += 1
+def fix_all_notebook_kernels(root_dir, debug=False, index=None):
+    """
+    Fix all .ipynb files under root_dir recursively, rewriting only the ones whose kernel
+    metadata differs. Returns a dict with checked/skipped/rewritten/failed counts.
+    index: an already loaded NotebookIndex to reuse.
+    """
+    from notebook_index import load_index
+    index = load_index(root_dir, debug=debug, index=index)
+    desired = desired_kernel_metadata()
+    entries = index.items()
     if debug:
-        print(f"[INFO] Fixed {count} notebooks.")
-    return count
+        print(f"[INFO] Found {len(entries)} notebooks in {root_dir}")
+    counts = {'checked': len(entries), 'skipped': 0, 'rewritten': 0, 'failed': 0}
+    rewritten = []
+    for key, entry in entries:
+        if 'error' not in entry and all(entry.get(k) == v for k, v in desired.items()):
+            # Known-good from the index: the notebook is not even opened
+            counts['skipped'] += 1
+            continue
+        nb_path = os.path.join(index.root, key)
+        status = fix_notebook_kernel(nb_path, debug=debug)
+        counts[status] += 1
+        if status == 'rewritten':
+            rewritten.append(nb_path)
+    if rewritten:
+        index.refresh(rewritten).save()
+    print(f"[INFO] Notebook kernels: {counts['checked']} checked, {counts['skipped']} already correct, "
+          f"{counts['rewritten']} rewritten, {counts['failed']} failed.")
+    return counts
 
 def check_notebook_kernel(path, debug=False):
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            nb = json.load(f)
-        ks = nb.get('metadata', {}).get('kernelspec', {})
+        probe = probe_notebook_metadata(path)
+        if probe is not None:
+            metadata = probe[0]
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f).get('metadata', {})
+        ks = metadata.get('kernelspec', {})
         if ks.get('name') != KERNEL_NAME:
             if debug:
                 print(f"[WARN] Wrong kernel in {path}: {ks}")
@@ -66,11 +172,23 @@ def check_notebook_kernel(path, debug=False):
             print(f"[ERROR] Could not check kernel in {path}: {e}")
         return False
 
-def check_all_notebook_kernels(root_dir, debug=False):
-    files = glob.glob(os.path.join(root_dir, "**", "*.ipynb"), recursive=True)
+def check_all_notebook_kernels(root_dir, debug=False, index=None):
+    """
+    Return the notebooks under root_dir with a wrong (or unreadable) kernel, using the notebook index
+    (index: an already loaded NotebookIndex to reuse).
+    """
+    from notebook_index import load_index
+    index = load_index(root_dir, debug=debug, index=index)
     bad = []
-    for nb_path in files:
-        if not check_notebook_kernel(nb_path, debug=debug):
+    for key, entry in index.items():
+        nb_path = os.path.join(index.root, key)
+        if 'error' in entry:
+            if debug:
+                print(f"[ERROR] Could not check kernel in {nb_path}: {entry['error']}")
+            bad.append(nb_path)
+        elif entry['kernelspec'].get('name') != KERNEL_NAME:
+            if debug:
+                print(f"[WARN] Wrong kernel in {nb_path}: {entry['kernelspec']}")
             bad.append(nb_path)
     if debug:
         if bad:
@@ -0,0 +1,134 @@
+"""
+notebook_variants.py
+
+Slim downloadable variants of a course notebook, published by copy_ipynb_flat.py next to the full copy.
+- clean: outputs cleared, execution counts reset, metadata normalized (only kernelspec/language_info
+  at the top level and tags/jupyter/slideshow on cells).
+- light: outputs kept, but every embedded image (image outputs and cell attachments) is written once,
+  content-addressed, to light/outputs/<sha16>.<ext> and replaced by a Markdown link to the hosted copy.
+  Metadata is normalized as for clean.
+- make_variants() is a pure function of the source bytes and the hosting URL, so it runs in worker
+  processes and its results can be cached by source hash (see copy_ipynb_flat.py).
+
+Usage:
+    from notebook_variants import make_variants
+    outputs = make_variants('content/notebooks/x.ipynb', '_build/ipynb', 'https://user.github.io/repo/')
+"""
+import base64
+import hashlib
+import json
+import re
+from pathlib import Path
+
+from output_writer import write_if_changed
+
+VARIANTS = ('clean', 'light')
+# Bump when the variant format changes so cached variants are regenerated
+VARIANTS_VERSION = 1
+NOTEBOOK_METADATA_KEYS = ('kernelspec', 'language_info')
+CELL_METADATA_KEYS = ('tags', 'jupyter', 'slideshow')
+IMAGE_EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/gif': '.gif', 'image/svg+xml': '.svg'}
+OUTPUTS_DIR = 'outputs'
+_GITHUB_REPO_RE = re.compile(r'^https?://github\.com/([^/]+)/([^/#?]+?)(?:\.git)?/?$')
+
+
+def hosted_base_url(site):
+    """
+    URL the docs/ directory is served from: site.base_url in _content.yml, else the GitHub Pages URL
+    derived from site.github_url, else '' (light variants then link images relative to the notebook).
+    """
+    if site.get('base_url'):
+        return site['base_url'].rstrip('/') + '/'
+    m = _GITHUB_REPO_RE.match(site.get('github_url', '') or '')
+    if m:
+        return f"https://{m.group(1).lower()}.github.io/{m.group(2)}/"
+    return ''
+
+
+def _normalize_metadata(nb):
+    nb['metadata'] = {k: nb['metadata'][k] for k in NOTEBOOK_METADATA_KEYS if k in nb.get('metadata', {})}
+    for cell in nb.get('cells', []):
+        cell['metadata'] = {k: v for k, v in (cell.get('metadata') or {}).items() if k in CELL_METADATA_KEYS}
+    return nb
+
+
+def clean_notebook(nb):
+    """Strip outputs, execution counts and volatile metadata (modifies and returns nb)."""
+    for cell in nb.get('cells', []):
+        if cell.get('cell_type') == 'code':
+            cell['outputs'] = []
+            cell['execution_count'] = None
+    return _normalize_metadata(nb)
+
+
+def _join(value):
+    return ''.join(value) if isinstance(value, list) else value
+
+
+def light_notebook(nb, store_image):
+    """
+    Replace embedded images by links (modifies and returns nb). store_image(mime, data_bytes) saves
+    one image and returns the URL to link to.
+    """
+    for cell in nb.get('cells', []):
+        attachments = cell.pop('attachments', None) or {}
+        if attachments:
+            source = _join(cell.get('source', ''))
+            for name, bundle in attachments.items():
+                for mime, data in bundle.items():
+                    if mime in IMAGE_EXTENSIONS:
+                        url = store_image(mime, _image_bytes(mime, data))
+                        source = source.replace(f'attachment:{name}', url)
+                        break
+            cell['source'] = source.splitlines(keepends=True)
+        for output in cell.get('outputs', []) or []:
+            data = output.get('data')
+            if not data:
+                continue
+            links = []
+            for mime in [m for m in data if m in IMAGE_EXTENSIONS]:
+                url = store_image(mime, _image_bytes(mime, data.pop(mime)))
+                links.append(f"![output]({url})")
+            if links:
+                for mime in IMAGE_EXTENSIONS:
+                    output.get('metadata', {}).pop(mime, None)
+                data['text/markdown'] = [line + '\n' for line in links[:-1]] + links[-1:]
+    return _normalize_metadata(nb)
+
+
+def _image_bytes(mime, data):
+    data = _join(data)
+    if mime == 'image/svg+xml':
+        return data.encode('utf-8')
+    return base64.b64decode(data)
+
+
+def dumps_notebook(nb):
+    """Serialize like nbformat (1-space indent, sorted keys, trailing newline)."""
+    return (json.dumps(nb, indent=1, sort_keys=True, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def make_variants(src, build_dir, base_url=''):
+    """
+    Write build_dir/clean/<name> and build_dir/light/<name> for the notebook src, plus the light
+    variant's images in build_dir/light/outputs/. Returns the list of image file names it links to.
+    """
+    src = Path(src)
+    build_dir = Path(build_dir)
+    raw = src.read_bytes()
+    outputs_dir = build_dir / 'light' / OUTPUTS_DIR
+    images = []
+
+    def store_image(mime, data):
+        name = hashlib.sha256(data).hexdigest()[:16] + IMAGE_EXTENSIONS[mime]
+        path = outputs_dir / name
+        if not path.exists():
+            outputs_dir.mkdir(parents=True, exist_ok=True)
+            write_if_changed(path, data)
+        images.append(name)
+        return f"{base_url}ipynb/light/{OUTPUTS_DIR}/{name}" if base_url else f"{OUTPUTS_DIR}/{name}"
+
+    for variant, transform in (('clean', clean_notebook), ('light', lambda nb: light_notebook(nb, store_image))):
+        (build_dir / variant).mkdir(parents=True, exist_ok=True)
+        write_if_changed(build_dir / variant / src.name, dumps_notebook(transform(json.loads(raw))))
+    return sorted(set(images))
@@ -0,0 +1,152 @@
+"""
+output_writer.py
+
+Shared write-if-changed output layer for generated files (HTML pages, _toc.yml/_config.yml, .autogen
+YAML, theme CSS, notebooks, LaTeX sources).
+- The new content is rendered in memory and compared with the existing file by size, then by SHA-256.
+- Unchanged files are left alone, so their mtime survives and Jupyter Book/Sphinx and the deploy sync
+  see them as untouched. Changed files are written to a temporary file in the same directory and
+  swapped in with os.replace (keeping the old file's permissions), so readers never see a partial file.
+- Outputs streamed to a temporary file go through replace_if_changed() instead.
+- Every call is counted (written/unchanged, bytes written) for the build summary; counts are per process.
+
+Usage:
+    from output_writer import write_if_changed, open_output, output_summary
+    write_if_changed('docs/index.html', html)          # True if the file was (re)written
+    with open_output('_config.yml') as f:               # file-like; compared and written on close
+        yaml.dump(config, f)
+    print(f"[INFO] Outputs: {output_summary()}")
+"""
+import hashlib
+import io
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+_lock = threading.Lock()
+_counts = {'written': 0, 'unchanged': 0, 'bytes_written': 0}
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def _count(key, nbytes=0):
+    with _lock:
+        _counts[key] += 1
+        _counts['bytes_written'] += nbytes
+
+
+def same_content(path, data):
+    """True if the file at path exists and holds exactly data (bytes): size first, then SHA-256."""
+    try:
+        if os.stat(path).st_size != len(data):
+            return False
+        return _file_sha256(path) == hashlib.sha256(data).digest()
+    except OSError:
+        return False
+
+
+def write_if_changed(path, data, encoding='utf-8'):
+    """
+    Atomically write data (str, encoded with encoding, or bytes) to path unless the file already
+    has exactly this content. Creates parent directories. Returns True if the file was written.
+    """
+    if isinstance(data, str):
+        data = data.encode(encoding)
+    path = Path(path)
+    if same_content(path, data):
+        _count('unchanged')
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        if path.exists():
+            shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    _count('written', len(data))
+    return True
+
+
+def replace_if_changed(tmp, path):
+    """
+    For outputs streamed to a temporary file: move the finished tmp over path unless path already
+    has the same bytes (compared by size, then SHA-256), in which case tmp is removed.
+    Returns True if path was replaced.
+    """
+    tmp, path = Path(tmp), Path(path)
+    try:
+        unchanged = (path.stat().st_size == tmp.stat().st_size and
+                     _file_sha256(path) == _file_sha256(tmp))
+    except OSError:
+        unchanged = False
+    if unchanged:
+        tmp.unlink()
+        _count('unchanged')
+        return False
+    size = tmp.stat().st_size
+    if path.exists():
+        shutil.copymode(path, tmp)
+    os.replace(tmp, path)
+    _count('written', size)
+    return True
+
+
+class _OutputBuffer:
+    """In-memory file handed out by open_output(); changed tells whether closing it wrote the file."""
+
+    def __init__(self, binary):
+        self.buffer = io.BytesIO() if binary else io.StringIO()
+        self.changed = None
+
+    def __getattr__(self, name):
+        return getattr(self.buffer, name)
+
+
+@contextmanager
+def open_output(path, mode='w', encoding='utf-8'):
+    """
+    Drop-in for open(path, 'w'/'wb') on generated files: collects what is written and, when the
+    block exits without an exception, hands it to write_if_changed.
+    """
+    if mode not in ('w', 'wb'):
+        raise ValueError(f"open_output supports modes 'w' and 'wb', not {mode!r}")
+    out = _OutputBuffer(binary=(mode == 'wb'))
+    yield out
+    out.changed = write_if_changed(path, out.buffer.getvalue(), encoding=encoding)
+
+
+def output_counts():
+    """Copy of this process's counts: written, unchanged, bytes_written."""
+    with _lock:
+        return dict(_counts)
+
+
+def reset_output_counts():
+    with _lock:
+        for key in _counts:
+            _counts[key] = 0
+
+
+def output_summary():
+    counts = output_counts()
+    return (f"{counts['written']} written ({counts['bytes_written'] / 1e6:.1f} MB), "
+            f"{counts['unchanged']} unchanged")
+
+
+def report_outputs():
+    """Print the output summary if anything was written through this module."""
+    counts = output_counts()
+    if counts['written'] or counts['unchanged']:
+        print(f"[INFO] Generated files: {output_summary()}")
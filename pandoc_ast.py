@@ -0,0 +1,174 @@
+"""
+pandoc_ast.py
+
+Cached pandoc AST stage shared by the print builders (tex, docx, pdf).
+- Runs the pandoc Markdown reader once per source and caches the JSON AST in _build/ast/,
+  keyed on the hash of the input bytes and the pandoc version.
+- Provides a small AST walker so link/image rewriting happens once, as a filter over the AST,
+  instead of one regex pass per output format.
+- Runs pandoc writers from `-f json` against the cached (and filtered) AST.
+
+Usage:
+    from pandoc_ast import read_markdown_ast, rewrite_images, write_ast
+    ast = read_markdown_ast('_build/print/notes.md')
+    ast = rewrite_images(ast, lambda url: '../images/' + url)
+    write_ast(ast, 'docs/tex/notes.tex')
+"""
+import hashlib
+import json
+import os
+import subprocess
+from pathlib import Path
+
+AST_CACHE_DIR = Path(__file__).parent.resolve() / '_build' / 'ast'
+MARKDOWN_READER = 'markdown'
+# AST cache lookups of this process (reported in the build metrics)
+ast_stats = {'hits': 0, 'parsed': 0}
+
+_pandoc_version = None
+
+
+class PandocError(RuntimeError):
+    pass
+
+
+def pandoc_version():
+    """Return the first line of `pandoc --version` (cached for the life of the process)."""
+    global _pandoc_version
+    if _pandoc_version is None:
+        result = subprocess.run(['pandoc', '--version'], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise PandocError(f"pandoc --version failed: {result.stderr}")
+        _pandoc_version = result.stdout.splitlines()[0].strip()
+    return _pandoc_version
+
+
+def ast_cache_key(data):
+    """Cache key for a Markdown source: its bytes, the reader and the pandoc version."""
+    h = hashlib.sha256()
+    h.update(pandoc_version().encode('utf-8'))
+    h.update(b'\0' + MARKDOWN_READER.encode('utf-8') + b'\0')
+    h.update(data)
+    return h.hexdigest()
+
+
+def read_markdown_ast(md_path, cache_dir=AST_CACHE_DIR, debug=False):
+    """
+    Parse md_path with the pandoc Markdown reader and return the JSON AST as a dict.
+    The parsed AST is cached on disk (and shared through the artifact cache), so unchanged sources
+    are never re-read by pandoc.
+    """
+    md_path = Path(md_path)
+    data = md_path.read_bytes()
+    key = ast_cache_key(data)
+    cache_dir = Path(cache_dir)
+    cache_file = cache_dir / f"{key}.json"
+    if cache_file.exists():
+        ast_stats['hits'] += 1
+        if debug:
+            print(f"[CACHE] AST hit for {md_path} ({key[:12]})")
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    from artifact_cache import get_artifact_cache, artifact_key
+    artifacts = get_artifact_cache()
+    shared_key = artifact_key('pandoc-ast', key)
+    if artifacts.fetch_file(shared_key, cache_file):
+        ast_stats['hits'] += 1
+        if debug:
+            print(f"[CACHE] AST restored from the artifact cache for {md_path} ({key[:12]})")
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    if debug:
+        print(f"[INFO] Parsing {md_path} with pandoc ({key[:12]})")
+    ast_stats['parsed'] += 1
+    result = subprocess.run(['pandoc', '-f', MARKDOWN_READER, '-t', 'json'],
+                            input=data, capture_output=True)
+    if result.returncode != 0:
+        raise PandocError(f"pandoc reader failed for {md_path}: {result.stderr.decode('utf-8', 'replace')}")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_file.with_suffix(f'.json.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(result.stdout)
+    os.replace(tmp, cache_file)
+    artifacts.store_file(shared_key, cache_file)
+    return json.loads(result.stdout)
+
+
+def walk(node, action):
+    """
+    Apply action to every element ({'t': ..., 'c': ...} dict) in the AST, bottom-up.
+    action returns None to keep the element, or a replacement element.
+    """
+    if isinstance(node, list):
+        return [walk(item, action) for item in node]
+    if isinstance(node, dict):
+        node = {k: walk(v, action) for k, v in node.items()}
+        if 't' in node:
+            replacement = action(node)
+            if replacement is not None:
+                return replacement
+        return node
+    return node
+
+
+def rewrite_images(ast, rewrite):
+    """
+    Filter every Image element through rewrite(url). rewrite returns either a new URL
+    (string) or a replacement inline element (dict) to substitute for the image.
+    Returns a new AST; the input is not modified.
+    """
+    def action(el):
+        if el['t'] != 'Image':
+            return None
+        attr, alt, (url, title) = el['c']
+        new = rewrite(url)
+        if isinstance(new, dict):
+            return new
+        if new == url:
+            return None
+        return {'t': 'Image', 'c': [attr, alt, [new, title]]}
+    return walk(ast, action)
+
+
+def image_urls(ast):
+    """Return the URL of every Image element in the AST, in document order."""
+    urls = []
+    def action(el):
+        if el['t'] == 'Image':
+            urls.append(el['c'][2][0])
+        return None
+    walk(ast, action)
+    return urls
+
+
+def map_text(ast, fn):
+    """Apply fn to the text of every Str element (code, math and raw elements are untouched)."""
+    def action(el):
+        if el['t'] == 'Str':
+            return {'t': 'Str', 'c': fn(el['c'])}
+        return None
+    return walk(ast, action)
+
+
+def text_inlines(text):
+    """Build a list of Str/Space inlines from plain text."""
+    inlines = []
+    for i, word in enumerate(text.split()):
+        if i:
+            inlines.append({'t': 'Space'})
+        inlines.append({'t': 'Str', 'c': word})
+    return inlines
+
+
+def write_ast(ast, out_path, to=None, resource_path=None, extra_args=()):
+    """Run a pandoc writer from the JSON AST to out_path. The output format is inferred from the suffix unless given."""
+    cmd = ['pandoc', '-f', 'json', '-o', str(out_path)]
+    if to:
+        cmd += ['-t', to]
+    if resource_path:
+        cmd += ['--resource-path', str(resource_path)]
+    cmd += list(extra_args)
+    result = subprocess.run(cmd, input=json.dumps(ast).encode('utf-8'), capture_output=True)
+    if result.returncode != 0:
+        raise PandocError(f"pandoc writer failed for {out_path}: {result.stderr.decode('utf-8', 'replace')}")
+    return out_path
@@ -0,0 +1,359 @@
+"""
+preview_server.py
+
+Local preview server that renders HTML pages on demand (`python build.py --serve`).
+- Pages are rendered on first request by build.HtmlRenderer, with the same templates and site model as
+  the HTML builder. Nothing is written to docs/.
+- Rendered pages and static assets live in a size-bounded in-memory LRU cache. Each entry is tagged with
+  the SHA-256 of its sources (the page's content file plus _content.yml and the page templates, or the
+  asset file); a changed source makes the entry stale. File hashes are reused while size and mtime hold,
+  so a warm hit costs a few stat calls.
+- The tag doubles as a strong ETag: a matching If-None-Match gets 304 without rendering anything.
+- A watcher thread polls the sources and pushes the names of changed pages over server-sent events
+  (/__reload); a script injected into every served page reloads it when it is affected.
+- css/ and images/ are served from static/; any other path falls back to a read-only view of docs/
+  (downloads, Jupyter Book pages, published images).
+
+Usage:
+    python build.py --serve [--port 8000] [--critical-css]
+    python preview_server.py [--port 8000] [--cache-mb 64] [--critical-css]
+"""
+import argparse
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+REPO_ROOT = Path(__file__).parent.resolve()
+TEMPLATES = ['head.html', 'header.html', 'footer.html', 'theme-toggle.html', 'page.html']
+# URL prefix -> directories searched in order; everything else is looked up in docs/
+STATIC_ROOTS = {'css/': ['static/css', 'docs/css'], 'images/': ['static/images', 'docs/images']}
+RELOAD_PATH = '/__reload'
+RELOAD_SCRIPT = f'''<script>
+(function () {{
+  var page = location.pathname.split('/').pop() || 'index.html';
+  new EventSource('{RELOAD_PATH}').onmessage = function (e) {{
+    var changed = e.data.split(' ');
+    if (changed.indexOf('*') >= 0 || changed.indexOf(page) >= 0) location.reload();
+  }};
+}})();
+</script>
+'''
+
+
+class FileHashes:
+    """SHA-256 of files, recomputed only when a file's size or mtime changes."""
+
+    def __init__(self):
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def digest(self, path):
+        """Hex SHA-256 of path, or None if it does not exist."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (st.st_size, st.st_mtime_ns)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        with self._lock:
+            self._hashes[path] = (stamp, h.hexdigest())
+        return h.hexdigest()
+
+
+class LruCache:
+    """Thread-safe LRU mapping bounded by the total size of its values (bytes)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()   # key -> (tag, value)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+
+    def get(self, key, tag):
+        """The value stored under key if it was stored with this tag, else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != tag:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def put(self, key, tag, value):
+        """Store value (bytes); values larger than the whole cache are not kept."""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            if len(value) > self.max_bytes:
+                return
+            self._entries[key] = (tag, value)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats['evicted'] += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def summary(self):
+        s = self.stats
+        return (f"{len(self)} entries, {self.size / 1e6:.1f} MB; "
+                f"{s['hits']} hits, {s['misses']} misses, {s['evicted']} evicted")
+
+
+class PreviewSite:
+    """Renders and caches pages and assets for the preview server."""
+
+    def __init__(self, cache_mb=64, critical_css=False, debug=False):
+        self.critical_css = critical_css
+        self.debug = debug
+        self.hashes = FileHashes()
+        self.cache = LruCache(int(cache_mb * 1024 * 1024))
+        self.site_sources = ['_content.yml'] + [os.path.join('static', 'templates', t) for t in TEMPLATES]
+        if critical_css:
+            self.site_sources.append(os.path.join('static', 'css', 'theme.css'))
+        self._renderer = None
+        self._site_tag = None
+        self._routes = {}
+        self._lock = threading.Lock()
+        self.version = 0
+        self.changed = '*'
+        self._changed = threading.Condition()
+
+    # --- site model ----------------------------------------------------------------------------
+
+    def _site_state(self):
+        """(site tag, renderer, routes), rebuilding the renderer when _content.yml or a template changed."""
+        tag = hashlib.sha256(' '.join(str(self.hashes.digest(p)) for p in self.site_sources).encode()).hexdigest()
+        with self._lock:
+            if tag != self._site_tag:
+                from build import HtmlRenderer
+                renderer = HtmlRenderer(critical_css=self.critical_css, debug=self.debug)
+                # Same output names as build_html_for_files: index pages first, then content files
+                routes = {name: ('index', node) for name, node in renderer.index_pages.items()}
+                for file in renderer.tree.files():
+                    routes[Path(file).stem + '.html'] = ('file', file)
+                self._renderer, self._site_tag, self._routes = renderer, tag, routes
+                print(f"[INFO] Preview: loaded site model ({len(routes)} pages)")
+            return self._site_tag, self._renderer, self._routes
+
+    def page(self, name):
+        """(etag, html bytes) for an output page name like 'notes-fft.html', or None if there is no such page."""
+        site_tag, renderer, routes = self._site_state()
+        route = routes.get(name)
+        if route is None:
+            return None
+        kind, target = route
+        source = self.hashes.digest(target) if kind == 'file' else target.title
+        if source is None:
+            return None
+        etag = hashlib.sha256(f"{site_tag} {kind} {source}".encode()).hexdigest()[:32]
+        body = self.cache.get(('page', name), etag)
+        if body is None:
+            start = time.perf_counter()
+            html = renderer.render_index(target) if kind == 'index' else renderer.render_file(target)
+            if html is None:
+                return None
+            body = inject_reload_script(html).encode('utf-8')
+            self.cache.put(('page', name), etag, body)
+            if self.debug:
+                print(f"[INFO] Rendered {name} in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return etag, body
+
+    def asset(self, url_path):
+        """(etag, bytes) of a static file (static/ first, then docs/), or None if there is no such file."""
+        for prefix, roots in STATIC_ROOTS.items():
+            if url_path.startswith(prefix):
+                candidates = [(root, url_path[len(prefix):]) for root in roots]
+                break
+        else:
+            candidates = [('docs', url_path)]
+        for root, rel in candidates:
+            base = (REPO_ROOT / root).resolve()
+            path = (base / rel).resolve()
+            if base not in path.parents or not path.is_file():
+                continue
+            digest = self.hashes.digest(str(path))
+            if digest is None:
+                continue
+            etag = digest[:32]
+            body = self.cache.get(('asset', str(path)), etag)
+            if body is None:
+                body = path.read_bytes()
+                self.cache.put(('asset', str(path)), etag, body)
+            return etag, body
+        return None
+
+    # --- live reload ---------------------------------------------------------------------------
+
+    def watched(self):
+        """path -> page name it affects ('*' for everything) for every source of the preview."""
+        _, renderer, _ = self._site_state()
+        paths = {p: '*' for p in self.site_sources}
+        for css in Path('static/css').glob('*.css'):
+            paths[str(css)] = '*'
+        for file in renderer.tree.files():
+            paths[file] = Path(file).stem + '.html'
+        return paths
+
+    def watch(self, interval=0.5):
+        """Poll the sources forever; on a change, bump version and wake the /__reload streams."""
+        stamps = {}
+        while True:
+            changed = set()
+            try:
+                watched = self.watched()
+            except Exception as e:
+                print(f"[WARN] Preview: could not load the site model: {e}")
+                watched = {p: '*' for p in self.site_sources}
+            for path, name in watched.items():
+                try:
+                    st = os.stat(path)
+                    stamp = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    stamp = None
+                if path in stamps and stamps[path] != stamp:
+                    changed.add(name)
+                stamps[path] = stamp
+            if changed:
+                with self._changed:
+                    self.version += 1
+                    self.changed = '*' if '*' in changed else ' '.join(sorted(changed))
+                    self._changed.notify_all()
+                print(f"[INFO] Preview: changed {self.changed}")
+            time.sleep(interval)
+
+    def wait_for_change(self, version, timeout):
+        """Block until version moves past the given one (or timeout); returns (version, changed names)."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version, self.changed
+
+
+def inject_reload_script(html):
+    index = html.rfind('</body>')
+    if index < 0:
+        return html + RELOAD_SCRIPT
+    return html[:index] + RELOAD_SCRIPT + html[index:]
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    site = None   # PreviewSite, set by serve()
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        path = unquote(urlsplit(self.path).path).lstrip('/')
+        if '/' + path == RELOAD_PATH:
+            return self._event_stream()
+        name = path or 'index.html'
+        try:
+            found = self.site.page(name) if '/' not in name and name.endswith('.html') else None
+            if found:
+                content_type = 'text/html; charset=utf-8'
+            else:
+                found = self.site.asset(name)
+                content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        except Exception as e:
+            print(f"[ERROR] Preview: failed to render {name}: {e}")
+            return self.send_error(500, f"Failed to render {name}: {e}")
+        if found is None:
+            return self.send_error(404, f"No page or asset named {name}")
+        etag, body = found
+        etag = f'"{etag}"'
+        if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        # Always revalidate: unchanged pages come back as 304
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _event_stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        version = self.site.version
+        try:
+            while True:
+                new_version, changed = self.site.wait_for_change(version, timeout=15)
+                if new_version == version:
+                    self.wfile.write(b': keep-alive\n\n')
+                else:
+                    version = new_version
+                    self.wfile.write(f"data: {changed}\n\n".encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        if self.site.debug:
+            print(f"[HTTP] {self.address_string()} {format % args}")
+
+
+def make_server(site, host='127.0.0.1', port=8000):
+    handler = type('BoundPreviewHandler', (PreviewHandler,), {'site': site})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(host='127.0.0.1', port=8000, cache_mb=64, critical_css=False, debug=False):
+    """Serve the site from memory until interrupted."""
+    os.chdir(REPO_ROOT)
+    site = PreviewSite(cache_mb=cache_mb, critical_css=critical_css, debug=debug)
+    # Load the site model up front so the first request only pays for its own page
+    site.watched()
+    threading.Thread(target=site.watch, daemon=True).start()
+    server = make_server(site, host, port)
+    print(f"[OK] Preview server at http://{host}:{server.server_address[1]}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[INFO] Preview cache: {site.cache.summary()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the site locally, rendering pages on demand.")
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on (default: 8000)')
+    parser.add_argument('--cache-mb', type=float, default=64, help='Memory budget of the page/asset cache in MB (default: 64)')
+    parser.add_argument('--critical-css', action='store_true', help='Inline above-the-fold CSS like build.py --html --critical-css')
+    parser.add_argument('--debug', action='store_true', help='Log every request and render time')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.cache_mb, args.critical_css, args.debug)
+
+
+if __name__ == '__main__':
+    main()
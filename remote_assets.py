@@ -0,0 +1,256 @@
+"""
+remote_assets.py
+
+Local mirror of remote assets (images referenced by http(s) URL) for the print builders.
+- Each URL is fetched once over a shared requests.Session with a bounded connection pool and
+  stored content-addressed in _build/remote-cache/objects/ab/abcdef....png.
+- index.json records, per URL, the object hash plus the ETag / Last-Modified validators, so later
+  builds revalidate with a conditional GET (If-None-Match / If-Modified-Since) and a 304 costs no body.
+- Each URL is revalidated at most once per process; fetch_all() runs a batch concurrently.
+- Offline mode (build.py --offline, or REMOTE_ASSETS_OFFLINE=1) never touches the network and only
+  serves what is already mirrored. A failed revalidation also falls back to the mirrored copy.
+- Every body is mirrored, but embeddable(url) is true only for PNG, JPEG and PDF (the formats pdflatex
+  can include), judged by the Content-Type and the magic bytes, so GIF/SVG/WebP images and HTML error
+  pages served with a 200 are never handed to LaTeX.
+
+Usage:
+    from remote_assets import get_remote_cache
+    cache = get_remote_cache()
+    paths = cache.fetch_all(['https://example.org/figure.png'])   # {url: Path or None}
+    cache.save()
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+REPO_ROOT = Path(__file__).parent.resolve()
+REMOTE_CACHE_DIR = REPO_ROOT / '_build' / 'remote-cache'
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 15
+USER_AGENT = 'open-physics-ed-build (remote asset mirror)'
+# Formats \includegraphics accepts under pdflatex: MIME type -> (suffix, magic bytes)
+EMBEDDABLE_FORMATS = {
+    'image/png': ('.png', b'\x89PNG\r\n\x1a\n'),
+    'image/jpeg': ('.jpg', b'\xff\xd8\xff'),
+    'application/pdf': ('.pdf', b'%PDF-'),
+}
+# Content-Types that say nothing about the format; the magic bytes decide alone
+_GENERIC_TYPES = ('', 'application/octet-stream', 'binary/octet-stream')
+
+
+def is_remote(url):
+    return urlsplit(url).scheme.lower() in ('http', 'https')
+
+
+def _suffix_for(url, content_type=None):
+    suffix = Path(urlsplit(url).path).suffix.lower()
+    if suffix and len(suffix) <= 5:
+        return suffix
+    if content_type:
+        guessed = mimetypes.guess_extension(content_type.split(';')[0].strip())
+        if guessed:
+            return '.jpg' if guessed == '.jpe' else guessed
+    return ''
+
+
+def sniff_format(data, content_type=None):
+    """
+    MIME type of data if it is a PNG, JPEG or PDF and content_type (when specific) agrees, else None.
+    """
+    declared = (content_type or '').split(';')[0].strip().lower()
+    if declared == 'image/jpg':
+        declared = 'image/jpeg'
+    for mime, (_, magic) in EMBEDDABLE_FORMATS.items():
+        if data.startswith(magic):
+            return mime if declared in _GENERIC_TYPES + (mime,) else None
+    return None
+
+
+class RemoteAssetCache:
+    def __init__(self, root=REMOTE_CACHE_DIR, offline=False, max_workers=DEFAULT_MAX_WORKERS,
+                 timeout=DEFAULT_TIMEOUT, session=None):
+        self.root = Path(root)
+        self.objects_dir = self.root / 'objects'
+        self.index_path = self.root / 'index.json'
+        self.offline = offline
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._session = session
+        self._lock = threading.Lock()
+        self._url_locks = {}
+        self._checked = {}  # url -> Path or None, for this process
+        self.entries = {}   # url -> {'sha', 'suffix', 'etag', 'last_modified', 'content_type', 'format', 'checked'}
+        self.stats = {'downloaded': 0, 'revalidated': 0, 'offline': 0, 'failed': 0}
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Ignoring unreadable remote cache index {self.index_path}: {e}")
+
+    @property
+    def session(self):
+        """Shared requests.Session whose connection pool matches the worker count (created lazily)."""
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers, max_retries=2)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['User-Agent'] = USER_AGENT
+                self._session = session
+            return self._session
+
+    def object_path(self, sha, suffix=''):
+        return self.objects_dir / sha[:2] / f"{sha}{suffix}"
+
+    def cached_path(self, url):
+        """Mirrored copy of url, or None if it was never fetched (or the object is gone)."""
+        entry = self.entries.get(url)
+        if not entry:
+            return None
+        path = self.object_path(entry['sha'], entry.get('suffix', ''))
+        return path if path.exists() else None
+
+    def embeddable(self, url):
+        """True if url's mirrored copy is a PNG, JPEG or PDF (see sniff_format)."""
+        path = self.cached_path(url)
+        if path is None:
+            return False
+        entry = self.entries[url]
+        if 'format' not in entry:
+            # Mirrored before formats were recorded
+            with open(path, 'rb') as f:
+                entry['format'] = sniff_format(f.read(16), entry.get('content_type'))
+        return entry['format'] is not None
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def _store(self, url, data, headers):
+        sha = hashlib.sha256(data).hexdigest()
+        fmt = sniff_format(data, headers.get('Content-Type'))
+        suffix = EMBEDDABLE_FORMATS[fmt][0] if fmt else _suffix_for(url, headers.get('Content-Type'))
+        path = self.object_path(sha, suffix)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        with self._lock:
+            self.entries[url] = {
+                'sha': sha,
+                'suffix': suffix,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'content_type': headers.get('Content-Type'),
+                'format': fmt,
+                'checked': time.time(),
+            }
+        return path
+
+    def fetch(self, url, warn=True, debug=False):
+        """
+        Return the local path of url's mirrored bytes, fetching or revalidating it first
+        (at most once per process). Returns None if the asset is unavailable.
+        warn=False silences the warnings for expected misses (e.g. probing fallback URLs).
+        """
+        with self._url_lock(url):
+            if url in self._checked:
+                return self._checked[url]
+            path = self._fetch(url, warn=warn, debug=debug)
+            self._checked[url] = path
+            return path
+
+    def _fetch(self, url, warn=True, debug=False):
+        cached = self.cached_path(url)
+        if self.offline:
+            with self._lock:
+                self.stats['offline' if cached else 'failed'] += 1
+            if cached is None and warn:
+                print(f"[WARN] Offline and not mirrored: {url}")
+            return cached
+        headers = {}
+        if cached is not None:
+            entry = self.entries[url]
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            resp = self.session.get(url, headers=headers, timeout=self.timeout)
+        except Exception as e:
+            with self._lock:
+                self.stats['failed'] += 1
+            if warn or cached:
+                print(f"[WARN] Could not fetch {url}: {e}" + ("; using mirrored copy" if cached else ""))
+            return cached
+        if resp.status_code == 304 and cached is not None:
+            with self._lock:
+                self.entries[url]['checked'] = time.time()
+                self.stats['revalidated'] += 1
+            if debug:
+                print(f"[CACHE] Not modified: {url}")
+            return cached
+        if resp.status_code != 200:
+            with self._lock:
+                self.stats['failed'] += 1
+            if warn or cached:
+                print(f"[WARN] HTTP {resp.status_code} for {url}" + ("; using mirrored copy" if cached else ""))
+            return cached
+        path = self._store(url, resp.content, resp.headers)
+        with self._lock:
+            self.stats['downloaded'] += 1
+        if debug:
+            print(f"[INFO] Mirrored {url} -> {path}")
+        return path
+
+    def fetch_all(self, urls, debug=False):
+        """Fetch a batch of URLs concurrently (bounded by max_workers). Returns {url: Path or None}."""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        workers = 1 if self.offline else min(self.max_workers, len(urls))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(urls, pool.map(lambda u: self.fetch(u, debug=debug), urls)))
+
+    def save(self):
+        """Persist the URL index atomically."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.entries, indent=1, sort_keys=True)
+        tmp = self.index_path.with_name(f"index.json.{os.getpid()}.tmp")
+        tmp.write_text(data, encoding='utf-8')
+        os.replace(tmp, self.index_path)
+
+    def summary(self):
+        s = self.stats
+        return (f"{s['downloaded']} downloaded, {s['revalidated']} not modified, "
+                f"{s['offline']} served offline, {s['failed']} unavailable")
+
+
+_cache = None
+
+
+def get_remote_cache(offline=None):
+    """
+    Return the process-wide RemoteAssetCache. offline defaults to the REMOTE_ASSETS_OFFLINE
+    environment variable; passing it explicitly also switches an existing cache.
+    """
+    global _cache
+    if _cache is None:
+        if offline is None:
+            offline = os.environ.get('REMOTE_ASSETS_OFFLINE', '') not in ('', '0')
+        _cache = RemoteAssetCache(offline=offline)
+    elif offline is not None:
+        _cache.offline = offline
+    return _cache
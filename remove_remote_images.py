@@ -3,6 +3,8 @@ import sys
 import json
 from pathlib import Path
 
+from output_writer import open_output, write_if_changed
+
 def remove_remote_images_from_md(md_content, debug=False):
     pattern = r'!\[[^\]]*\]\((http[^\)]+)\)'
     warning = '\n> **[Image not embedded: remote images are not included in PDF export. Check the original file for the image.]**\n'
@@ -16,8 +18,7 @@ def process_md_file(input_path, output_path, debug=False):
     with open(input_path, 'r', encoding='utf-8') as f:
         md_content = f.read()
     new_content = remove_remote_images_from_md(md_content, debug=debug)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(new_content)
+    write_if_changed(output_path, new_content)
     if debug:
         print(f"[DEBUG] Processed Markdown: {input_path} -> {output_path}")
 
@@ -42,7 +43,7 @@ def process_ipynb_file(input_path, output_path, debug=False):
                 if debug:
                     print(f"[DEBUG] Removed remote images from notebook cell {idx+1}")
     if changed:
-        with open(output_path, 'w', encoding='utf-8') as f:
+        with open_output(output_path) as f:
             json.dump(nb, f, indent=1, ensure_ascii=False)
         if debug:
             print(f"[DEBUG] Processed Notebook: {input_path} -> {output_path}")
@@ -1,22 +1,328 @@
+"""
+sanitize_unicode.py
+
+Table-driven Unicode sanitizer for the PDF (LaTeX) builds.
+- One transliteration table: Greek letters and math symbols become TeX math
+  (\\ensuremath{...}, passed through by pandoc's raw_tex extension), emoji become short text
+  labels, and typographic punctuation becomes plain ASCII that pandoc's smart extension re-typesets.
+- The table is compiled once into a single str.translate map (single code points) plus one regex
+  for multi-code-point sequences (emoji with variation selectors, skin tones, ZWJ sequences).
+  Emoji without a table entry are dropped.
+- Markdown-aware: fenced code blocks, inline code spans, inline/display math, LaTeX math
+  environments and link targets are left untouched. ASCII-only lines skip the engine entirely.
+- Files are streamed line by line in chunks, so large notebook exports are never held in memory twice.
+- Extra entries can be configured in _content.yml under build.unicode_replacements; their values are
+  inserted verbatim into the Markdown.
+
+Usage:
+    python sanitize_unicode.py FILE [FILE ...]        # sanitize files in place
+    from sanitize_unicode import sanitize_text, sanitize_file
+    sanitize_file('_build/print/notes.md', '_build/print/notes.pdf.md')
+"""
+import os
 import re
 import sys
+from pathlib import Path
 
+from output_writer import replace_if_changed
+
+# Emoji and pictographs -> text labels
 UNICODE_REPLACEMENTS = {
     "✅": "[Check]",
+    "✔": "[Check]",
+    "✓": "[Check]",
+    "☑": "[Check]",
+    "❌": "[X]",
+    "✖": "[X]",
+    "✗": "[X]",
+    "❎": "[X]",
+    "⚠": "[Warning]",
+    "❗": "[!]",
+    "❕": "[!]",
+    "❓": "[?]",
+    "❔": "[?]",
+    "ℹ": "[Info]",
     "🚀": "[Rocket]",
-    "μ": "mu",
-    # Add more as needed
+    "📄": "[Document]",
+    "📃": "[Document]",
+    "📝": "[Memo]",
+    "✍": "[Writing]",
+    "📐": "[Ruler]",
+    "📏": "[Ruler]",
+    "📓": "[Notebook]",
+    "📒": "[Notebook]",
+    "📔": "[Notebook]",
+    "📚": "[Books]",
+    "📖": "[Book]",
+    "🔗": "[Link]",
+    "📌": "[Pin]",
+    "📎": "[Clip]",
+    "💡": "[Idea]",
+    "🎯": "[Target]",
+    "📊": "[Chart]",
+    "📈": "[Chart]",
+    "📉": "[Chart]",
+    "🔍": "[Search]",
+    "🔎": "[Search]",
+    "🧮": "[Abacus]",
+    "🧪": "[Experiment]",
+    "🔬": "[Microscope]",
+    "🔭": "[Telescope]",
+    "🧲": "[Magnet]",
+    "🌍": "[Earth]",
+    "🌎": "[Earth]",
+    "🌏": "[Earth]",
+    "🌙": "[Moon]",
+    "☀": "[Sun]",
+    "⭐": "[Star]",
+    "🌟": "[Star]",
+    "✨": "[Sparkles]",
+    "🎉": "[Celebrate]",
+    "👍": "[Thumbs up]",
+    "👎": "[Thumbs down]",
+    "👉": "[->]",
+    "👈": "[<-]",
+    "👀": "[Look]",
+    "🤔": "[Thinking]",
+    "😀": "[Smile]",
+    "😃": "[Smile]",
+    "😄": "[Smile]",
+    "🙂": "[Smile]",
+    "😉": "[Wink]",
+    "❤": "[Heart]",
+    "🔥": "[Fire]",
+    "⚡": "[Lightning]",
+    "💻": "[Computer]",
+    "🖥": "[Computer]",
+    "🐍": "[Python]",
+    "🛠": "[Tools]",
+    "🔧": "[Tool]",
+    "⚙": "[Settings]",
+    "🧠": "[Brain]",
+    "🔑": "[Key]",
+    "🔒": "[Locked]",
+    "⏱": "[Timer]",
+    "⏰": "[Clock]",
+    "🕒": "[Clock]",
+    "📅": "[Calendar]",
+    "📦": "[Package]",
+    "🏁": "[Finish]",
+    "🚧": "[Work in progress]",
+    "❄": "[Snowflake]",
+    "💧": "[Drop]",
+    "🎓": "[Graduate]",
+    "🏆": "[Trophy]",
+    "🔔": "[Bell]",
+    "🆕": "[New]",
+}
+
+# Greek letters and math symbols -> TeX math (wrapped in \ensuremath{} when compiled)
+GREEK_MATH = {
+    "α": r"\alpha", "β": r"\beta", "γ": r"\gamma", "δ": r"\delta", "ε": r"\varepsilon",
+    "ϵ": r"\epsilon", "ζ": r"\zeta", "η": r"\eta", "θ": r"\theta", "ϑ": r"\vartheta",
+    "ι": r"\iota", "κ": r"\kappa", "λ": r"\lambda", "μ": r"\mu", "µ": r"\mu", "ν": r"\nu",
+    "ξ": r"\xi", "π": r"\pi", "ϖ": r"\varpi", "ρ": r"\rho", "ϱ": r"\varrho", "σ": r"\sigma",
+    "ς": r"\varsigma", "τ": r"\tau", "υ": r"\upsilon", "φ": r"\varphi", "ϕ": r"\phi",
+    "χ": r"\chi", "ψ": r"\psi", "ω": r"\omega",
+    "Γ": r"\Gamma", "Δ": r"\Delta", "Θ": r"\Theta", "Λ": r"\Lambda", "Ξ": r"\Xi",
+    "Π": r"\Pi", "Σ": r"\Sigma", "Υ": r"\Upsilon", "Φ": r"\Phi", "Ψ": r"\Psi", "Ω": r"\Omega",
+    "\u2126": r"\Omega",
+    "∞": r"\infty", "≈": r"\approx", "≃": r"\simeq", "∼": r"\sim", "≡": r"\equiv",
+    "≠": r"\neq", "≤": r"\leq", "≥": r"\geq", "≪": r"\ll", "≫": r"\gg", "±": r"\pm",
+    "∓": r"\mp", "×": r"\times", "÷": r"\div", "·": r"\cdot", "⋅": r"\cdot", "∝": r"\propto",
+    "→": r"\rightarrow", "←": r"\leftarrow", "↔": r"\leftrightarrow", "⇒": r"\Rightarrow",
+    "⇐": r"\Leftarrow", "⇔": r"\Leftrightarrow", "↦": r"\mapsto", "↑": r"\uparrow",
+    "↓": r"\downarrow", "∂": r"\partial", "∇": r"\nabla", "∑": r"\sum", "∏": r"\prod",
+    "∫": r"\int", "∮": r"\oint", "√": r"\surd", "∈": r"\in", "∉": r"\notin", "⊂": r"\subset",
+    "⊆": r"\subseteq", "∪": r"\cup", "∩": r"\cap", "∅": r"\emptyset", "∀": r"\forall",
+    "∃": r"\exists", "¬": r"\neg", "∧": r"\wedge", "∨": r"\vee", "⊥": r"\perp",
+    "∥": r"\parallel", "∠": r"\angle", "°": r"^\circ", "ℏ": r"\hbar", "ℓ": r"\ell",
+    "ℝ": r"\mathbb{R}", "ℂ": r"\mathbb{C}", "ℕ": r"\mathbb{N}", "ℤ": r"\mathbb{Z}",
+    "⟨": r"\langle", "⟩": r"\rangle", "†": r"\dagger", "⊗": r"\otimes", "⊕": r"\oplus",
+    "²": r"^{2}", "³": r"^{3}", "¹": r"^{1}", "⁰": r"^{0}", "⁴": r"^{4}", "⁻": r"^{-}",
+    "₀": r"_{0}", "₁": r"_{1}", "₂": r"_{2}", "₃": r"_{3}",
+}
+
+# Typographic punctuation and invisible characters -> ASCII (or nothing)
+PUNCTUATION = {
+    "“": '"', "”": '"', "„": '"', "‘": "'", "’": "'", "‚": "'", "′": "'", "″": "''",
+    "«": '"', "»": '"', "—": "---", "–": "--", "‐": "-", "‑": "-", "‒": "-", "−": "-",
+    "…": "...", "•": "-", "\u00a0": " ", "\u202f": " ", "\u2009": " ", "\u2002": " ",
+    "\u2003": " ", "\u200b": "", "\u00ad": "", "\ufeff": "",
 }
 
+# Code points that only modify a neighbouring emoji (variation selectors, ZWJ, skin tones)
+EMOJI_MODIFIERS = ["\ufe0e", "\ufe0f", "\u200d", "\u20e3"] + [chr(c) for c in range(0x1F3FB, 0x1F400)]
+# Pictographic blocks; anything here without a table entry is dropped
+EMOJI_RANGES = [(0x1F000, 0x1FAFF), (0x2600, 0x27BF), (0x2B00, 0x2BFF), (0x1F1E6, 0x1F1FF)]
+
+# Markdown regions that must not be rewritten (matched within one line)
+PROTECTED_INLINE_RE = re.compile(
+    r'(`+).*?(?<!`)\1(?!`)'            # code spans
+    r'|\$\$.*?\$\$'                      # one-line display math
+    r'|\$(?=\S)[^$\n]*?(?<=\S)\$(?!\d)'  # inline math (pandoc rules)
+    r'|\\\(.*?\\\)|\\\[.*?\\\]'          # \( \) and \[ \] math
+    r'|\]\([^)\s]*'                      # link/image targets
+)
+NON_ASCII_RE = re.compile(r'[^\x00-\x7f]+')
+FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+MATH_ENV_BEGIN_RE = re.compile(r'\\begin\{(equation|align|gather|multline|eqnarray|displaymath|math)\*?\}')
+
+
+def compile_table(text_table, math_table, emoji_fallback=''):
+    """
+    Compile the replacement tables into (translate_map, multi_re, multi_map).
+    Single code points go into the str.translate map; longer keys into one alternation regex.
+    """
+    table = {}
+    for start, end in EMOJI_RANGES:
+        for cp in range(start, end + 1):
+            table[chr(cp)] = emoji_fallback
+    for ch in EMOJI_MODIFIERS:
+        table[ch] = ''
+    table.update(PUNCTUATION)
+    table.update({k: f"\\ensuremath{{{v}}}" for k, v in math_table.items()})
+    table.update(text_table)
+    single = {ord(k): v for k, v in table.items() if len(k) == 1}
+    multi = {k: v for k, v in table.items() if len(k) > 1}
+    multi_re = None
+    if multi:
+        keys = sorted(multi, key=len, reverse=True)
+        multi_re = re.compile('|'.join(re.escape(k) for k in keys))
+    return single, multi_re, multi
+
+
+class Sanitizer:
+    """A compiled sanitizer. Build once (see get_sanitizer) and reuse for every file."""
+
+    def __init__(self, text_table=None, math_table=None, extra=None, emoji_fallback=''):
+        text_table = dict(UNICODE_REPLACEMENTS if text_table is None else text_table)
+        text_table.update(extra or {})
+        self.translate_map, self.multi_re, self.multi_map = compile_table(
+            text_table, GREEK_MATH if math_table is None else math_table, emoji_fallback)
+
+    def sanitize_plain(self, text):
+        """Sanitize text with no Markdown context (every character is rewritten)."""
+        if text.isascii():
+            return text
+        if self.multi_re is not None:
+            text = self.multi_re.sub(lambda m: self.multi_map[m.group(0)], text)
+        # str.translate with string values is per-character Python work; only feed it the non-ASCII runs
+        return NON_ASCII_RE.sub(lambda m: m.group(0).translate(self.translate_map), text)
+
+    def _sanitize_line(self, line):
+        if line.isascii():
+            return line
+        out = []
+        pos = 0
+        for m in PROTECTED_INLINE_RE.finditer(line):
+            out.append(self.sanitize_plain(line[pos:m.start()]))
+            out.append(m.group(0))
+            pos = m.end()
+        out.append(self.sanitize_plain(line[pos:]))
+        return ''.join(out)
+
+    def sanitize_lines(self, lines):
+        """
+        Sanitize an iterable of Markdown lines (with line endings), yielding the output lines.
+        Fenced code, display math and LaTeX math environments pass through untouched.
+        """
+        fence = None       # closing fence marker while inside a fenced code block
+        math_end = None    # closing token while inside display math / a math environment
+        for line in lines:
+            if fence is not None:
+                m = FENCE_RE.match(line)
+                if m and m.group(1)[0] == fence[0] and len(m.group(1)) >= len(fence) and not line[m.end():].strip():
+                    fence = None
+                yield line
+                continue
+            if math_end is not None:
+                if math_end in line:
+                    math_end = None
+                yield line
+                continue
+            m = FENCE_RE.match(line)
+            if m:
+                fence = m.group(1)
+                yield line
+                continue
+            stripped = line.strip()
+            if stripped.startswith('$$') and line.count('$$') % 2 == 1:
+                math_end = '$$'
+                yield line
+                continue
+            env = MATH_ENV_BEGIN_RE.search(line)
+            if env and f"\\end{{{env.group(1)}" not in line:
+                math_end = f"\\end{{{env.group(1)}"
+                yield line
+                continue
+            yield self._sanitize_line(line)
+
+    def sanitize(self, text):
+        """Sanitize a Markdown string, leaving code and math alone."""
+        if text.isascii():
+            return text
+        return ''.join(self.sanitize_lines(text.splitlines(keepends=True)))
+
+    def sanitize_stream(self, fin, fout, chunk_size=1 << 20):
+        """Stream Markdown from fin to fout in chunks of about chunk_size characters."""
+        def lines():
+            while True:
+                batch = fin.readlines(chunk_size)
+                if not batch:
+                    return
+                yield from batch
+        buf = []
+        size = 0
+        for line in self.sanitize_lines(lines()):
+            buf.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                fout.write(''.join(buf))
+                buf, size = [], 0
+        fout.write(''.join(buf))
+
+
+_sanitizer = None
+
+
+def configured_replacements(content_yml='_content.yml'):
+    """Extra replacements from build.unicode_replacements in _content.yml (empty if unset)."""
+    if not os.path.exists(content_yml):
+        return {}
+    from content_parser import load_and_validate_content_yml
+    content = load_and_validate_content_yml(content_yml)
+    return dict(content.get('build', {}).get('unicode_replacements') or {})
+
+
+def get_sanitizer():
+    """Return the process-wide Sanitizer compiled from the built-in tables and _content.yml."""
+    global _sanitizer
+    if _sanitizer is None:
+        _sanitizer = Sanitizer(extra=configured_replacements())
+    return _sanitizer
+
+
 def sanitize_text(text):
-    for uni, repl in UNICODE_REPLACEMENTS.items():
-        text = text.replace(uni, repl)
-    return text
+    """Sanitize a Markdown string with the default tables."""
+    return get_sanitizer().sanitize(text)
+
+
+def sanitize_file(src, dest=None, chunk_size=1 << 20):
+    """
+    Stream-sanitize src into dest (in place when dest is None). dest is only replaced when its
+    contents change, so its mtime stays stable for unchanged sources. Returns True if dest was written.
+    """
+    src = Path(src)
+    dest = Path(dest) if dest is not None else src
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    sanitizer = get_sanitizer()
+    with open(src, 'r', encoding='utf-8') as fin, open(tmp, 'w', encoding='utf-8', newline='') as fout:
+        sanitizer.sanitize_stream(fin, fout, chunk_size=chunk_size)
+    return replace_if_changed(tmp, dest)
+
 
 if __name__ == "__main__":
     for fname in sys.argv[1:]:
-        with open(fname, "r", encoding="utf-8") as f:
-            content = f.read()
-        new_content = sanitize_text(content)
-        with open(fname, "w", encoding="utf-8") as f:
-            f.write(new_content)
\ No newline at end of file
+        if sanitize_file(fname):
+            print(f"[OK] Sanitized {fname}")
@@ -0,0 +1,74 @@
+"""
+Throughput benchmark for sanitize_unicode.py on the full course.
+Collects the text of every markdown file and every notebook (all cell sources) listed in
+_content.yml, then times the legacy per-entry str.replace loop against the compiled sanitizer.
+
+Usage (from the repository root):
+    python scripts/bench_sanitize.py [--repeat N]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from content_parser import load_and_validate_content_yml, get_all_content_files
+from sanitize_unicode import UNICODE_REPLACEMENTS, Sanitizer
+
+
+def course_text():
+    content = load_and_validate_content_yml('_content.yml')
+    parts = []
+    for file in get_all_content_files(content):
+        path = Path(file)
+        if not path.exists():
+            continue
+        if path.suffix.lower() == '.md':
+            parts.append(path.read_text(encoding='utf-8'))
+        elif path.suffix.lower() == '.ipynb':
+            with open(path, 'r', encoding='utf-8') as f:
+                nb = json.load(f)
+            for cell in nb.get('cells', []):
+                source = cell.get('source', '')
+                source = ''.join(source) if isinstance(source, list) else source
+                fence = '```\n' if cell.get('cell_type') == 'code' else ''
+                parts.append(f"{fence}{source}\n{fence}")
+    return '\n'.join(parts)
+
+
+def legacy_sanitize(text):
+    for uni, repl in UNICODE_REPLACEMENTS.items():
+        text = text.replace(uni, repl)
+    return text
+
+
+def bench(name, fn, text, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    mb = len(text.encode('utf-8')) / 1e6
+    print(f"{name:<24} {best * 1000:9.2f} ms  {mb / best:9.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Unicode sanitizer on the full course.")
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per variant (best is reported)')
+    args = parser.parse_args()
+    text = course_text()
+    print(f"[INFO] Course text: {len(text.encode('utf-8')) / 1e6:.2f} MB, "
+          f"{sum(1 for c in text if ord(c) > 127)} non-ASCII characters")
+    start = time.perf_counter()
+    sanitizer = Sanitizer()
+    print(f"[INFO] Compiled table in {(time.perf_counter() - start) * 1000:.1f} ms")
+    bench('legacy str.replace', legacy_sanitize, text, args.repeat)
+    bench('compiled (plain)', sanitizer.sanitize_plain, text, args.repeat)
+    bench('compiled (markdown)', sanitizer.sanitize, text, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
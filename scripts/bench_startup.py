@@ -0,0 +1,100 @@
+"""
+Start-up benchmark for the build.py CLI, with a regression budget.
+Runs `python -X importtime build.py --help` and `python -X importtime -c "import build"` several
+times, subtracts a bare interpreter start (`python -c pass`), and reports:
+- the wall-clock overhead build.py adds on top of the interpreter (best of N runs),
+- the modules build.py imports itself and their cumulative import time,
+- any heavy module (markdown, yaml, nbformat, requests, ...) loaded before a builder runs.
+It also runs a single-file LaTeX build (`build.py --tex --files scripts/fixtures/bench_fixture.md`)
+and checks that it loads only what the print path needs: HTML/Markdown/notebook modules creeping
+into it fail the benchmark. Its time includes pandoc, so it is reported but not held to the budget;
+its output (docs/tex/bench_fixture.tex) is removed and its metrics are not recorded.
+Exits nonzero when the overhead exceeds --budget-ms or a heavy module is imported eagerly.
+
+Usage (from the repository root):
+    python scripts/bench_startup.py [--repeat N] [--budget-ms MS] [--top N]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+# Only the builders that need these may import them
+HEAVY_MODULES = ('markdown', 'yaml', 'nbformat', 'nbclient', 'jupyter_client', 'requests', 'content_parser',
+                 'menu_parser', 'build_menu_html', 'notebook_kernel_utils', 'pandoc_ast', 'image_store',
+                 'build_metrics')
+FIXTURE = Path('scripts') / 'fixtures' / 'bench_fixture.md'
+# name -> (arguments, heavy modules the scenario may load, held to the start-up budget)
+SCENARIOS = {
+    'build.py --help': (['build.py', '--help'], (), True),
+    'import build': (['-c', 'import build'], (), True),
+    'build.py --tex --files <fixture>': (
+        ['build.py', '--tex', '--files', str(FIXTURE)],
+        ('yaml', 'content_parser', 'pandoc_ast', 'image_store', 'build_metrics', 'requests'), False),
+}
+# Outputs of the fixture build, removed after each run
+FIXTURE_OUTPUTS = (Path('docs') / 'tex' / 'bench_fixture.tex',)
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def run(args):
+    """(wall seconds, {top-level module: cumulative microseconds}, all imported module names)."""
+    env = dict(os.environ, BUILD_METRICS_PATH=os.path.join(tempfile.gettempdir(), 'bench_startup_metrics.jsonl'))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=REPO_ROOT,
+                            capture_output=True, text=True, env=env)
+    wall = time.perf_counter() - start
+    for output in FIXTURE_OUTPUTS:
+        (REPO_ROOT / output).unlink(missing_ok=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{result.stderr}")
+    top, names = {}, set()
+    for line in result.stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        names.add(m.group(4))
+        if len(m.group(3)) == 1:  # top-level import (one space of indentation)
+            top[m.group(4)] = int(m.group(2))
+    return wall, top, names
+
+
+def best_of(args, repeat):
+    runs = [run(args) for _ in range(repeat)]
+    return min(r[0] for r in runs), min(runs, key=lambda r: r[0])[1], runs[0][2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure build.py start-up time and eager imports.")
+    parser.add_argument('--repeat', type=int, default=7, help='Runs per scenario (best is reported)')
+    parser.add_argument('--budget-ms', type=float, default=40.0, help='Maximum start-up overhead over a bare interpreter')
+    parser.add_argument('--top', type=int, default=8, help='Show the N most expensive imports per scenario')
+    args = parser.parse_args()
+
+    base_wall, base_top, base_names = best_of(['-c', 'pass'], args.repeat)
+    print(f"[INFO] Bare interpreter start: {base_wall * 1000:.1f} ms")
+    ok = True
+    for name, (cmd, allowed, timed) in SCENARIOS.items():
+        wall, top, names = best_of(cmd, args.repeat)
+        overhead = (wall - base_wall) * 1000
+        own = {mod: us for mod, us in top.items() if mod not in base_top}
+        heavy = sorted({m.split('.')[0] for m in names - base_names} & (set(HEAVY_MODULES) - set(allowed)))
+        within = overhead <= args.budget_ms or not timed
+        ok &= within and not heavy
+        budget = f"budget {args.budget_ms:.0f} ms" if timed else "includes the build, not budgeted"
+        print(f"[{'PASS' if within else 'FAIL'}] {name}: {wall * 1000:.1f} ms "
+              f"(+{overhead:.1f} ms over the interpreter, {budget})")
+        for mod, us in sorted(own.items(), key=lambda kv: -kv[1])[:args.top]:
+            print(f"    {us / 1000:7.2f} ms  {mod}")
+        if heavy:
+            print(f"[FAIL] {name} imports heavy modules eagerly: {', '.join(heavy)}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Build metrics report: compares the latest build.py run recorded in _build/metrics.jsonl with a rolling
+baseline, the median of up to --window earlier runs of the same command (same build flags), and flags:
+- the total duration and stages that got slower by more than --threshold and at least --min-seconds,
+- files whose build time grew by more than --threshold and at least --min-file-seconds, or whose output
+  grew by more than --threshold and at least --min-kb,
+- caches whose hit rate dropped by more than --hit-rate-drop,
+- peak RSS that grew by more than --threshold and at least --min-rss-mb.
+Writes a Markdown (default) or HTML summary to stdout or --output. Exits 1 when anything regressed,
+2 when there are no metrics to report on, 0 otherwise (also when there is no baseline yet).
+
+Usage (from the repository root):
+    python scripts/build_report.py [--window 5] [--threshold 0.25] [--format markdown|html] [--output FILE]
+"""
+import argparse
+import html
+import json
+import statistics
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+METRICS_PATH = REPO_ROOT / '_build' / 'metrics.jsonl'
+# Caches with fewer lookups than this in a run say nothing about their hit rate
+MIN_CACHE_LOOKUPS = 5
+
+
+def load_records(path):
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                print(f"[WARN] Skipping malformed line {n} of {path}", file=sys.stderr)
+    return records
+
+
+def metrics(record):
+    """Flatten a record into {(kind, name): value}."""
+    out = {('total', 'total'): record.get('duration', 0.0)}
+    for name, seconds in record.get('stages', {}).items():
+        out[('stage', name)] = seconds
+    for group, files in record.get('files', {}).items():
+        for file, entry in files.items():
+            out[('file', f"{group}: {file}")] = entry['seconds']
+            if 'bytes' in entry:
+                out[('output', f"{group}: {file}")] = entry['bytes']
+    for name, c in record.get('caches', {}).items():
+        lookups = c['hits'] + c['misses']
+        if lookups >= MIN_CACHE_LOOKUPS:
+            out[('cache', name)] = c['hits'] / lookups
+    rss = record.get('peak_rss_mb') or {}
+    if 'self' in rss:
+        out[('memory', 'peak RSS')] = rss['self']
+    return out
+
+
+def compare(latest, baseline, args):
+    """[(kind, name, baseline value or None, latest value, regressed)] for every metric of latest."""
+    history = [metrics(r) for r in baseline]
+    minimum = {'total': args.min_seconds, 'stage': args.min_seconds, 'file': args.min_file_seconds,
+               'output': args.min_kb * 1024, 'memory': args.min_rss_mb}
+    rows = []
+    for key, value in metrics(latest).items():
+        kind, name = key
+        values = [m[key] for m in history if key in m]
+        base = statistics.median(values) if values else None
+        if base is None:
+            regressed = False
+        elif kind == 'cache':
+            regressed = base - value > args.hit_rate_drop
+        else:
+            regressed = value > base * (1 + args.threshold) and value - base >= minimum[kind]
+        rows.append((kind, name, base, value, regressed))
+    return rows
+
+
+def fmt(kind, value):
+    if value is None:
+        return '–'
+    if kind == 'output':
+        return f"{value / 1024:.1f} KB" if value < 1024 * 1024 else f"{value / 1024 / 1024:.2f} MB"
+    if kind == 'cache':
+        return f"{value:.0%}"
+    if kind == 'memory':
+        return f"{value:.0f} MB"
+    return f"{value:.2f} s"
+
+
+def change(kind, base, value):
+    if base is None:
+        return 'new'
+    if kind == 'cache':
+        return f"{(value - base) * 100:+.0f} pts"
+    if not base:
+        return '–'
+    return f"{(value - base) / base:+.0%}"
+
+
+def report_blocks(latest, baseline, rows, top):
+    """The report as a list of ('h1'|'h2'|'p', text) and ('table', headers, rows) blocks."""
+    regressions = [r for r in rows if r[4]]
+    by_key = {(r[0], r[1]): r for r in rows}
+    blocks = [('h1', 'Build report'),
+              ('p', f"Run of {latest.get('time', '?')}: `build.py {latest.get('command', '')}`, "
+                    f"{fmt('total', latest.get('duration', 0.0))}, compared with the median of "
+                    f"{len(baseline)} earlier run(s) of the same command.")]
+    if not baseline:
+        blocks.append(('p', 'No baseline yet: nothing to compare against.'))
+    blocks.append(('h2', f"Regressions ({len(regressions)})"))
+    if regressions:
+        blocks.append(('table', ['Kind', 'Name', 'Baseline', 'Latest', 'Change'],
+                       [[kind, name, fmt(kind, base), fmt(kind, value), change(kind, base, value)]
+                        for kind, name, base, value, _ in regressions]))
+    else:
+        blocks.append(('p', 'None.'))
+
+    stage_rows = [r for r in rows if r[0] in ('total', 'stage')]
+    blocks.append(('h2', 'Stages'))
+    blocks.append(('table', ['Stage', 'Baseline', 'Latest', 'Change'],
+                   [[name, fmt(kind, base), fmt(kind, value), change(kind, base, value)]
+                    for kind, name, base, value, _ in stage_rows]))
+
+    files = sorted((r for r in rows if r[0] == 'file'), key=lambda r: -r[3])[:top]
+    if files:
+        blocks.append(('h2', f"Slowest files (top {len(files)})"))
+        table = []
+        for kind, name, base, value, _ in files:
+            output = by_key.get(('output', name))
+            table.append([name, fmt(kind, base), fmt(kind, value), change(kind, base, value),
+                          fmt('output', output[3]) if output else '–'])
+        blocks.append(('table', ['File', 'Baseline', 'Latest', 'Change', 'Output'], table))
+
+    caches = latest.get('caches', {})
+    if caches:
+        blocks.append(('h2', 'Caches'))
+        table = []
+        for name, c in sorted(caches.items()):
+            row = by_key.get(('cache', name))
+            table.append([name, str(c['hits']), str(c['misses']),
+                          fmt('cache', row[3]) if row else '–', fmt('cache', row[2]) if row else '–'])
+        blocks.append(('table', ['Cache', 'Hits', 'Misses', 'Hit rate', 'Baseline hit rate'], table))
+
+    outputs = latest.get('outputs', {})
+    rss = latest.get('peak_rss_mb') or {}
+    blocks.append(('h2', 'Outputs and memory'))
+    blocks.append(('p', f"{outputs.get('written', 0)} file(s) written "
+                        f"({fmt('output', outputs.get('bytes_written', 0))}), {outputs.get('unchanged', 0)} unchanged. "
+                        f"Peak RSS {fmt('memory', rss.get('self'))} (largest child process "
+                        f"{fmt('memory', rss.get('children'))})."))
+    return blocks
+
+
+def render_markdown(blocks):
+    out = []
+    for block in blocks:
+        if block[0] == 'h1':
+            out.append(f"# {block[1]}\n")
+        elif block[0] == 'h2':
+            out.append(f"## {block[1]}\n")
+        elif block[0] == 'p':
+            out.append(f"{block[1]}\n")
+        else:
+            _, headers, rows = block
+            out.append('| ' + ' | '.join(headers) + ' |')
+            out.append('|' + '|'.join('---' for _ in headers) + '|')
+            out += ['| ' + ' | '.join(cell.replace('|', '\\|') for cell in row) + ' |' for row in rows]
+            out.append('')
+    return '\n'.join(out)
+
+
+def render_html(blocks):
+    out = ['<!DOCTYPE html>', '<html lang="en">', '<head><meta charset="utf-8"><title>Build report</title>',
+           '<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}'
+           'td,th{border:1px solid #ccc;padding:.25em .6em;text-align:left}</style></head>', '<body>']
+    for block in blocks:
+        if block[0] in ('h1', 'h2', 'p'):
+            out.append(f"<{block[0]}>{html.escape(block[1])}</{block[0]}>")
+        else:
+            _, headers, rows = block
+            out.append('<table>')
+            out.append('<tr>' + ''.join(f"<th>{html.escape(h)}</th>" for h in headers) + '</tr>')
+            out += ['<tr>' + ''.join(f"<td>{html.escape(c)}</td>" for c in row) + '</tr>' for row in rows]
+            out.append('</table>')
+    out += ['</body>', '</html>', '']
+    return '\n'.join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the latest build run with earlier runs and flag regressions.")
+    parser.add_argument('--metrics', default=str(METRICS_PATH), help='Metrics history (default: _build/metrics.jsonl)')
+    parser.add_argument('--window', type=int, default=5, help='Earlier runs in the rolling baseline (default: 5)')
+    parser.add_argument('--all-commands', action='store_true', help='Use earlier runs of any command as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Relative growth that counts as a regression (default: 0.25)')
+    parser.add_argument('--min-seconds', type=float, default=0.5, help='Ignore stage slowdowns smaller than this')
+    parser.add_argument('--min-file-seconds', type=float, default=0.2, help='Ignore per-file slowdowns smaller than this')
+    parser.add_argument('--min-kb', type=float, default=100, help='Ignore output size growth smaller than this')
+    parser.add_argument('--min-rss-mb', type=float, default=50, help='Ignore peak RSS growth smaller than this')
+    parser.add_argument('--hit-rate-drop', type=float, default=0.25, help='Cache hit-rate drop that counts as a regression (default: 0.25)')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest files to list')
+    parser.add_argument('--format', choices=('markdown', 'html'), default='markdown', help='Report format')
+    parser.add_argument('--output', help='Write the report to this file instead of stdout')
+    args = parser.parse_args()
+
+    if not Path(args.metrics).exists():
+        print(f"[ERROR] No build metrics at {args.metrics}; run build.py first.", file=sys.stderr)
+        sys.exit(2)
+    records = load_records(args.metrics)
+    if not records:
+        print(f"[ERROR] {args.metrics} has no records.", file=sys.stderr)
+        sys.exit(2)
+    latest = records[-1]
+    earlier = [r for r in records[:-1] if args.all_commands or r.get('command') == latest.get('command')]
+    baseline = earlier[-args.window:] if args.window > 0 else []
+    rows = compare(latest, baseline, args)
+    blocks = report_blocks(latest, baseline, rows, args.top)
+    text = render_html(blocks) if args.format == 'html' else render_markdown(blocks)
+
+    # Keep stdout for the report itself when it is not written to a file
+    status = sys.stdout if args.output else sys.stderr
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(text, encoding='utf-8')
+        print(f"[OK] Wrote {args.output}")
+    else:
+        sys.stdout.write(text)
+    regressions = [r for r in rows if r[4]]
+    if regressions:
+        print(f"[FAIL] {len(regressions)} regression(s) against {len(baseline)} baseline run(s)", file=status)
+        sys.exit(1)
+    print(f"[PASS] No regressions against {len(baseline)} baseline run(s)", file=status)
+
+
+if __name__ == '__main__':
+    main()
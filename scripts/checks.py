@@ -0,0 +1,23 @@
+"""
+checks.py
+
+Shared reporting for the scripts/test_*.py scripts.
+- check() prints one [PASS]/[FAIL] line per assertion and returns the condition, so tests accumulate ok &= check(...)
+- finish() prints the summary line and exits 0 or 1
+
+Usage (from a test script in scripts/):
+    from checks import check, finish
+"""
+import sys
+
+
+def check(name, condition, detail=''):
+    """Print [PASS] or [FAIL] for one named condition (with detail on failure); return the condition."""
+    print(f"[{'PASS' if condition else 'FAIL'}] {name}" + (f": {detail}" if detail and not condition else ''))
+    return condition
+
+
+def finish(ok, subject):
+    """Print the summary for subject's tests and exit with their status."""
+    print(f'[OK] All {subject} tests passed' if ok else f'[ERROR] Some {subject} tests failed')
+    sys.exit(0 if ok else 1)
@@ -1,17 +1,161 @@
-import requests
+"""
+fetch_youtube.py
+
+Batch YouTube thumbnail fetcher.
+- Finds every video id referenced in content/ (watch?v=, youtu.be/, /embed/ and the
+  markdown-videos-api /youtube/<id> badges) in markdown files and notebooks.
+- Fetches thumbnails concurrently through the shared remote asset mirror (remote_assets.py):
+  one requests.Session, a bounded thread pool, a persistent cache in _build/remote-cache/ and
+  conditional-request revalidation on later runs.
+- Remembers which resolution variant (maxresdefault / hqdefault) succeeded per video, so later
+  runs do not probe variants that are known to be missing.
+- Publishes docs/images/youtube_<id>.jpg through the image store, which only writes when the bytes change.
+
+Usage:
+    python scripts/fetch_youtube.py [--content content] [--dest docs/images] [--jobs N] [--offline] [--debug]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from remote_assets import RemoteAssetCache, REMOTE_CACHE_DIR
+
+THUMBNAIL_BASE_URL = 'https://img.youtube.com/vi'
+VARIANTS = ('maxresdefault', 'hqdefault')
+VIDEO_ID_RE = re.compile(
+    r'(?:youtube\.com/(?:watch\?(?:[^\s)"\']*&)?v=|embed/|shorts/)|youtu\.be/|/youtube/)([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])')
+
+
+def find_video_ids(root='content'):
+    """Return the sorted set of YouTube video ids referenced in markdown files and notebooks under root."""
+    from content_inventory import inventory_glob
+    ids = set()
+    for path in inventory_glob(os.path.join(str(root), '**', '*'), kind='file'):
+        if path.lower().endswith(('.md', '.ipynb')):
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                ids.update(VIDEO_ID_RE.findall(f.read()))
+    return sorted(ids)
+
+
+def thumbnail_name(video_id):
+    return f"youtube_{video_id}.jpg"
+
+
+class ThumbnailFetcher:
+    def __init__(self, cache=None, base_url=THUMBNAIL_BASE_URL, variants=VARIANTS, max_workers=8):
+        self.cache = cache or RemoteAssetCache(max_workers=max_workers)
+        self.base_url = base_url.rstrip('/')
+        self.variants = tuple(variants)
+        self.max_workers = max_workers
+        self.variants_path = self.cache.root / 'youtube-variants.json'
+        self._lock = threading.Lock()
+        self.known_variants = {}  # video id -> variant that succeeded last time
+        if self.variants_path.exists():
+            try:
+                with open(self.variants_path, 'r', encoding='utf-8') as f:
+                    self.known_variants = json.load(f)
+            except (OSError, ValueError):
+                self.known_variants = {}
+
+    def url(self, video_id, variant):
+        return f"{self.base_url}/{video_id}/{variant}.jpg"
+
+    def fetch(self, video_id, debug=False):
+        """Return the cached thumbnail path for video_id (best available variant), or None."""
+        known = self.known_variants.get(video_id)
+        order = [known] + [v for v in self.variants if v != known] if known in self.variants else list(self.variants)
+        for variant in order:
+            path = self.cache.fetch(self.url(video_id, variant), warn=False, debug=debug)
+            if path is not None:
+                with self._lock:
+                    self.known_variants[video_id] = variant
+                return path
+        print(f"[WARN] No thumbnail available for video {video_id}")
+        return None
+
+    def fetch_all(self, video_ids, debug=False):
+        """Fetch thumbnails for all video ids concurrently. Returns {video_id: Path or None}."""
+        video_ids = list(dict.fromkeys(video_ids))
+        if not video_ids:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(video_ids))) as pool:
+            return dict(zip(video_ids, pool.map(lambda v: self.fetch(v, debug=debug), video_ids)))
+
+    def publish_all(self, video_ids, dest_dir='docs/images', store=None, debug=False):
+        """
+        Fetch every thumbnail and publish it to dest_dir/youtube_<id>.jpg, writing only when the
+        bytes changed. Returns (published, unchanged, missing) counts.
+        """
+        from image_store import get_store
+        store = store or get_store()
+        dest_dir = Path(dest_dir)
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        counts = [0, 0, 0]
+        for video_id, path in self.fetch_all(video_ids, debug=debug).items():
+            if path is None:
+                counts[2] += 1
+                continue
+            # Thumbnails are not owned by a single page, so the image store never retires them
+            if store.publish(path, dest_dir / thumbnail_name(video_id)):
+                counts[0] += 1
+                if debug:
+                    print(f"[INFO] Updated {dest_dir / thumbnail_name(video_id)}")
+            else:
+                counts[1] += 1
+        self.save()
+        store.save()
+        return tuple(counts)
+
+    def save(self):
+        self.cache.save()
+        self.variants_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.known_variants, indent=1, sort_keys=True)
+        tmp = self.variants_path.with_name(f"{self.variants_path.name}.{os.getpid()}.tmp")
+        tmp.write_text(data, encoding='utf-8')
+        os.replace(tmp, self.variants_path)
+
 
 def fetch_youtube_thumbnail(video_id, dest_path):
-    urls = [
-        f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
-        f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
-    ]
-    for url in urls:
-        try:
-            resp = requests.get(url, timeout=10)
-            resp.raise_for_status()
-            with open(dest_path, 'wb') as f:
-                f.write(resp.content)
-            return True
-        except Exception:
-            continue
-    return False
+    """
+    Fetch one thumbnail (best available variant) and publish it to dest_path through the image
+    store, like publish_all(). Returns True on success.
+    """
+    fetcher = ThumbnailFetcher()
+    path = fetcher.fetch(video_id)
+    fetcher.save()
+    if path is None:
+        return False
+    from image_store import get_store
+    store = get_store()
+    store.publish(path, dest_path)
+    store.save()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch thumbnails for every YouTube video referenced in content/.")
+    parser.add_argument('--content', default='content', help='Content directory to scan (default: content)')
+    parser.add_argument('--dest', default='docs/images', help='Output directory (default: docs/images)')
+    parser.add_argument('--jobs', type=int, default=8, help='Concurrent downloads (default: 8)')
+    parser.add_argument('--offline', action='store_true', help='Only use thumbnails already in the local cache')
+    parser.add_argument('--debug', action='store_true', help='Print debug information')
+    args = parser.parse_args()
+    video_ids = find_video_ids(args.content)
+    print(f"[INFO] Found {len(video_ids)} YouTube video(s) in {args.content}")
+    cache = RemoteAssetCache(REMOTE_CACHE_DIR, offline=args.offline, max_workers=args.jobs)
+    fetcher = ThumbnailFetcher(cache=cache, max_workers=args.jobs)
+    published, unchanged, missing = fetcher.publish_all(video_ids, args.dest, debug=args.debug)
+    print(f"[OK] Thumbnails: {published} updated, {unchanged} unchanged, {missing} unavailable ({cache.summary()})")
+    sys.exit(1 if missing else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,9 @@ import os
 import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from output_writer import write_if_changed
+
 try:
     import markdown
 except ImportError:
@@ -30,8 +33,7 @@ def convert_md_to_html(md_path):
     while html_path.suffix:
         html_path = html_path.with_suffix('')
     html_path = html_path.with_suffix('.html')
-    with open(html_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    write_if_changed(html_path, html_content)
     return html_path
 
 def main():
@@ -39,7 +41,8 @@ def main():
     if not notebooks_dir.exists():
         print(f"[ERROR] Directory not found: {notebooks_dir}")
         sys.exit(1)
-    md_files = list(notebooks_dir.rglob('*.md'))
+    from content_inventory import inventory_glob
+    md_files = [Path(f) for f in inventory_glob(str(notebooks_dir / '**' / '*.md'), kind='file')]
     if not md_files:
         print("[INFO] No markdown files found.")
         return
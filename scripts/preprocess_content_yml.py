@@ -5,6 +5,8 @@ from pathlib import Path
 import io
 
 repo_root = Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(repo_root))
+from output_writer import open_output, write_if_changed
 content_yml = repo_root / '_content.yml'
 autogen_dir = repo_root / '.autogen'
 autogen_dir.mkdir(parents=True, exist_ok=True)
@@ -15,6 +17,9 @@ out_files = {
     'toc': autogen_dir / '_toc.yml',
 }
 
+def report(path, written):
+    print(f"[OK] Wrote {path}" if written else f"[OK] {path} is up to date")
+
 def main():
     if not content_yml.exists():
         print(f"[ERROR] {content_yml} not found.")
@@ -57,9 +62,7 @@ def main():
     buf.write('notebooks:\n')
     for nb in notebooks_unique:
         buf.write(f'  - {nb}\n')
-    with open(out_files['notebooks'], 'w') as f:
-        f.write(buf.getvalue())
-    print(f"[OK] Wrote {out_files['notebooks']}")
+    report(out_files['notebooks'], write_if_changed(out_files['notebooks'], buf.getvalue()))
 
     # --- Write _toc.yml ---
     toc_comment = "# Auto-generated _toc.yml from _notebooks.yaml\n"
@@ -78,9 +81,7 @@ def main():
     buf = io.StringIO()
     buf.write(toc_comment)
     yaml.dump(toc, buf, sort_keys=False, allow_unicode=True)
-    with open(out_files['toc'], 'w') as f:
-        f.write(buf.getvalue())
-    print(f"[OK] Wrote {out_files['toc']}")
+    report(out_files['toc'], write_if_changed(out_files['toc'], buf.getvalue()))
 
     # --- Write _menu.yml ---
     menu = []
@@ -113,9 +114,7 @@ def main():
     buf = io.StringIO()
     buf.write(menu_comment)
     yaml.dump({'menu': menu}, buf, sort_keys=False, allow_unicode=True)
-    with open(out_files['menu'], 'w') as f:
-        f.write(buf.getvalue())
-    print(f"[OK] Wrote {out_files['menu']}")
+    report(out_files['menu'], write_if_changed(out_files['menu'], buf.getvalue()))
 
     # --- Write _config.yml ---
     config = {}
@@ -136,10 +135,10 @@ def main():
         "# This file was generated from _content.yml by scripts/preprocess_content_yml.py\n"
         "# Edit _content.yml instead and re-run the preprocessor.\n"
     )
-    with open(out_files['config'], 'w') as f:
+    with open_output(out_files['config']) as f:
         f.write(config_comment)
         yaml.dump(config, f, sort_keys=False, allow_unicode=True)
-    print(f"[OK] Wrote {out_files['config']}")
+    report(out_files['config'], f.changed)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""
+Test artifact_cache.py: keys, the local tier, a shared-directory remote, multi-file bundles, tarball
+export/import, an HTTP remote against a local stand-in server (upload, download, push, failures) and a
+pandoc AST restored from a warm shared cache without running pandoc.
+"""
+import json
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import artifact_cache
+import pandoc_ast
+from artifact_cache import ArtifactCache, DirectoryBackend, artifact_key
+from checks import check, finish
+
+STORED = {}
+REQUESTS = []
+
+
+class ArtifactHandler(BaseHTTPRequestHandler):
+    def _key(self):
+        return self.path.rsplit('/', 1)[-1]
+
+    def do_HEAD(self):
+        REQUESTS.append(('HEAD', self._key()))
+        self.send_response(200 if self._key() in STORED else 404)
+        self.end_headers()
+
+    def do_GET(self):
+        REQUESTS.append(('GET', self._key()))
+        data = STORED.get(self._key())
+        if data is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_PUT(self):
+        REQUESTS.append(('PUT', self._key()))
+        STORED[self._key()] = self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(201)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ArtifactHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/artifacts"
+
+
+def main():
+    ok = True
+    k1 = artifact_key('step', 'tool 1.0', b'input')
+    ok &= check('keys are stable', k1 == artifact_key('step', 'tool 1.0', b'input'))
+    ok &= check('keys depend on tool versions and inputs',
+                len({k1, artifact_key('step', 'tool 1.1', b'input'), artifact_key('step', 'tool 1.0', b'input2'),
+                     artifact_key('step', 'tool 1.0in', b'put')}) == 4)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        shared = tmp / 'shared'
+
+        # Shared directory: one machine builds, a fresh clone reuses
+        builder = ArtifactCache(root=tmp / 'a', remote=str(shared))
+        builder.put(k1, b'artifact bytes')
+        ok &= check('new artifacts are stored locally and uploaded',
+                    builder.stats['stored'] == 1 and builder.stats['uploaded'] == 1 and DirectoryBackend(shared).has(k1))
+        clone = ArtifactCache(root=tmp / 'b', remote=str(shared))
+        ok &= check('a fresh clone gets the artifact from the shared directory',
+                    clone.get(k1) == b'artifact bytes' and clone.stats['remote'] == 1)
+        ok &= check('remote hits are kept in the local tier', clone.get(k1) == b'artifact bytes' and clone.stats['local'] == 1)
+        ok &= check('unknown keys miss', clone.get(artifact_key('nothing')) is None and clone.stats['missed'] == 1)
+
+        out = tmp / 'work' / 'doc.pdf'
+        out.parent.mkdir()
+        out.write_bytes(b'%PDF first')
+        k2 = artifact_key('latex-pdf', 'doc')
+        builder.store_file(k2, out)
+        out.write_bytes(b'%PDF rewritten in place')
+        restored = tmp / 'restored' / 'doc.pdf'
+        ok &= check('files are copied into the store, not linked',
+                    clone.fetch_file(k2, restored) and restored.read_bytes() == b'%PDF first')
+
+        # Bundles (nbconvert: Markdown plus images)
+        src = tmp / 'nb'
+        (src / 'notes_files').mkdir(parents=True)
+        (src / 'notes.md').write_text('![](notes_files/fig.png)')
+        (src / 'notes_files' / 'fig.png').write_bytes(b'png')
+        k3 = artifact_key('nbconvert-markdown', 'notes')
+        builder.store_bundle(k3, src, [src / 'notes.md', src / 'notes_files' / 'fig.png'])
+        paths = clone.fetch_bundle(k3, tmp / 'nb-out')
+        ok &= check('bundles restore every file at its relative path',
+                    paths is not None and (tmp / 'nb-out' / 'notes_files' / 'fig.png').read_bytes() == b'png'
+                    and (tmp / 'nb-out' / 'notes.md').exists(), paths)
+
+        # Tarball export/import
+        archive = tmp / 'artifacts.tar.gz'
+        exported = builder.export(archive)
+        fresh = ArtifactCache(root=tmp / 'c')
+        imported = fresh.import_archive(archive)
+        ok &= check('export/import moves every artifact', exported == 3 and imported == 3 and fresh.get(k1) == b'artifact bytes',
+                    (exported, imported))
+        ok &= check('importing again adds nothing', fresh.import_archive(archive) == 0)
+
+        # HTTP remote
+        server, url = start_server()
+        http = ArtifactCache(root=tmp / 'd', remote=url)
+        k4 = artifact_key('pandoc-ast', 'x')
+        http.put(k4, b'{"blocks": []}')
+        ok &= check('artifacts are uploaded with PUT', STORED.get(k4) == b'{"blocks": []}', REQUESTS)
+        other = ArtifactCache(root=tmp / 'e', remote=url)
+        ok &= check('another machine downloads them with GET', other.get(k4) == b'{"blocks": []}' and other.stats['remote'] == 1)
+        ok &= check('a missing artifact is a miss, not an error',
+                    other.get(artifact_key('missing')) is None and other.stats['errors'] == 0)
+        pushed = ArtifactCache(root=tmp / 'a', remote=url).push()
+        ok &= check('push uploads only what the remote lacks', pushed == 3 and len(STORED) == 4, (pushed, len(STORED)))
+        server.shutdown()
+        server.server_close()
+
+        down = ArtifactCache(root=tmp / 'f', remote=url)
+        for i in range(artifact_cache.MAX_REMOTE_ERRORS + 1):
+            down.get(artifact_key('unreachable', str(i)))
+        ok &= check('an unreachable remote only warns, then is switched off',
+                    down.remote is None and down.stats['errors'] == artifact_cache.MAX_REMOTE_ERRORS, down.stats)
+
+        # A warm shared cache spares the pandoc reader (pandoc need not even be installed)
+        pandoc_ast._pandoc_version = 'pandoc 0.0-test'
+        artifact_cache._cache = ArtifactCache(root=tmp / 'g', remote=str(shared))
+        md = tmp / 'page.md'
+        md.write_text('# Title\n')
+        ast = {'pandoc-api-version': [1, 23], 'meta': {}, 'blocks': [{'t': 'Header'}]}
+        key = artifact_key('pandoc-ast', pandoc_ast.ast_cache_key(md.read_bytes()))
+        ArtifactCache(root=tmp / 'h', remote=str(shared)).put(key, json.dumps(ast).encode())
+        try:
+            result = pandoc_ast.read_markdown_ast(md, cache_dir=tmp / 'ast')
+        except (OSError, RuntimeError) as e:
+            result = e
+        ok &= check('read_markdown_ast restores the AST from the shared cache', result == ast, result)
+        ok &= check('the restored AST fills the local AST cache', len(list((tmp / 'ast').glob('*.json'))) == 1)
+        artifact_cache._cache = None
+
+    finish(ok, 'artifact cache')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Test check_links.py template handling: a course page whose text mentions Jinja ({% if %}, {% for %}) is still
+checked, while an unrendered template under _static/ is indexed but never scanned.
+"""
+import contextlib
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from check_links import check_links
+from checks import check, finish
+
+JINJA_PAGE = """<html><body>
+<h1 id="templates">Templating results</h1>
+<pre><code>{% for row in rows %}{{ row }}{% endfor %}</code></pre>
+<p>Use {% if debug %} to guard output. <a href="notes.html">Notes</a> and <a href="#templates">top</a>.</p>
+<a href="gone.html">Removed page</a>
+</body></html>
+"""
+
+MACROS = """{% macro head_pre_assets() %}
+  <link href="{{ pathto('_static/styles/theme.css', 1) }}" rel="stylesheet">
+  <a href="missing-from-template.html">x</a>
+{% endmacro %}
+"""
+
+
+def main():
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        (root / 'notes.html').write_text('<html><body>Notes</body></html>', encoding='utf-8')
+        (root / 'jinja.html').write_text(JINJA_PAGE, encoding='utf-8')
+        (root / 'book' / '_static').mkdir(parents=True)
+        (root / 'book' / '_static' / 'webpack-macros.html').write_text(MACROS, encoding='utf-8')
+        (root / 'macros.html').write_text('<a href="book/_static/webpack-macros.html">macros</a>', encoding='utf-8')
+        with contextlib.redirect_stdout(io.StringIO()):
+            broken = check_links(str(root), jobs=1)
+        urls = sorted(url for _, _, url, _ in broken)
+        ok &= check('a page mentioning Jinja statements is still checked', urls == ['gone.html'], broken)
+        ok &= check('an unrendered template under _static/ is not scanned', 'missing-from-template.html' not in urls, broken)
+        ok &= check('a template file is still a valid link target',
+                    not any(page == 'macros.html' for page, _, _, _ in broken), broken)
+    finish(ok, 'link checker')
+
+
+if __name__ == '__main__':
+    main()
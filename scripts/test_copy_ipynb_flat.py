@@ -0,0 +1,92 @@
+"""
+Test copy_ipynb_flat.py housekeeping: toc entries whose notebook is missing are reported together, full runs
+prune flat copies the toc no longer lists (even ones no manifest recorded), and light images a regenerated
+notebook stopped linking to are deleted on a --files run unless another notebook still links to them.
+"""
+import base64
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import yaml
+
+from checks import check, finish
+from copy_ipynb_flat import copy_ipynb_flat
+
+REPO = Path(__file__).resolve().parent.parent
+TOC = [{'title': 'A', 'file': 'content/a.ipynb'},
+       {'title': 'B', 'file': 'content/b.ipynb'},
+       {'title': 'Gone', 'file': 'content/gone.ipynb'}]
+
+
+def write_notebook(path, image):
+    output = {'output_type': 'display_data', 'metadata': {},
+              'data': {'image/png': base64.b64encode(image).decode('ascii'), 'text/plain': ['<Figure>']}}
+    cell = {'cell_type': 'code', 'execution_count': 1, 'metadata': {}, 'source': ['plot()'], 'outputs': [output]}
+    path.write_text(json.dumps({'cells': [cell], 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}), encoding='utf-8')
+
+
+def run(files=None):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        counts = copy_ipynb_flat(files=files, build_dir='_build/ipynb', docs_dir='docs/ipynb', jobs=2)
+    return counts, out.getvalue()
+
+
+def images(root):
+    outputs = Path(root) / 'light' / 'outputs'
+    return sorted(p.name for p in outputs.iterdir()) if outputs.is_dir() else []
+
+
+def main():
+    ok = True
+    cwd = os.getcwd()
+    # The repo's site settings with a toc of two notebooks and one that does not exist
+    content = yaml.safe_load((REPO / '_content.yml').read_text(encoding='utf-8'))
+    content['toc'] = TOC
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            Path('_content.yml').write_text(yaml.safe_dump(content), encoding='utf-8')
+            Path('content').mkdir()
+            write_notebook(Path('content/a.ipynb'), b'shared plot')
+            write_notebook(Path('content/b.ipynb'), b'shared plot')
+            for stale in ('docs/ipynb/old.ipynb', 'docs/ipynb/light/old.ipynb', '_build/ipynb/clean/old.ipynb'):
+                Path(stale).parent.mkdir(parents=True, exist_ok=True)
+                Path(stale).write_text('{}', encoding='utf-8')
+
+            counts, out = run()
+            ok &= check('toc notebooks are published', Path('docs/ipynb/a.ipynb').exists()
+                        and Path('docs/ipynb/light/b.ipynb').exists(), out)
+            ok &= check('a missing toc notebook is counted and listed in the warning block',
+                        counts['missing'] == 1 and 'do not exist' in out and 'gone.ipynb' in out, out)
+            ok &= check('copies the toc does not list are pruned although no manifest recorded them',
+                        not any(Path(p).exists() for p in ('docs/ipynb/old.ipynb', 'docs/ipynb/light/old.ipynb',
+                                                           '_build/ipynb/clean/old.ipynb')), out)
+            shared = images('docs/ipynb')
+            ok &= check('two notebooks with the same plot share one light image', len(shared) == 1, shared)
+
+            write_notebook(Path('content/a.ipynb'), b'new plot')
+            run(files=['content/a.ipynb'])
+            ok &= check('an image still linked by another notebook survives a regeneration',
+                        set(shared) < set(images('docs/ipynb')), images('docs/ipynb'))
+
+            write_notebook(Path('content/b.ipynb'), b'newer plot')
+            run(files=['content/b.ipynb'])
+            ok &= check('an image no notebook links to is deleted on a --files run',
+                        not set(shared) & set(images('docs/ipynb')) and len(images('docs/ipynb')) == 2
+                        and images('_build/ipynb') == images('docs/ipynb'), images('docs/ipynb'))
+        finally:
+            os.chdir(cwd)
+
+    finish(ok, 'notebook publishing')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Test critical_css.py: pages built from one template (different heading ids, links and first-paragraph
+markup) share a single cached critical set, other templates get their own, and the inlined page keeps
+the rules its fold needs.
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from checks import check, finish
+from critical_css import CriticalCss
+
+CSS = """
+:root { --color-fg: #111; }
+[data-theme="dark"] { --color-fg: #eee; }
+.site-header { color: var(--color-fg); }
+.container a { color: blue; }
+.notebook-markdown-cell h1 { font-size: 2em; }
+.card p { margin: 0; }
+footer { padding: 2em; }
+@media (max-width: 900px) { .site-nav { position: fixed; } }
+"""
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head><link id="theme-css" href="css/theme.css" rel="stylesheet"></head>
+<body>
+  <header class="site-header"><h1>Site</h1></header>
+  <nav class="site-nav" id="site-nav"><ul><li><a href="index.html">Home</a></li></ul></nav>
+  <main class="site-main container">
+    {first_block}
+    <div class="notebook-markdown-cell"><p>Below the fold</p></div>
+  </main>
+  <footer>Footer</footer>
+</body>
+</html>
+"""
+
+
+def main():
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        css_path = tmp / 'theme.css'
+        css_path.write_text(CSS, encoding='utf-8')
+        cache_dir = tmp / 'cache'
+        critical = CriticalCss(css_path, cache_dir=cache_dir)
+
+        first = PAGE.format(first_block='<div class="notebook-markdown-cell"><h1 id="lagrangians">Lagrangians</h1>'
+                                        '<p>See <a href="x.html">this</a>.</p></div>')
+        second = PAGE.format(first_block='<div class="notebook-markdown-cell"><h1 id="phase-space">Phase space</h1>'
+                                         '<p><em>Plots</em> and <code>code</code>.</p></div>')
+        html1 = critical.inline(first, 'css/theme.css')
+        html2 = critical.inline(second, 'css/theme.css')
+        ok &= check('pages of one template share one critical set',
+                    critical.stats == {'computed': 1, 'cached': 1} and len(list(cache_dir.glob('*.css'))) == 1,
+                    critical.stats)
+        ok &= check('the shared set covers markup that only the second page has', '.container a' in html2)
+        ok &= check('the critical set keeps theme variables and fold rules',
+                    all(s in html1 for s in (':root', '[data-theme="dark"]', '.site-header',
+                                             '.notebook-markdown-cell h1', '@media')), html1)
+        ok &= check('rules no fold element can match are left out', '.card p' not in html1)
+        ok &= check('the stylesheet is preloaded with a noscript fallback',
+                    'rel="preload" href="css/theme.css"' in html1 and '<noscript><link rel="stylesheet"' in html1)
+
+        other = PAGE.format(first_block='<h2 id="intro">Intro</h2>')
+        critical.inline(other, 'css/theme.css')
+        ok &= check('another template gets its own set', critical.stats['computed'] == 2, critical.stats)
+
+        fresh = CriticalCss(css_path, cache_dir=cache_dir)
+        fresh.inline(PAGE.format(first_block='<div class="notebook-markdown-cell"><h1 id="waves">Waves</h1></div>'),
+                     'css/theme.css')
+        ok &= check('a later build reuses the set from disk', fresh.stats == {'computed': 0, 'cached': 1}, fresh.stats)
+
+    finish(ok, 'critical CSS')
+
+
+if __name__ == '__main__':
+    main()
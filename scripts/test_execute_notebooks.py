@@ -0,0 +1,44 @@
+"""
+Test execute_notebooks.KernelPool when kernels cannot start: with a kernel name that has no kernelspec,
+every acquire() (more callers than pre-started kernels) raises instead of waiting for a replacement that
+never comes. Needs jupyter_client, but no working kernel.
+"""
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from checks import check, finish
+from execute_notebooks import KernelPool
+
+WORKERS = 5
+TIMEOUT = 60
+
+
+def main():
+    ok = True
+    pool = KernelPool(2, total=WORKERS, kernel_name='no-such-kernel')
+    errors = []
+
+    def worker():
+        try:
+            pool.acquire()
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(WORKERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(TIMEOUT)
+    blocked = sum(t.is_alive() for t in threads)
+    ok &= check('no acquire() blocks once kernels fail to start', blocked == 0, f"{blocked} still waiting")
+    ok &= check('every acquire() raises RuntimeError naming the kernel', len(errors) == WORKERS
+                and all('no-such-kernel' in str(e) for e in errors), errors)
+    pool.close()
+    finish(ok, 'kernel pool')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Test scripts/fetch_youtube.py against a local fake thumbnail server: video id discovery, variant
+fallback and memory, conditional revalidation, and writing docs images only when bytes change.
+"""
+import hashlib
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from checks import check, finish
+from fetch_youtube import ThumbnailFetcher, find_video_ids, thumbnail_name
+from image_store import ImageStore
+from remote_assets import RemoteAssetCache
+
+THUMBNAILS = {}
+REQUESTS = []
+REQUESTS_LOCK = threading.Lock()
+
+
+class ThumbnailHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        data = THUMBNAILS.get(self.path)
+        etag = '"' + hashlib.sha256(data).hexdigest()[:16] + '"' if data is not None else None
+        if data is None:
+            status = 404
+        elif self.headers.get('If-None-Match') == etag:
+            status = 304
+        else:
+            status = 200
+        with REQUESTS_LOCK:
+            REQUESTS.append((self.path, status))
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        if status == 200:
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if status == 200:
+            self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_fetcher(tmp, base):
+    cache = RemoteAssetCache(root=Path(tmp) / 'remote-cache', max_workers=4)
+    return ThumbnailFetcher(cache=cache, base_url=f"{base}/vi", max_workers=4)
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThumbnailHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    ids = ['AAAAAAAAAAA', 'BBBBBBBBBBB', 'CCCCCCCCCCC']
+    THUMBNAILS[f'/vi/{ids[0]}/maxresdefault.jpg'] = b'A-maxres'
+    for vid in ids:
+        THUMBNAILS[f'/vi/{vid}/hqdefault.jpg'] = f'{vid}-hq'.encode()
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        content = Path(tmp) / 'content'
+        content.mkdir()
+        (content / 'cards.md').write_text(
+            f"[video](https://www.youtube.com/watch?v={ids[0]})\n"
+            f"![](https://markdown-videos-api.jorgenkh.no/youtube/{ids[1]}?width=720)\n", encoding='utf-8')
+        (content / 'resources.ipynb').write_text(
+            '{"cells": [{"cell_type": "markdown", "source": ["https://youtu.be/' + ids[2] + '"]}]}', encoding='utf-8')
+        found = find_video_ids(content)
+        ok &= check('video ids are found in markdown and notebooks', found == ids, found)
+
+        dest = Path(tmp) / 'images'
+        store = ImageStore(root=Path(tmp) / 'store')
+        published, unchanged, missing = make_fetcher(tmp, base).publish_all(ids, dest, store=store)
+        ok &= check('first run publishes every thumbnail', (published, unchanged, missing) == (3, 0, 0), (published, unchanged, missing))
+        ok &= check('best variant is used', (dest / thumbnail_name(ids[0])).read_bytes() == b'A-maxres')
+        ok &= check('missing maxres falls back to hqdefault', (dest / thumbnail_name(ids[1])).read_bytes() == f'{ids[1]}-hq'.encode())
+        mtimes = {vid: (dest / thumbnail_name(vid)).stat().st_mtime_ns for vid in ids}
+
+        REQUESTS.clear()
+        store = ImageStore(root=Path(tmp) / 'store')
+        published, unchanged, missing = make_fetcher(tmp, base).publish_all(ids, dest, store=store)
+        ok &= check('second run leaves unchanged thumbnails alone', (published, unchanged) == (0, 3) and
+                    all((dest / thumbnail_name(v)).stat().st_mtime_ns == mtimes[v] for v in ids))
+        ok &= check('second run revalidates with conditional requests', all(status == 304 for _, status in REQUESTS), REQUESTS)
+        ok &= check('remembered variant skips known-missing sizes',
+                    (f'/vi/{ids[1]}/maxresdefault.jpg', 404) not in REQUESTS, REQUESTS)
+
+        THUMBNAILS[f'/vi/{ids[2]}/hqdefault.jpg'] = b'new bytes'
+        store = ImageStore(root=Path(tmp) / 'store')
+        published, unchanged, missing = make_fetcher(tmp, base).publish_all(ids, dest, store=store)
+        ok &= check('changed bytes are rewritten', published == 1 and (dest / thumbnail_name(ids[2])).read_bytes() == b'new bytes')
+    server.shutdown()
+    server.server_close()
+    finish(ok, 'YouTube thumbnail fetcher')
+
+
+if __name__ == '__main__':
+    main()
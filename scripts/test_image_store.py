@@ -0,0 +1,92 @@
+"""
+Test image_store.py ownership: a destination published by two builders (md: and print:) survives when
+one of them retires it and is deleted with the last owner; gc() drops owners whose page left the TOC;
+sweeps delete leftovers the store created but never hand-committed images; published files are copies, so
+in-place writes never reach the store, and gc() drops objects that no longer match their hash; old
+single-owner indexes load.
+"""
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from checks import check, finish
+from image_store import ImageStore, file_sha256
+
+
+def main():
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        src = tmp / 'content' / 'plot.png'
+        src.parent.mkdir()
+        src.write_bytes(b'plot')
+        docs = tmp / 'docs' / 'images'
+        shared = docs / 'notes_plot.png'
+        store = ImageStore(root=tmp / 'store')
+
+        store.publish(src, shared, owner='md:notes')
+        store.publish(src, shared, owner='print:notes')
+        ok &= check('both builders own a shared destination',
+                    store.refs[str(shared.resolve())]['owners'] == ['md:notes', 'print:notes'])
+        deleted = store.retire('print:notes', keep=[])
+        ok &= check('retiring one owner keeps a file another owner links to', shared.exists() and not deleted)
+        store.retire('md:notes', keep=[])
+        ok &= check('the file goes with its last owner', not shared.exists() and str(shared.resolve()) not in store.refs)
+
+        hand = docs / 'diagram.png'
+        hand.write_bytes(b'committed by hand')
+        leftover = docs / 'old_plot.png'
+        store.publish(src, leftover, owner='md:old')
+        store.publish(src, shared, owner='md:notes')
+        # A reference lost (e.g. an interrupted build) leaves a file the store created behind
+        del store.refs[str(leftover.resolve())]
+        removed, _ = store.gc(live_sources={'notes'}, sweep=[docs])
+        ok &= check('the sweep removes files the store created and no longer references', not leftover.exists(), removed)
+        ok &= check('the sweep never touches hand-committed images', hand.exists(), removed)
+        ok &= check('live destinations survive gc', shared.exists())
+
+        store.publish(src, docs / 'gone_plot.png', owner='md:gone')
+        store.publish(src, docs / 'gone_plot.png', owner='print:notes')
+        store.gc(live_sources={'notes'})
+        ok &= check('gc keeps a destination while any owner is live', (docs / 'gone_plot.png').exists())
+        store.gc(live_sources=set())
+        ok &= check('gc deletes it once every owner left the TOC', not (docs / 'gone_plot.png').exists())
+
+        store.publish(src, shared, owner='md:notes')
+        sha, obj = store.ingest(src)
+        ok &= check('published files are not hardlinks into the store', not os.path.samefile(shared, obj))
+        shared.write_bytes(b'edited in place by another writer')
+        ok &= check('an in-place write to a published file leaves the store object intact', file_sha256(obj) == sha)
+        ok &= check('the edited destination is republished',
+                    store.publish(src, shared, owner='md:notes') and shared.read_bytes() == b'plot')
+
+        os.unlink(shared)
+        os.link(obj, shared)
+        ok &= check('a hardlink left by an older store is replaced by a copy',
+                    store.publish(src, shared, owner='md:notes') and not os.path.samefile(shared, obj))
+
+        obj.write_bytes(b'corrupted')
+        shared.write_bytes(b'corrupted')
+        store.gc()
+        ok &= check('gc removes a store object whose bytes no longer match its hash', not obj.exists())
+        ok &= check('and its destinations are republished from the source',
+                    store.publish(src, shared, owner='md:notes') and shared.read_bytes() == b'plot'
+                    and file_sha256(obj) == sha)
+
+        legacy = tmp / 'legacy'
+        legacy.mkdir()
+        (legacy / 'index.json').write_text(json.dumps(
+            {'hashes': {}, 'refs': {str(shared.resolve()): {'sha': 'abc', 'owner': 'md:notes'}}}), encoding='utf-8')
+        old = ImageStore(root=legacy)
+        ok &= check('single-owner indexes are upgraded',
+                    old.refs[str(shared.resolve())]['owners'] == ['md:notes'] and str(shared.resolve()) in old.created)
+
+    finish(ok, 'image store')
+
+
+if __name__ == '__main__':
+    main()
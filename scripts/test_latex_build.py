@@ -0,0 +1,71 @@
+"""
+Test latex_build.compile_document's up-to-date check: an unchanged document is not recompiled, while an
+edited body or an edited \\includegraphics file (same .tex source) is. latexmk is replaced by a recorder
+that writes a stand-in PDF, so no TeX installation is needed.
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import artifact_cache
+import latex_build
+from artifact_cache import ArtifactCache
+from checks import check, finish
+
+RUNS = []
+
+
+def fake_latexmk(tex_path, out_dir, fmt=None, debug=False, **kwargs):
+    RUNS.append(Path(tex_path).name)
+    pdf = Path(out_dir) / (Path(tex_path).stem + '.pdf')
+    pdf.write_bytes(b'%PDF stand-in ' + str(len(RUNS)).encode())
+    return pdf
+
+
+def main():
+    ok = True
+    latex_build.run_latexmk = fake_latexmk
+    latex_build._engine_versions[latex_build.LATEX_ENGINE] = 'pdfTeX 0.0-test'
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        artifact_cache._cache = ArtifactCache(root=tmp / 'artifacts')
+        figures = tmp / 'figures'
+        figures.mkdir()
+        figure = figures / 'plot.png'
+        figure.write_bytes(b'first plot')
+        preamble = f"\\documentclass{{article}}\n\\graphicspath{{{{{figures.as_posix()}/}}}}\n"
+        body = 'Text \\includegraphics[width=0.5\\linewidth]{plot.png}'
+        latex_dir = tmp / 'latex'
+
+        def compile_once(text=body):
+            return latex_build.compile_document('notes', text, preamble, latex_dir=latex_dir)
+
+        pdf = compile_once()
+        ok &= check('the first build runs latexmk', len(RUNS) == 1 and pdf is not None and pdf.exists(), RUNS)
+        compile_once()
+        ok &= check('an unchanged document is not recompiled', len(RUNS) == 1, RUNS)
+
+        figure.write_bytes(b'edited plot')
+        compile_once()
+        ok &= check('an edited figure recompiles the document', len(RUNS) == 2, RUNS)
+        compile_once()
+        ok &= check('and is then up to date again', len(RUNS) == 2, RUNS)
+
+        compile_once(body + ' More text.')
+        ok &= check('an edited body recompiles the document', len(RUNS) == 3, RUNS)
+
+        figure.write_bytes(b'first plot')
+        compile_once()
+        ok &= check('a PDF built before comes back from the artifact cache', len(RUNS) == 3
+                    and pdf.read_bytes() == b'%PDF stand-in 1', (RUNS, pdf.read_bytes()))
+        compile_once()
+        ok &= check('a restored PDF counts as up to date', len(RUNS) == 3, RUNS)
+        artifact_cache._cache = None
+
+    finish(ok, 'LaTeX build')
+
+
+if __name__ == '__main__':
+    main()
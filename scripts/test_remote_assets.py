@@ -0,0 +1,132 @@
+"""
+Test remote_assets.py against a local HTTP stand-in server: first fetch, conditional revalidation (304),
+changed content, concurrent batches, missing assets, offline mode and which bodies are embeddable in PDFs.
+"""
+import hashlib
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from checks import check, finish
+from remote_assets import RemoteAssetCache
+
+PNG = b'\x89PNG\r\n\x1a\n tiny png'
+# Bodies served with HTTP 200 and their Content-Type: only the first three can go to pdflatex
+FORMATS = {
+    '/real.png': (PNG, 'image/png'),
+    '/photo': (b'\xff\xd8\xff\xe0 jpeg', 'image/jpeg; charset=binary'),
+    '/figure.pdf': (b'%PDF-1.5 figure', 'application/octet-stream'),
+    '/attractor.gif': (b'GIF89a animation', 'image/gif'),
+    '/drawing.svg': (b'<svg xmlns="http://www.w3.org/2000/svg"/>', 'image/svg+xml'),
+    '/error.png': (b'<html>Rate limited</html>', 'text/html'),
+    '/mislabelled.jpg': (PNG, 'image/jpeg'),
+}
+ASSETS = {}
+REQUESTS = []
+
+
+class AssetHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        data = ASSETS.get(self.path)
+        content_type = 'image/png'
+        if isinstance(data, tuple):
+            data, content_type = data
+        if data is None:
+            REQUESTS.append((self.path, 404))
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            REQUESTS.append((self.path, 304))
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        REQUESTS.append((self.path, 200))
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), AssetHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    server, base = start_server()
+    ASSETS['/fig.png'] = b'first version'
+    for i in range(8):
+        ASSETS[f'/batch/{i}.png'] = f'image {i}'.encode()
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / 'remote-cache'
+        url = f"{base}/fig.png"
+
+        cache = RemoteAssetCache(root=root)
+        path = cache.fetch(url)
+        ok &= check('first fetch downloads and stores the asset', path is not None and path.read_bytes() == b'first version')
+        ok &= check('asset is stored content-addressed', path is not None and path.stem == hashlib.sha256(b'first version').hexdigest())
+        cache.fetch(url)
+        ok &= check('a URL is fetched once per process', REQUESTS.count(('/fig.png', 200)) == 1, REQUESTS)
+        cache.save()
+
+        cache = RemoteAssetCache(root=root)
+        again = cache.fetch(url)
+        ok &= check('later builds revalidate with a conditional request', ('/fig.png', 304) in REQUESTS and again == path, REQUESTS)
+
+        ASSETS['/fig.png'] = b'second version'
+        cache = RemoteAssetCache(root=root)
+        changed = cache.fetch(url)
+        ok &= check('changed content is re-downloaded', changed is not None and changed.read_bytes() == b'second version')
+        cache.save()
+
+        missing = cache.fetch(f"{base}/missing.png")
+        ok &= check('missing assets return None', missing is None)
+
+        urls = [f"{base}/batch/{i}.png" for i in range(8)]
+        results = RemoteAssetCache(root=root, max_workers=4).fetch_all(urls + urls[:2])
+        ok &= check('fetch_all mirrors a batch concurrently', len(results) == 8 and all(p and p.exists() for p in results.values()))
+
+        server.shutdown()
+        server.server_close()
+        before = len(REQUESTS)
+        offline = RemoteAssetCache(root=root, offline=True)
+        ok &= check('offline mode serves mirrored copies', offline.fetch(url) == changed)
+        ok &= check('offline mode never touches the network', len(REQUESTS) == before)
+        ok &= check('offline mode returns None for unmirrored URLs', offline.fetch(f"{base}/never.png") is None)
+
+        fallback = RemoteAssetCache(root=root, timeout=2).fetch(url)
+        ok &= check('an unreachable server falls back to the mirrored copy', fallback == changed)
+        ok &= check('a body that is not a PNG, JPEG or PDF is not embeddable', not offline.embeddable(url))
+
+    ASSETS.update(FORMATS)
+    server, base = start_server()
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = RemoteAssetCache(root=Path(tmp) / 'remote-cache')
+        paths = cache.fetch_all([f"{base}{p}" for p in FORMATS])
+        embeddable = {urlsplit(u).path for u in paths if cache.embeddable(u)}
+        ok &= check('PNG, JPEG and PDF bodies are embeddable', {'/real.png', '/photo', '/figure.pdf'} <= embeddable, embeddable)
+        ok &= check('GIF, SVG, HTML error pages and mislabelled bodies are not',
+                    not embeddable & {'/attractor.gif', '/drawing.svg', '/error.png', '/mislabelled.jpg'}, embeddable)
+        ok &= check('embeddable copies get the suffix of their real format', paths[f"{base}/photo"].suffix == '.jpg')
+    server.shutdown()
+    server.server_close()
+    finish(ok, 'remote asset mirror')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,101 @@
-import yaml
-from jinja2 import Template
+"""
+theme_to_css.py
+
+Compiles every theme in static/themes/ into one stylesheet, static/css/theme.css.
+- main.css.template is compiled once and rendered once, with each color variable pointing at its
+  custom property (color_bg -> var(--color-bg)), so the shared rules appear a single time.
+- Each theme YAML contributes only a [data-theme="<name>"] block of --color-* custom properties.
+  The configured light and dark themes also answer to data-theme="light"/"dark" (set by the theme
+  toggle in head.html), and the default theme applies to :root before any script runs.
+- Per-theme differences must therefore be expressed through the color variables.
+- The stylesheet is only rewritten when its content changes.
+
+Usage:
+    python scripts/theme_to_css.py [<config.yml> <themes_dir> <template.css> <output_dir>]
+"""
+import re
 import sys
 from pathlib import Path
 
-def render_theme(yaml_path, template_path, output_path):
+import yaml
+from jinja2 import Environment, meta
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from output_writer import write_if_changed
+
+THEME_CSS = 'theme.css'
+_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+# "--color-bg: var(--color-bg);" left in the template's :root block once values become references
+_SELF_REFERENCE_RE = re.compile(r'^[ \t]*--([\w-]+)[ \t]*:[ \t]*var\(--\1\)[ \t]*;[ \t]*$\n?', re.M)
+_EMPTY_RULE_RE = re.compile(r'^[^{}\n]+\{\s*\}[ \t]*$\n?', re.M)
+_BLANK_LINES_RE = re.compile(r'\n[ \t]*(?=\n)')
+
+
+def custom_property(variable):
+    return '--' + variable.replace('_', '-')
+
+
+def load_theme(yaml_path):
     with open(yaml_path) as f:
         data = yaml.safe_load(f)
-    theme_name = data.get('theme', {}).get('name', 'unknown')
-    theme_label = data.get('theme', {}).get('label', theme_name)
-    theme_desc = data.get('theme', {}).get('description', '')
-    colors = data['colors']
+    theme = data.get('theme', {})
+    name = Path(yaml_path).stem
+    return {
+        'name': name,
+        'label': theme.get('label', theme.get('name', name)),
+        'description': theme.get('description', ''),
+        'colors': data['colors'],
+    }
+
+
+def render_shared(template_source, themes):
+    """The template rendered once, with every color variable replaced by var(--color-...)."""
+    env = Environment()
+    variables = meta.find_undeclared_variables(env.parse(template_source))
+    for theme in themes:
+        variables.update(theme['colors'])
+    template = env.from_string(template_source)
+    css = template.render(**{v: f'var({custom_property(v)})' for v in variables})
+    css = _COMMENT_RE.sub('', css)
+    css = _SELF_REFERENCE_RE.sub('', css)
+    css = _EMPTY_RULE_RE.sub('', css)
+    return _BLANK_LINES_RE.sub('', css).strip() + '\n'
+
+
+def theme_block(theme, selectors):
+    lines = [f"/* {theme['label']} ({theme['name']}): {theme['description']} */",
+             ', '.join(selectors) + ' {']
+    lines += [f"  {custom_property(k)}: {v};" for k, v in theme['colors'].items()]
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def compile_themes(config_path, themes_dir, template_path):
+    """The combined stylesheet for every *.yml theme in themes_dir."""
+    names = get_theme_names_from_config(config_path)
+    themes = {p.stem: load_theme(p) for p in sorted(Path(themes_dir).glob('*.yml'))}
+    for mode in ('light', 'dark'):
+        if names[mode] not in themes:
+            raise FileNotFoundError(f"{mode.capitalize()} theme YAML not found: {Path(themes_dir) / (names[mode] + '.yml')}")
+    default = names.get(names['default'], names['default'])
+    if default not in themes:
+        default = names['light']
+    aliases = {names['light']: 'light', names['dark']: 'dark'}
+
     with open(template_path) as f:
-        template = Template(f.read())
-    # Add dark_mode flag for template logic
-    css = f"""/*\nTheme: {theme_label} ({theme_name})\nDescription: {theme_desc}\n*/\n""" + template.render(**colors, dark_mode=('dark' in output_path))
-    with open(output_path, 'w') as f:
-        f.write(css)
+        source = f.read()
+    blocks = [f"/* Generated by scripts/theme_to_css.py from {Path(themes_dir).as_posix()}/*.yml; do not edit. */\n",
+              render_shared(source, list(themes.values()))]
+    # The default theme comes first so an explicit data-theme, declared later, overrides :root
+    for name in [default] + [n for n in themes if n != default]:
+        selectors = [':root'] if name == default else []
+        if name in aliases:
+            selectors.append(f'[data-theme="{aliases[name]}"]')
+        if aliases.get(name) != name:
+            selectors.append(f'[data-theme="{name}"]')
+        blocks.append(theme_block(themes[name], selectors))
+    return '\n'.join(blocks)
+
 
 def get_theme_names_from_config(config_path):
     with open(config_path) as f:
@@ -32,8 +112,6 @@ if __name__ == "__main__":
     default_themes_dir = "static/themes"
     default_output_dir = "static/css"
     default_template = "static/templates/main.css.template"
-    default_light_css = "static/css/theme-light.css"
-    default_dark_css = "static/css/theme-dark.css"
     default_bak_css = "static/css/main.css.bak"
 
     if len(sys.argv) == 1:
@@ -41,13 +119,9 @@ if __name__ == "__main__":
         themes_dir = default_themes_dir
         template_path = default_template
         output_dir = default_output_dir
-        light_css = default_light_css
-        dark_css = default_dark_css
         bak_css = default_bak_css
     elif len(sys.argv) == 5:
         config_path, themes_dir, template_path, output_dir = sys.argv[1:5]
-        light_css = str(Path(output_dir) / "theme-light.css")
-        dark_css = str(Path(output_dir) / "theme-dark.css")
         bak_css = str(Path(output_dir) / "main.css.bak")
     else:
         print("Usage: python theme_to_css.py [<config.yml> <themes_dir> <template.css> <output_dir>]")
@@ -62,23 +136,17 @@ if __name__ == "__main__":
     if Path(main_css).exists():
         shutil.copy2(main_css, bak_css)
 
-    theme_names = get_theme_names_from_config(config_path)
     # Debug info
     print(f"[DEBUG] Using config: {config_path}")
     print(f"[DEBUG] Themes dir: {themes_dir}")
     print(f"[DEBUG] Template: {template_path}")
     print(f"[DEBUG] Output dir: {output_dir}")
-    # Render light theme as theme-light.css
-    yaml_path = Path(themes_dir) / f"{theme_names['light']}.yml"
-    if not yaml_path.exists():
-        print(f"[ERROR] Light theme YAML not found: {yaml_path}", file=sys.stderr)
-        sys.exit(2)
-    render_theme(yaml_path, template_path, light_css)
-    print(f"[INFO] Rendered light theme: {yaml_path} -> {light_css}")
-    # Render dark theme as theme-dark.css
-    yaml_path_dark = Path(themes_dir) / f"{theme_names['dark']}.yml"
-    if not yaml_path_dark.exists():
-        print(f"[ERROR] Dark theme YAML not found: {yaml_path_dark}", file=sys.stderr)
+    try:
+        css = compile_themes(config_path, themes_dir, template_path)
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
         sys.exit(2)
-    render_theme(yaml_path_dark, template_path, dark_css)
-    print(f"[INFO] Rendered dark theme: {yaml_path_dark} -> {dark_css}")
+    out_path = Path(output_dir) / THEME_CSS
+    state = 'Wrote' if write_if_changed(out_path, css) else 'Unchanged'
+    count = len(list(Path(themes_dir).glob('*.yml')))
+    print(f"[INFO] {state} {out_path}: {count} themes, {len(css.encode('utf-8')) / 1024:.1f} KB")
@@ -0,0 +1,152 @@
+"""
+site_tree.py
+
+Indexed, read-only model of the toc tree in _content.yml, built once and queried by the builders and
+converters instead of re-walking the raw dicts.
+- SiteNode uses __slots__ and is immutable once the tree is built. Each node has a parent pointer,
+  a children tuple, its depth-first position, its breadcrumbs (ancestors, outermost first) and the
+  previous/next page (nodes with a file, in depth-first order).
+- SiteTree keeps the nodes in depth-first order plus dict indexes file -> node, slug -> node and
+  title (case-insensitive) -> node. When a key occurs more than once, the first node in depth-first
+  order wins (like the linear walks it replaces).
+- slugify() is memoized; a node's slug and output page name (html) are computed once.
+
+Usage:
+    from site_tree import load_site_tree
+    tree = load_site_tree('_content.yml')      # loaded and validated once per process
+    node = tree.by_file['content/intro.md']
+    node.prev, node.next, node.breadcrumbs
+    tree.files()                               # all files, depth-first
+"""
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+
+
+@lru_cache(maxsize=None)
+def slugify(title):
+    """Lowercase, replace whitespace with hyphens, drop everything but [a-z0-9-]."""
+    slug = title.lower().strip()
+    slug = re.sub(r'\s+', '-', slug)
+    slug = re.sub(r'[^a-z0-9\-]', '', slug)
+    return slug
+
+
+_set = object.__setattr__
+
+
+class SiteNode:
+    __slots__ = ('title', 'file', 'stem', 'slug', 'html', 'menu', 'description', 'data', 'index', 'depth',
+                 'parent', 'children', 'breadcrumbs', 'first_file', 'prev', 'next')
+
+    def __init__(self, data, index, depth, parent):
+        title = data.get('title', '') or ''
+        file = data.get('file')
+        slug = slugify(title)
+        for name, value in (
+            ('title', title),
+            ('file', file),
+            # Path without extension, as used by Jupyter Book's _toc.yml
+            ('stem', Path(file).with_suffix('').as_posix() if file else None),
+            ('slug', slug),
+            # Output page: <basename>.html for files, <slug>.html for auto-generated group indexes
+            ('html', os.path.splitext(os.path.basename(file))[0] + '.html' if file else slug + '.html'),
+            ('menu', bool(data.get('menu', False))),
+            ('description', data.get('description')),
+            ('data', data),
+            ('index', index),
+            ('depth', depth),
+            ('parent', parent),
+            ('children', ()),
+            ('breadcrumbs', parent.breadcrumbs + (parent,) if parent else ()),
+            ('first_file', file),
+            ('prev', None),
+            ('next', None),
+        ):
+            _set(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"SiteNode is read-only (cannot set {name!r})")
+
+    def __repr__(self):
+        return f"SiteNode({self.title!r}, file={self.file!r}, depth={self.depth})"
+
+
+class SiteTree:
+    __slots__ = ('roots', 'nodes', 'pages', 'by_file', 'by_slug', 'by_title')
+
+    def __init__(self, toc):
+        nodes = []
+
+        def build(items, depth, parent):
+            built = []
+            for item in items or []:
+                if not isinstance(item, dict):
+                    continue
+                node = SiteNode(item, len(nodes), depth, parent)
+                nodes.append(node)
+                children = build(item.get('children'), depth + 1, node)
+                _set(node, 'children', children)
+                if node.first_file is None:
+                    _set(node, 'first_file', next((c.first_file for c in children if c.first_file), None))
+                built.append(node)
+            return tuple(built)
+
+        self.roots = build(toc, 0, None)
+        self.nodes = tuple(nodes)
+        self.pages = tuple(n for n in nodes if n.file)
+        for prev, node in zip(self.pages, self.pages[1:]):
+            _set(node, 'prev', prev)
+            _set(prev, 'next', node)
+        self.by_file, self.by_slug, self.by_title = {}, {}, {}
+        for node in nodes:
+            if node.file:
+                self.by_file.setdefault(node.file, node)
+            self.by_slug.setdefault(node.slug, node)
+            self.by_title.setdefault(node.title.lower(), node)
+
+    @classmethod
+    def from_content(cls, content):
+        return cls(content.get('toc', []))
+
+    def files(self):
+        """Every file in the toc, depth-first (duplicates included)."""
+        return [n.file for n in self.pages]
+
+    def group(self, title):
+        """First node (depth-first) whose title matches case-insensitively, or None."""
+        return self.by_title.get(title.lower())
+
+    def menu_items(self):
+        """Top-level nodes with menu: true."""
+        return [n for n in self.roots if n.menu]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+
+_trees = {}
+_last_content = (None, None)
+
+
+def load_site_tree(path='_content.yml'):
+    """The SiteTree of a validated _content.yml, cached per process until the file changes."""
+    from content_parser import load_and_validate_content_yml
+    key = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _trees.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = _trees[key] = (mtime, site_tree_for(load_and_validate_content_yml(path)))
+    return cached[1]
+
+
+def site_tree_for(content):
+    """The SiteTree of an already loaded content dict, built once per dict."""
+    global _last_content
+    if _last_content[0] is not content:
+        _last_content = (content, SiteTree.from_content(content))
+    return _last_content[1]
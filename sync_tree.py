@@ -0,0 +1,140 @@
+"""
+sync_tree.py
+
+rsync-style synchronizer for build output trees (e.g. _build/html -> docs/jupyter-book).
+- Files are compared by size and mtime first; when those differ, by SHA-256, so a rebuild that
+  rewrites identical bytes copies nothing.
+- The new tree is staged next to the destination: unchanged files are hardlinked from the current
+  destination (keeping their mtimes), changed files are copied from the source in a thread pool, and
+  files that no longer exist in the source are simply left out.
+- The staged tree then replaces the destination with two renames, so the published site is never
+  half-deleted or half-copied. When nothing changed the destination is not touched at all.
+- Reports files and bytes copied versus skipped, and orphans deleted.
+
+Usage:
+    python sync_tree.py _build/html docs/jupyter-book [--jobs N] [--debug]
+"""
+import argparse
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from image_store import file_sha256, link_or_copy
+
+
+def list_files(root):
+    """Map of relative path -> os.stat_result for every regular file under root."""
+    files = {}
+    root = str(root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            files[os.path.relpath(path, root)] = st
+    return files
+
+
+def same_file(src, src_st, dest, dest_st):
+    """True if dest already holds src's bytes: equal size and mtime, or equal size and hash."""
+    if dest_st is None or src_st.st_size != dest_st.st_size:
+        return False
+    if src_st.st_mtime_ns == dest_st.st_mtime_ns:
+        return True
+    if file_sha256(src) != file_sha256(dest):
+        return False
+    # Identical bytes: adopt the source mtime so the next sync takes the fast path
+    os.utime(dest, ns=(dest_st.st_atime_ns, src_st.st_mtime_ns))
+    return True
+
+
+def _staging_dirs(dest):
+    return (dest.with_name(f".{dest.name}.sync-new"), dest.with_name(f".{dest.name}.sync-old"))
+
+
+def sync_tree(src, dest, jobs=None, debug=False):
+    """
+    Make dest an exact copy of src, copying only changed files and swapping the result in atomically.
+    Returns a dict of counts: copied, skipped, deleted, bytes_copied, bytes_skipped.
+    """
+    src = Path(src)
+    dest = Path(dest)
+    staging, retired = _staging_dirs(dest)
+    for leftover in (staging, retired):
+        if leftover.exists():
+            shutil.rmtree(leftover)
+
+    src_files = list_files(src)
+    dest_files = list_files(dest) if dest.is_dir() else {}
+    orphans = [rel for rel in dest_files if rel not in src_files]
+    counts = {'copied': 0, 'skipped': 0, 'deleted': len(orphans), 'bytes_copied': 0, 'bytes_skipped': 0}
+
+    def compare(rel):
+        return rel, same_file(src / rel, src_files[rel], dest / rel, dest_files.get(rel))
+
+    workers = jobs or min(16, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        unchanged = dict(pool.map(compare, sorted(src_files)))
+    changed = [rel for rel, same in unchanged.items() if not same]
+    for rel, same in unchanged.items():
+        if same:
+            counts['skipped'] += 1
+            counts['bytes_skipped'] += src_files[rel].st_size
+        else:
+            counts['copied'] += 1
+            counts['bytes_copied'] += src_files[rel].st_size
+
+    if not changed and not orphans and dest.is_dir():
+        print(f"[OK] {dest} is up to date ({counts['skipped']} files, {counts['bytes_skipped'] / 1e6:.1f} MB)")
+        return counts
+
+    # Stage the new tree: directories first, then links for unchanged files and copies for changed ones
+    for dirpath, dirnames, _ in os.walk(src):
+        rel_dir = os.path.relpath(dirpath, src)
+        (staging / rel_dir).mkdir(parents=True, exist_ok=True)
+
+    def stage(rel):
+        if unchanged[rel]:
+            link_or_copy(dest / rel, staging / rel)
+        else:
+            shutil.copy2(src / rel, staging / rel)
+            if debug:
+                print(f"[INFO] Copied {rel}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(stage, sorted(src_files)))
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if debug:
+        for rel in orphans:
+            print(f"[INFO] Deleted {rel}")
+
+    # Swap: the destination is missing only between the two renames
+    if dest.exists():
+        os.replace(dest, retired)
+    os.replace(staging, dest)
+    shutil.rmtree(retired, ignore_errors=True)
+    print(f"[OK] Synced {src} -> {dest}: {counts['copied']} copied ({counts['bytes_copied'] / 1e6:.1f} MB), "
+          f"{counts['skipped']} unchanged ({counts['bytes_skipped'] / 1e6:.1f} MB), {counts['deleted']} deleted")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synchronize a build output tree into a published directory.")
+    parser.add_argument('src', help='Source directory (e.g. _build/html)')
+    parser.add_argument('dest', help='Destination directory (e.g. docs/jupyter-book)')
+    parser.add_argument('--jobs', type=int, default=None, help='Concurrent compare/copy workers')
+    parser.add_argument('--debug', action='store_true', help='List every copied and deleted file')
+    args = parser.parse_args()
+    if not os.path.isdir(args.src):
+        print(f"[ERROR] Source directory {args.src} does not exist.")
+        sys.exit(1)
+    sync_tree(args.src, args.dest, jobs=args.jobs, debug=args.debug)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,14 @@
-import yaml, sys
+import os, yaml, sys
 
-toc = yaml.safe_load(open('_toc.yml'))
-def check_toc(toc):
+def toc_duplicates(toc):
+    """(files, duplicates) for the chapter/section entries of a loaded _toc.yml."""
     files = set()
+    duplicates = []
     def walk(node):
         if isinstance(node, dict):
             if 'file' in node:
                 if node['file'] in files:
-                    print(f"[ERROR] Duplicate file: {node['file']}")
-                    sys.exit(1)
+                    duplicates.append(node['file'])
                 files.add(node['file'])
             for k in ('chapters', 'sections'):
                 if k in node:
@@ -16,5 +16,43 @@ def check_toc(toc):
         elif isinstance(node, list):
             for c in node: walk(c)
     walk(toc.get('chapters', []))
+    return files, duplicates
+
+def check_toc(toc):
+    files, duplicates = toc_duplicates(toc)
+    if duplicates:
+        print(f"[ERROR] Duplicate file: {duplicates[0]}")
+        sys.exit(1)
     print("[OK] No duplicate files in TOC.")
-check_toc(toc)
+    return files
+
+def toc_notebook_errors(files, index=None):
+    """
+    Unreadable notebooks among the toc files, as [(key, error)], using the cached notebook index
+    (index: an already loaded NotebookIndex to reuse). Warns about entries with no source file.
+    """
+    from notebook_index import load_index
+    notebooks = [f + '.ipynb' for f in files if os.path.exists(f + '.ipynb')]
+    missing = [f for f in files if not any(os.path.exists(f + ext) for ext in ('.ipynb', '.md'))]
+    for f in missing:
+        print(f"[WARN] TOC entry has no .ipynb or .md source: {f}")
+    index = load_index(files=notebooks, index=index)
+    broken = [(key, entry['error']) for key, entry in index.items(notebooks) if entry and 'error' in entry]
+    for key, error in broken:
+        print(f"[ERROR] Unreadable notebook in TOC: {key}: {error}")
+    if not broken:
+        print(f"[OK] {len(notebooks)} TOC notebooks are readable.")
+    return broken
+
+def check_toc_notebooks(files):
+    """Fail on TOC notebooks that are not valid JSON, using the cached notebook index."""
+    if toc_notebook_errors(files):
+        sys.exit(1)
+
+def toc_all_files(toc, files):
+    return sorted(files) + ([toc['root']] if toc.get('root') else [])
+
+if __name__ == '__main__':
+    toc = yaml.safe_load(open('_toc.yml'))
+    files = check_toc(toc)
+    check_toc_notebooks(toc_all_files(toc, files))
@@ -1,8 +1,21 @@
 import yaml, sys
-for fname in ['_toc.yml', '_config.yml']:
-    try:
-        with open(fname) as f: yaml.safe_load(f)
-        print(f"[OK] {fname} is valid YAML.")
-    except Exception as e:
-        print(f"[ERROR] {fname} is invalid YAML: {e}")
-        sys.exit(1)
+
+def validate_yaml_files(fnames):
+    """Parse each YAML file; returns {fname: parsed data} or raises on the first invalid file."""
+    data = {}
+    for fname in fnames:
+        with open(fname) as f:
+            data[fname] = yaml.safe_load(f)
+    return data
+
+def main():
+    for fname in ['_toc.yml', '_config.yml']:
+        try:
+            validate_yaml_files([fname])
+            print(f"[OK] {fname} is valid YAML.")
+        except Exception as e:
+            print(f"[ERROR] {fname} is invalid YAML: {e}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()